@@ -17,7 +17,18 @@
 import os
 from src import code_dom
 from src import c_lexer
+from src import disk_cache
+from src import layout
+from src import modifier_visitor
+from src import preprocessor_conditions
 import argparse
+import concurrent.futures
+import hashlib
+import io
+import pickle
+import shlex
+import shutil
+import time
 import sys
 import traceback
 from src.modifiers import *
@@ -36,11 +47,25 @@ def insert_single_template(dest_file, template_file, expansions):
                                                  "file name.")
         sys.exit(2)
 
-    with open(template_file, "r") as src_file:
-        for line in src_file.readlines():
-            for before, after in expansions.items():
-                line = line.replace(before, after)
-            dest_file.write(line)
+    for line in load_template_file(template_file):
+        for before, after in expansions.items():
+            line = line.replace(before, after)
+        dest_file.write(line)
+
+
+# Template file contents (as lists of lines) that have been loaded already, indexed by filename
+loaded_template_files = {}
+
+
+# Load the lines of a template file, reusing the previously loaded contents if the file has been used before
+# (so that batch conversions only need to read each template once)
+def load_template_file(template_file):
+    lines = loaded_template_files.get(template_file)
+    if lines is None:
+        with open(template_file, "r") as src_file:
+            lines = src_file.readlines()
+        loaded_template_files[template_file] = lines
+    return lines
 
 
 # Insert the contents of the appropriate header template file(s)
@@ -56,12 +81,52 @@ def insert_header_templates(dest_file, template_dir, src_file_name, dest_file_ex
                            expansions)
 
 
-def parse_single_header(src_file, context):
-    print("Parsing " + src_file)
-
+# Parse a single header file, returning the resulting DOMHeaderFile
+# If dom_cache is supplied, then that will be checked for a previously parsed version of the same file, and the result
+# stored there if no such version exists
+def parse_single_header(src_file, context, dom_cache=None):
     with open(src_file, "r") as f:
         file_content = f.read()
 
+    source_filename = os.path.split(src_file)[1]
+
+    # Parsing may attach a leading comment in this file to the last element of the previous one, in which case the
+    # result depends on more than just the file itself and we can't use the cache
+    if (dom_cache is not None) and \
+            ((context.last_element is None) or
+             isinstance(context.last_element, (code_dom.DOMComment, code_dom.DOMBlankLines))):
+        hasher = hashlib.sha256()
+        hasher.update(disk_cache.get_generator_fingerprint().encode('utf-8'))
+        hasher.update(source_filename.encode('utf-8'))
+        hasher.update(file_content.encode('utf-8'))
+        cache_key = "dom-" + hasher.hexdigest()
+
+        cached_data = dom_cache.get(cache_key)
+        if cached_data is not None:
+            try:
+                dom_element, last_element = pickle.loads(cached_data)
+                print("Parsing " + src_file + " (cached)")
+                context.last_element = last_element
+                return dom_element
+            except Exception:
+                dom_cache.remove(cache_key)  # Corrupt or otherwise unusable entry
+
+        dom_element = parse_single_header_content(src_file, source_filename, file_content, context)
+
+        # The last element (which may get comments attached in the next file) needs to be stored along with the DOM,
+        # but if it isn't actually part of this file then the result isn't self-contained enough to cache
+        if (context.last_element is None) or context.last_element.is_descendant_of(dom_element):
+            dom_cache.put(cache_key, pickle.dumps((dom_element, context.last_element), pickle.HIGHEST_PROTOCOL))
+
+        return dom_element
+
+    return parse_single_header_content(src_file, source_filename, file_content, context)
+
+
+# Parse the contents of a header file, returning the resulting DOMHeaderFile
+def parse_single_header_content(src_file, source_filename, file_content, context):
+    print("Parsing " + src_file)
+
     # Tokenize file and then convert into a DOM
 
     stream = c_lexer.tokenize(file_content)
@@ -74,25 +139,38 @@ def parse_single_header(src_file, context):
             print(tok)
         return
 
-    return code_dom.DOMHeaderFile.parse(context, stream, os.path.split(src_file)[1])
+    dom_element = code_dom.DOMHeaderFile.parse(context, stream, source_filename)
+
+    if context.use_parse_memo:
+        print("Parse memo: " + str(stream.parse_memo_hits) + " hits, " + str(stream.parse_memo_misses) + " misses")
+
+    return dom_element
 
 
 # Parse the C++ header found in src_file, and write a C header to dest_file_no_ext.h, with binding implementation in
 # dest_file_no_ext.cpp. Metadata will be written to dest_file_no_ext.json. implementation_header should point to a file
 # containing the initial header block for the implementation (provided in the templates/ directory).
+# If dom_cache is supplied, it is used to cache the parsed DOMs of the source files between runs.
+# If use_parse_memo is set, sub-parse results are memoised (see parse_memoized()) and the memo statistics reported.
+# Output files are only written if their contents have changed. Returns a dictionary mapping output file extensions to
+# the generated contents.
 def convert_header(src_file, config_include_files, dest_file_no_ext, template_dir, nostructbyvaluearguments, is_backend,
-                   imgui_include_dir):
+                   imgui_include_dir, defines, undefines, dom_cache=None, use_parse_memo=False):
+
+    # Start with empty preprocessor condition tables, so nothing carries over from any previous conversion in a batch
+    preprocessor_conditions.reset()
 
     # Set up context and DOM root
     context = code_dom.ParseContext()
+    context.use_parse_memo = use_parse_memo
     dom_root = code_dom.DOMHeaderFileSet()
 
     # Parse any configuration include files and add them to the DOM
     for include_file in config_include_files:
-        dom_root.add_child(parse_single_header(include_file, context))
+        dom_root.add_child(parse_single_header(include_file, context, dom_cache))
 
     # Parse and add the main header
-    main_src_root = parse_single_header(src_file, context)
+    main_src_root = parse_single_header(src_file, context, dom_cache)
     dom_root.add_child(main_src_root)
 
     # Assign a destination filename based on the output file
@@ -110,6 +188,11 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
 
     # Apply modifiers
 
+    # Flatten any conditionals whose outcome is known from the symbols given on the command line first, so that
+    # later modifiers don't have to process code that will never be compiled
+    if (len(defines) > 0) or (len(undefines) > 0):
+        mod_evaluate_conditionals.apply(dom_root, defines, undefines)
+
     # Add headers we need and remove those we don't
     if not is_backend:
         mod_add_includes.apply(dom_root, ["<stdbool.h>"])  # We need stdbool.h to get bool defined
@@ -125,8 +208,12 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
         mod_add_forward_declarations.apply(dom_root, ["struct ImDrawData;"])
 
     mod_attach_preceding_comments.apply(dom_root)
-    mod_remove_function_bodies.apply(dom_root)
-    mod_assign_anonymous_type_names.apply(dom_root)
+    # Modifiers that only look at individual elements are applied in a single traversal where they are adjacent
+    # (see modifier_visitor for the rules on what can be combined like this)
+    visitor = modifier_visitor.ModifierVisitor()
+    mod_remove_function_bodies.register(visitor)
+    mod_assign_anonymous_type_names.register(visitor)
+    visitor.apply(dom_root)
     # Remove ImGuiOnceUponAFrame for now as it needs custom fiddling to make it usable from C
     # Remove ImNewDummy/ImNewWrapper as it's a helper for C++ new (and C dislikes empty structs)
     mod_remove_structs.apply(dom_root, ["ImGuiOnceUponAFrame",
@@ -135,10 +222,7 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
                                         # Templated stuff in imgui_internal.h
                                         "ImBitArray",
                                         "ImBitVector",
-                                        "ImSpan",
                                         "ImSpanAllocator",
-                                        "ImPool",
-                                        "ImChunkStream",
                                         "ImGuiTextIndex"])
     # Remove all functions from ImVector, as they're not really useful
     mod_remove_all_functions_from_classes.apply(dom_root, ["ImVector"])
@@ -191,9 +275,11 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
                                    "(ImVector_Construct()/ImVector_Destruct() can be used to safely "
                                    "construct out_ranges)")
 
-    mod_remove_operators.apply(dom_root)
-    mod_remove_heap_constructors_and_destructors.apply(dom_root)
-    mod_convert_references_to_pointers.apply(dom_root)
+    visitor = modifier_visitor.ModifierVisitor()
+    mod_remove_operators.register(visitor)
+    mod_remove_heap_constructors_and_destructors.register(visitor)
+    mod_convert_references_to_pointers.register(visitor)
+    visitor.apply(dom_root)
     if nostructbyvaluearguments:
         mod_convert_by_value_struct_args_to_pointers.apply(dom_root)
     # Assume IM_VEC2_CLASS_EXTRA and IM_VEC4_CLASS_EXTRA are never defined as they are likely to just cause problems
@@ -208,9 +294,11 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
     mod_mark_by_value_structs.apply(dom_root, by_value_structs=['ImVec2', 'ImVec4', 'ImColor', 'ImStr'])
     mod_mark_internal_members.apply(dom_root)
     mod_flatten_class_functions.apply(dom_root)
-    mod_remove_nested_typedefs.apply(dom_root)
-    mod_remove_static_fields.apply(dom_root)
-    mod_remove_constexpr.apply(dom_root)
+    visitor = modifier_visitor.ModifierVisitor()
+    mod_remove_nested_typedefs.register(visitor)
+    mod_remove_static_fields.register(visitor)
+    mod_remove_constexpr.register(visitor)
+    visitor.apply(dom_root)
     mod_generate_imstr_helpers.apply(dom_root)
     mod_remove_enum_forward_declarations.apply(dom_root)
     mod_calculate_enum_values.apply(dom_root)
@@ -392,10 +480,9 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
     mod_remove_empty_conditionals.apply(dom_root)
     mod_merge_blank_lines.apply(dom_root)
     mod_remove_blank_lines.apply(dom_root)
-    mod_align_enum_values.apply(dom_root)
-    mod_align_function_names.apply(dom_root)
-    mod_align_structure_field_names.apply(dom_root)
-    mod_align_comments.apply(dom_root)
+    # Align enum values, function names, structure field names and comments (these are all done in one pass, as the
+    # comment alignment depends on the widths of the lines the others produce)
+    layout.apply_alignment(dom_root)
 
     # Exclude some defines that aren't really useful from the metadata
     mod_exclude_defines_from_metadata.apply(dom_root, [
@@ -418,8 +505,6 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
     # Get just the name portion of the source file, to use as the template name
     src_file_name_only = os.path.splitext(os.path.basename(src_file))[0]
 
-    print("Writing output to " + dest_file_no_ext + "[.h/.cpp/.json]")
-
     dest_file_name_only = os.path.basename(dest_file_no_ext)
 
     # If our output name ends with _internal, then generate a version of it without that on the assumption that
@@ -434,15 +519,21 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
                   "%OUTPUT_HEADER_NAME%": dest_file_name_only + ".h",
                   "%OUTPUT_HEADER_NAME_NO_INTERNAL%": dest_file_name_only_no_internal + ".h"}
 
-    with open(dest_file_no_ext + ".h", "w") as file:
+    # Outputs are generated in memory first, and then only written to disk if they differ from the existing files
+
+    outputs = {}
+
+    with io.StringIO() as file:
         insert_header_templates(file, template_dir, src_file_name_only, ".h", expansions)
 
         write_context = code_dom.WriteContext()
         write_context.for_c = True
         main_src_root.write_to_c(file, context=write_context)
 
+        outputs[".h"] = encode_output_text(file.getvalue())
+
     # Generate implementations
-    with open(dest_file_no_ext + ".cpp", "w") as file:
+    with io.StringIO() as file:
         insert_header_templates(file, template_dir, src_file_name_only, ".cpp", expansions)
 
         gen_struct_converters.generate(main_src_root, file, indent=0)
@@ -450,11 +541,276 @@ def convert_header(src_file, config_include_files, dest_file_no_ext, template_di
         gen_function_stubs.generate(main_src_root, file, indent=0,
                                     custom_varargs_list_suffixes=custom_varargs_list_suffixes)
 
+        outputs[".cpp"] = encode_output_text(file.getvalue())
+
     # Generate metadata
-    with open(dest_file_no_ext + ".json", "w") as file:
+    with io.StringIO() as file:
         # We intentionally generate JSON starting from the root here so that we include defines from imconfig.h
         gen_metadata.generate(dom_root, file)
 
+        outputs[".json"] = encode_output_text(file.getvalue())
+
+    write_output_files(dest_file_no_ext, outputs)
+
+    return outputs
+
+
+# Extensions of the files written by convert_header()
+output_file_extensions = [".h", ".cpp", ".json"]
+
+
+# Convert generated text into the bytes that should be written to an output file
+# This uses the same encoding and newline conventions as writing to a file opened in text mode would
+def encode_output_text(text):
+    buffer = io.BytesIO()
+    wrapper = io.TextIOWrapper(buffer)
+    wrapper.write(text)
+    wrapper.flush()
+    return buffer.getvalue()
+
+
+# Write data (bytes) to the file given, unless the file already contains exactly that data
+# The new contents are written to a temporary file which is then renamed over the original, so the file is never left
+# partially written
+# Returns True if the file was written
+def write_file_if_changed(filename, data):
+    try:
+        with open(filename, "rb") as file:
+            if file.read() == data:
+                return False
+    except OSError:
+        pass  # Doesn't exist or isn't readable, so we need to write it
+
+    temp_filename = filename + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temp_filename, "wb") as file:
+            file.write(data)
+        # Keep the permissions of any existing file, as replacing it would otherwise reset them to the defaults
+        if os.path.exists(filename):
+            shutil.copymode(filename, temp_filename)
+        os.replace(temp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(temp_filename)
+        except OSError:
+            pass  # Never created, or can't be removed - either way the original error is the one to report
+        raise
+    return True
+
+
+# Write the output files (given as a dictionary of extension to contents) for dest_file_no_ext, skipping any that are
+# unchanged, and print a summary of what changed
+def write_output_files(dest_file_no_ext, outputs):
+    print("Writing output to " + dest_file_no_ext + "[.h/.cpp/.json]")
+
+    changed_files = []
+    for extension in output_file_extensions:
+        filename = dest_file_no_ext + extension
+        if write_file_if_changed(filename, outputs[extension]):
+            changed_files.append(os.path.basename(filename))
+
+    if len(changed_files) > 0:
+        print("Changed output files: " + ", ".join(changed_files))
+    else:
+        print("No output files changed")
+
+
+# Get the list of template files insert_header_templates() will read when converting src_file
+def get_template_files(template_dir, src_file):
+    src_file_name_only = os.path.splitext(os.path.basename(src_file))[0]
+    template_files = []
+    for dest_file_ext in [".h", ".cpp"]:
+        template_files.append(os.path.join(template_dir, "common-header-template" + dest_file_ext))
+        template_files.append(os.path.join(template_dir, src_file_name_only + "-header-template" + dest_file_ext))
+    return template_files
+
+
+# Get the list of all input files convert_header() will read (not including Dear Bindings' own source)
+def get_input_files(src_file, config_include_files, template_dir):
+    return [src_file] + config_include_files + get_template_files(template_dir, src_file)
+
+
+# Escape a filename for use in a Make-style dependency file
+def escape_depfile_filename(filename):
+    return filename.replace('\\', '/').replace(' ', '\\ ').replace('#', '\\#').replace('$', '$$')
+
+
+# Write a Make-style dependency file (as understood by Make and Ninja) declaring that the targets given depend on
+# everything that was read when converting src_file
+def write_depfile(depfile, targets, src_file, config_include_files, template_dir):
+    dependencies = [os.path.realpath(input_file)
+                    for input_file in get_input_files(src_file, config_include_files, template_dir)]
+    dependencies += disk_cache.get_generator_source_files()
+
+    lines = [" ".join(escape_depfile_filename(target) for target in targets) + ": \\"]
+    for dependency in dependencies[:-1]:
+        lines.append("  " + escape_depfile_filename(dependency) + " \\")
+    lines.append("  " + escape_depfile_filename(dependencies[-1]))
+
+    write_file_if_changed(depfile, encode_output_text("\n".join(lines) + "\n"))
+
+
+# Get the key identifying the output convert_header() would produce for the given parameters in the output cache,
+# or None if the output can't be cached
+# This covers the contents of every file read in the process (the source header, config includes, templates and
+# Dear Bindings itself), along with the names of the files and options that affect the output
+def get_output_cache_key(src_file, config_include_files, dest_file_no_ext, template_dir, nostructbyvaluearguments,
+                         is_backend, imgui_include_dir, defines, undefines):
+    hasher = hashlib.sha256()
+    hasher.update(disk_cache.get_generator_fingerprint().encode('utf-8'))
+    hasher.update(repr((os.path.basename(dest_file_no_ext), nostructbyvaluearguments, is_backend,
+                        imgui_include_dir, sorted(defines.items()), sorted(undefines))).encode('utf-8'))
+    for input_file in get_input_files(src_file, config_include_files, template_dir):
+        try:
+            with open(input_file, "rb") as f:
+                file_content = f.read()
+        except OSError:
+            return None  # Let the conversion itself deal with (and report) any missing files
+        hasher.update(os.path.basename(input_file).encode('utf-8'))
+        hasher.update(hashlib.sha256(file_content).digest())
+    return "output-" + hasher.hexdigest()
+
+
+# Run convert_header(), using cache to retrieve the previously generated output for identical inputs if possible
+# (and to store the generated output if not)
+# The cache is also passed on to convert_header() to cache the parsed DOMs
+def convert_header_with_cache(src_file, config_include_files, dest_file_no_ext, template_dir, nostructbyvaluearguments,
+                              is_backend, imgui_include_dir, defines, undefines, cache, use_parse_memo=False):
+    cache_key = None
+    if cache is not None:
+        cache_key = get_output_cache_key(src_file, config_include_files, dest_file_no_ext, template_dir,
+                                         nostructbyvaluearguments, is_backend, imgui_include_dir, defines,
+                                         undefines)
+
+    if cache_key is not None:
+        cached_data = cache.get(cache_key)
+        if cached_data is not None:
+            try:
+                cached_outputs = pickle.loads(cached_data)
+            except Exception:
+                cached_outputs = None
+                cache.remove(cache_key)  # Corrupt or otherwise unusable entry
+            if cached_outputs is not None:
+                print("Using cached output")
+                write_output_files(dest_file_no_ext, cached_outputs)
+                return
+
+    outputs = convert_header(src_file, config_include_files, dest_file_no_ext, template_dir, nostructbyvaluearguments,
+                             is_backend, imgui_include_dir, defines, undefines, cache, use_parse_memo)
+
+    if cache_key is not None:
+        cache.put(cache_key, pickle.dumps(outputs, pickle.HIGHEST_PROTOCOL))
+
+
+# Convert a list of -D arguments (in the form NAME or NAME=VALUE) into a dictionary mapping names to values
+# As with a C compiler, symbols defined without a value are given the value 1
+def parse_define_arguments(define_args):
+    defines = {}
+    for define_arg in define_args:
+        name, separator, value = define_arg.partition('=')
+        defines[name.strip()] = value.strip() if separator else "1"
+    return defines
+
+
+# Run a single conversion job, as described by a set of parsed command-line arguments
+def run_job(args, cache):
+    config_include_files = []
+
+    # Add imconfig.h to the include list to get any #defines set in that
+    config_include_files.append(os.path.join(os.path.dirname(os.path.realpath(args.src)), "imconfig.h"))
+
+    # Add any user-supplied config file as well
+    if args.config_include is not None:
+        config_include_files.append(os.path.realpath(args.config_include))
+
+    convert_header_with_cache(os.path.realpath(args.src), config_include_files, args.output, args.templatedir,
+                              args.nopassingstructsbyvalue, args.backend, args.imgui_include_dir,
+                              parse_define_arguments(args.define), args.undefine, cache, args.parse_memo)
+
+    if args.stamp is not None:
+        with open(args.stamp, "w"):
+            pass  # Opening the file for writing is sufficient to update its modification time
+
+    if args.depfile is not None:
+        if args.stamp is not None:
+            depfile_targets = [args.stamp]
+        else:
+            depfile_targets = [args.output + extension for extension in output_file_extensions]
+            # The output files are only written if they changed, so without this the build system would consider them
+            # out of date forever after any input change that doesn't affect the output
+            for target in depfile_targets:
+                os.utime(target)
+        write_depfile(args.depfile, depfile_targets, os.path.realpath(args.src), config_include_files,
+                      args.templatedir)
+
+
+# Create the cache to use for the given (parsed) command-line arguments, or None if caching is disabled
+# If for_batch is set, then parsed headers and output are also cached in memory, so that jobs in a batch can share
+# them even if the on-disk cache is disabled (the memory used for this is capped at the same size as the disk cache)
+def create_cache(args, for_batch):
+    cache = None
+    max_size = args.cache_max_size * 1024 * 1024
+    if not args.no_cache:
+        cache = disk_cache.DiskCache(args.cache_dir, max_size)
+    if for_batch:
+        cache = disk_cache.MemoryCache(max_size, cache)
+    return cache
+
+
+# Run a job as part of a batch, returning a tuple of (succeeded, time taken in seconds)
+def run_batch_job(job_index, job_args, cache):
+    print("Job " + str(job_index + 1) + ": " + job_args.src + " -> " + job_args.output)
+    start_time = time.perf_counter()
+    succeeded = True
+    try:
+        run_job(job_args, cache)
+    except:  # noqa - suppress warning about broad exception clause as it's intentionally broad
+        print("Exception during conversion:")
+        traceback.print_exc()
+        succeeded = False
+    job_time = time.perf_counter() - start_time
+    print("Job " + str(job_index + 1) + (" completed" if succeeded else " failed") + " in %.2fs" % job_time)
+    return succeeded, job_time
+
+
+# The cache used by jobs run in a worker process (created on first use)
+worker_process_cache = None
+
+
+# Run a batch job in a worker process
+def run_batch_job_in_worker(job_index, job_args, cache_args):
+    global worker_process_cache
+    if worker_process_cache is None:
+        worker_process_cache = create_cache(cache_args, for_batch=True)
+    return run_batch_job(job_index, job_args, worker_process_cache)
+
+
+# Run a set of jobs (each of which is a set of parsed command-line arguments), optionally using a pool of worker
+# processes, and report how long each took
+# Returns True if all the jobs succeeded
+def run_batch(jobs, args):
+    start_time = time.perf_counter()
+
+    if args.processes > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.processes) as executor:
+            futures = [executor.submit(run_batch_job_in_worker, job_index, job_args, args)
+                       for job_index, job_args in enumerate(jobs)]
+            results = [future.result() for future in futures]
+    else:
+        cache = create_cache(args, for_batch=True)
+        results = [run_batch_job(job_index, job_args, cache) for job_index, job_args in enumerate(jobs)]
+
+    total_time = time.perf_counter() - start_time
+
+    print("Batch summary:")
+    for job_index, (job_args, (succeeded, job_time)) in enumerate(zip(jobs, results)):
+        print("  Job " + str(job_index + 1) + ": " + job_args.output + " - " + ("OK" if succeeded else "FAILED") +
+              " (%.2fs)" % job_time)
+    num_failed = sum(1 for succeeded, _ in results if not succeeded)
+    print(str(len(jobs)) + " jobs (" + str(num_failed) + " failed) completed in %.2fs" % total_time)
+
+    return num_failed == 0
+
 
 if __name__ == '__main__':
     # Parse the C++ header found in src_file, and write a C header to dest_file_no_ext.h, with binding implementation in
@@ -473,9 +829,9 @@ if __name__ == '__main__':
                         epilog='Result code 0 is returned on success, 1 on conversion failure and 2 on '
                                'parameter errors')
     parser.add_argument('src',
+                        nargs='?',
                         help='Path to source header file to process (generally imgui.h)')
     parser.add_argument('-o', '--output',
-                        required=True,
                         help='Path to output files (generally cimgui). This should have no extension, '
                              'as <output>.h, <output>.cpp and <output>.json will be written.')
     parser.add_argument('-t', '--templatedir',
@@ -494,6 +850,60 @@ if __name__ == '__main__':
     parser.add_argument('--config-include',
                         help="Path to additional .h file to read configuration defines from (i.e. the file you set "
                              "IMGUI_USER_CONFIG to, if any).")
+    parser.add_argument('-D', '--define',
+                        action='append',
+                        default=[],
+                        metavar='NAME[=VALUE]',
+                        help="Treat the preprocessor symbol given as being defined (with the value given, or 1 if "
+                             "none is). Conditionals whose outcome is then known are flattened, removing the code "
+                             "that would not be compiled. Can be given multiple times.")
+    parser.add_argument('-U', '--undefine',
+                        action='append',
+                        default=[],
+                        metavar='NAME',
+                        help="Treat the preprocessor symbol given as being undefined, flattening conditionals as for "
+                             "-D. Can be given multiple times.")
+    parser.add_argument('--depfile',
+                        help="Path to write a Make-style dependency file to, listing all the files the output depends "
+                             "on (for build system integration). Unless --stamp is given, the output files are the "
+                             "targets, and their modification times are updated on every successful run.")
+    parser.add_argument('--stamp',
+                        help="Path to a stamp file to update on every successful run. If given, this is used as the "
+                             "target in the dependency file instead of the output files (which are not modified if "
+                             "their contents have not changed).")
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help="Don't read or write cached data (parsed headers and generated output) from previous "
+                             "runs")
+    parser.add_argument('--cache-dir',
+                        default=disk_cache.get_default_cache_dir(),
+                        help="Directory to store cached data in (default: " + disk_cache.get_default_cache_dir() + ")")
+    parser.add_argument('--cache-max-size',
+                        type=int,
+                        default=256,
+                        help="Maximum size of the cache directory in megabytes, beyond which the least recently used "
+                             "entries are removed (default: 256). In batch mode, this also limits the memory used to "
+                             "share data between jobs.")
+    parser.add_argument('--parse-memo',
+                        action='store_true',
+                        help="Memoise the results of type and function argument parsing, and report how many parses "
+                             "this saved (for measuring parser performance - use with --no-cache, as otherwise "
+                             "headers may not be parsed at all)")
+
+    parser.add_argument('--job',
+                        action='append',
+                        default=[],
+                        help="Run a conversion job in batch mode, specified as a single string containing the "
+                             "arguments for that job (for example --job=\"-o cimgui ../imgui/imgui.h\" - note the = is "
+                             "required as the string begins with a -). Can be given multiple times to run several jobs "
+                             "in one process.")
+    parser.add_argument('--manifest',
+                        help="Path to a file listing conversion jobs to run in batch mode, one per line, each in the "
+                             "same form as for --job (blank lines and lines beginning with # are ignored)")
+    parser.add_argument('--processes',
+                        type=int,
+                        default=1,
+                        help="Number of worker processes to spread batch mode jobs over (default: 1)")
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
@@ -501,19 +911,51 @@ if __name__ == '__main__':
 
     args = parser.parse_args()
 
-    config_include_files = []
+    # Gather batch mode jobs
+
+    job_arg_strings = list(args.job)
+    if args.manifest is not None:
+        with open(args.manifest, "r") as manifest_file:
+            for line in manifest_file.readlines():
+                line = line.strip()
+                if (len(line) > 0) and not line.startswith('#'):
+                    job_arg_strings.append(line)
+
+    # Options that apply to the whole batch, and so can only be given on the main command line rather than for
+    # individual jobs (the defaults for these are cleared so we can tell if a job supplies them)
+    batch_options = {
+        'no_cache': '--no-cache',
+        'cache_dir': '--cache-dir',
+        'cache_max_size': '--cache-max-size',
+        'job': '--job',
+        'manifest': '--manifest',
+        'processes': '--processes',
+    }
+    parser.set_defaults(**{dest: None for dest in batch_options})
+
+    jobs = []
+    for job_arg_string in job_arg_strings:
+        job_args = parser.parse_args(shlex.split(job_arg_string))
+        if (job_args.src is None) or (job_args.output is None):
+            parser.error("job \"" + job_arg_string + "\" must specify both src and -o/--output")
+        for dest, option in batch_options.items():
+            if getattr(job_args, dest) is not None:
+                parser.error("job \"" + job_arg_string + "\" cannot use " + option + " (this applies to the whole "
+                             "batch, so must be given on the main command line)")
+        jobs.append(job_args)
+
+    if (args.src is not None) or (args.output is not None) or (len(jobs) == 0):
+        if (args.src is None) or (args.output is None):
+            parser.error("the following arguments are required: src, -o/--output")
+        jobs.insert(0, args)
 
-    # Add imconfig.h to the include list to get any #defines set in that
-    config_include_files.append(os.path.join(os.path.dirname(os.path.realpath(args.src)), "imconfig.h"))
+    # Perform conversion
 
-    # Add any user-supplied config file as well
-    if args.config_include is not None:
-        config_include_files.append(os.path.realpath(args.config_include))
+    if len(jobs) > 1:
+        sys.exit(0 if run_batch(jobs, args) else 1)
 
-    # Perform conversion
     try:
-        convert_header(os.path.realpath(args.src), config_include_files, args.output, args.templatedir,
-                       args.nopassingstructsbyvalue, args.backend, args.imgui_include_dir)
+        run_job(jobs[0], create_cache(args, for_batch=False))
     except:  # noqa - suppress warning about broad exception clause as it's intentionally broad
         print("Exception during conversion:")
         traceback.print_exc()
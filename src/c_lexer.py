@@ -1,5 +1,6 @@
 import ply.lex as lex
 import re
+import sys
 from src import token_stream
 
 # This implements a simple lexer for C
@@ -232,8 +233,99 @@ def t_pp_error(t):
     t.lexer.skip(1)
 
 
+# The master lexer, built on first use
+# Building a lexer involves PLY reflecting over this module and compiling the master regular expressions, which is
+# comparatively expensive, so we only do it once per process and hand out (cheap) clones of it to each tokenize() call
+_master_lexer = None
+
+
+# Get the master lexer, building it if necessary
+# The master lexer itself is never fed input, so it always remains in the initial state at line 1
+def get_master_lexer():
+    global _master_lexer
+    if _master_lexer is None:
+        _master_lexer = lex.lex(reflags=int(re.VERBOSE | re.MULTILINE))
+    return _master_lexer
+
+
+# Flags that can be set on a token
+TOKEN_FLAG_WAS_REFERENCE = 1  # This pointer was originally a reference (see mod_convert_references_to_pointers)
+TOKEN_FLAG_NULLABILITY_KNOWN = 2  # The nullability of this pointer is known (otherwise it is assumed nullable)
+TOKEN_FLAG_NULLABLE = 4  # This pointer can be null (only meaningful if TOKEN_FLAG_NULLABILITY_KNOWN is set)
+
+# Token types whose values are (more or less) unique and thus not worth interning
+uninterned_token_types = {'BLOCK_COMMENT', 'LINE_COMMENT'}
+
+
+# A single lexed token
+# This mirrors the fields of ply.lex.LexToken (and its repr()), but uses slots rather than a per-instance dictionary,
+# doesn't keep a reference to the lexer, and interns type names and values so that identical strings are shared
+# between tokens, which considerably reduces the memory footprint of large headers (and the DOM clones made of them)
+class Token:
+    __slots__ = ('type', 'value', 'lineno', 'lexpos', 'flags')
+
+    def __init__(self, type, value, lineno=0, lexpos=0, flags=0):
+        self.type = sys.intern(type)
+        self.value = value if ((type in uninterned_token_types) or (not isinstance(value, str))) else sys.intern(value)
+        self.lineno = lineno
+        self.lexpos = lexpos
+        self.flags = flags
+
+    # Was this pointer originally a reference?
+    @property
+    def was_reference(self):
+        return (self.flags & TOKEN_FLAG_WAS_REFERENCE) != 0
+
+    @was_reference.setter
+    def was_reference(self, value):
+        if value:
+            self.flags |= TOKEN_FLAG_WAS_REFERENCE
+        else:
+            self.flags &= ~TOKEN_FLAG_WAS_REFERENCE
+
+    # Can this pointer be null? Returns None if this is not known
+    @property
+    def nullable(self):
+        if (self.flags & TOKEN_FLAG_NULLABILITY_KNOWN) == 0:
+            return None
+        return (self.flags & TOKEN_FLAG_NULLABLE) != 0
+
+    @nullable.setter
+    def nullable(self, value):
+        if value is None:
+            self.flags &= ~(TOKEN_FLAG_NULLABILITY_KNOWN | TOKEN_FLAG_NULLABLE)
+        elif value:
+            self.flags |= TOKEN_FLAG_NULLABILITY_KNOWN | TOKEN_FLAG_NULLABLE
+        else:
+            self.flags = (self.flags | TOKEN_FLAG_NULLABILITY_KNOWN) & ~TOKEN_FLAG_NULLABLE
+
+    # All fields are immutable values, so copying is just a case of constructing a new token with the same fields
+    def __copy__(self):
+        result = Token.__new__(Token)
+        result.type = self.type
+        result.value = self.value
+        result.lineno = self.lineno
+        result.lexpos = self.lexpos
+        result.flags = self.flags
+        return result
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    # Pickle via the constructor so that strings get re-interned on load
+    def __reduce__(self):
+        return Token, (self.type, self.value, self.lineno, self.lexpos, self.flags)
+
+    def __str__(self):
+        return "LexToken(%s,%r,%d,%d)" % (self.type, self.value, self.lineno, self.lexpos)
+
+    def __repr__(self):
+        return str(self)
+
+
 # Lex a given source (string) and return a token stream for it
 def tokenize(source):
-    lexer = lex.lex(reflags=int(re.VERBOSE | re.MULTILINE))
+    lexer = get_master_lexer().clone()
     lexer.input(source)
-    return token_stream.TokenStream(lexer)
+    tokens = [Token(tok.type, tok.value, tok.lineno, tok.lexpos) for tok in iter(lexer.token, None)]
+    return token_stream.TokenStream(tokens)
@@ -4,15 +4,21 @@ from src import code_dom
 
 # Class/struct/union
 class DOMClassStructUnion(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'is_anonymous', 'is_forward_declaration', 'is_by_value', 'structure_type',
+                 'is_imgui_api', 'base_classes', 'template_parameter_values')
+
     def __init__(self):
         super().__init__()
         self.name = None  # Can be none for anonymous things if they haven't been given a temporary name
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.is_anonymous = True
         self.is_forward_declaration = True
         self.is_by_value = False  # Is this to be passed by value? (set during modification)
         self.structure_type = None  # Will be "STRUCT", "CLASS" or "UNION"
         self.is_imgui_api = False  # Does this use IMGUI_API?
         self.base_classes = None  # List of base classes, as tuples with their accessibility (i.e. ("private", "CBase"))
+        self.template_parameter_values = None  # If this is an instantiation of a template, the (implementation) values
+        #                                        of the template parameters, indexed by parameter name
 
     # Parse tokens from the token stream given
     @staticmethod
@@ -83,14 +89,14 @@ class DOMClassStructUnion(code_dom.element.DOMElement):
                     if not child_element.no_default_add:
                         dom_element.add_child(child_element, context)
                 else:
-                    print("Unrecognised element: " + str(vars(tok)))
+                    print("Unrecognised element: " + str(tok))
                     break
 
         stream.get_token_of_type(['SEMICOLON'])  # Eat the trailing semicolon
 
         return dom_element
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         name = self.name or "<anonymous>"
         if leaf_name != "":
             name += "::" + leaf_name
@@ -99,10 +105,8 @@ class DOMClassStructUnion(code_dom.element.DOMElement):
         else:
             return ("::" if include_leading_colons else "") + name
 
-    # Write this element out as C code
-    def write_to_c(self, file, indent=0, context=WriteContext()):
-        self.write_preceding_comments(file, indent, context)
-
+    # Get the declaration line of this struct (the part before the body or ;)
+    def get_declaration(self, context=WriteContext()):
         declaration = ""
 
         if context.for_c and not self.is_anonymous:
@@ -131,7 +135,22 @@ class DOMClassStructUnion(code_dom.element.DOMElement):
                 declaration += " : " if is_first else ", "
                 declaration += accessibility + " " + class_name
 
+        return declaration
+
+    def get_c_line(self, context=WriteContext()):
+        if not self.is_forward_declaration:
+            return None  # The body gets written on subsequent lines
+        if context.for_c and not self.is_anonymous:
+            return self.get_declaration(context) + " " + self.name + ";"
+        else:
+            return self.get_declaration(context) + ";"
+
+    # Write this element out as C code
+    def write_to_c(self, file, indent=0, context=WriteContext()):
+        self.write_preceding_comments(file, indent, context)
+
         if not self.is_forward_declaration:
+            declaration = self.get_declaration(context)
             write_c_line(file, indent, self.add_attached_comment_to_line(declaration))
             write_c_line(file, indent, "{")
             for child in self.children:
@@ -141,10 +160,7 @@ class DOMClassStructUnion(code_dom.element.DOMElement):
             else:
                 write_c_line(file, indent, "};")
         else:
-            if context.for_c and not self.is_anonymous:
-                write_c_line(file, indent, self.add_attached_comment_to_line(declaration + " " + self.name + ";"))
-            else:
-                write_c_line(file, indent, self.add_attached_comment_to_line(declaration + ";"))
+            write_c_line(file, indent, self.add_attached_comment_to_line(self.get_c_line(context)))
 
     def __str__(self):
         if self.name is not None:
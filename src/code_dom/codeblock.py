@@ -4,6 +4,8 @@ from src import code_dom
 
 # A code block
 class DOMCodeBlock(code_dom.element.DOMElement):
+    __slots__ = ('code_on_different_line_to_braces',)
+
     def __init__(self):
         super().__init__()
         self.tokens = []
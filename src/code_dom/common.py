@@ -1,10 +1,12 @@
 # Common stuff for the code DOM
+import weakref
 
 
 class ParseContext:
     def __init__(self):
         self.current_content_parser = None
         self.last_element = None
+        self.use_parse_memo = False  # Should sub-parse results be memoised? (see parse_memoized())
 
 
 class WriteContext:
@@ -17,32 +19,93 @@ class WriteContext:
         self.mark_non_nullable_pointers = False  # Do we want to emit non-nullable pointers as ^ instead of *?
 
 
+# The set of preprocessor conditionals an element is inside, as a stack of (conditional, is in else block) entries
+# ordered from outermost to innermost
+# Contexts are immutable and interned (each context keeps a table of the contexts that extend it), so elements inside
+# the same set of conditional blocks share a single context object, and contexts can be compared with "is"
+class ConditionalContext:
+    __slots__ = ('parent', 'entries', 'extensions', '__weakref__')
+
+    def __init__(self, parent=None, entry=None):
+        self.parent = parent  # The context this one extends (None for the empty context)
+        self.entries = parent.entries + (entry,) if parent is not None else ()  # Tuple of (conditional, is in else
+        #                                                                          block) pairs
+        self.extensions = weakref.WeakValueDictionary()  # Contexts that extend this one, indexed by the entry they
+        #                                                  add - these are weak so that the table doesn't keep
+        #                                                  discarded DOM trees alive
+
+    # Get the context for being inside the conditional given (in its else block if is_in_else_block is set) within
+    # this one
+    def extend(self, conditional, is_in_else_block):
+        entry = (conditional, is_in_else_block)
+        context = self.extensions.get(entry)
+        if context is None:
+            context = ConditionalContext(self, entry)
+            self.extensions[entry] = context
+        return context
+
+    # Get a list of the conditionals in this context, outermost first
+    def get_conditionals(self):
+        return [conditional for conditional, is_in_else_block in self.entries]
+
+    # Returns true if this context is inside the else block of the conditional given
+    # (returns false if the conditional is not part of this context at all)
+    def is_in_else_block_of(self, conditional):
+        for entry_conditional, is_in_else_block in self.entries:
+            if entry_conditional is conditional:
+                return is_in_else_block
+        return False
+
+
+# The context for elements that are not inside any conditionals
+empty_conditional_context = ConditionalContext()
+
+
+# Run parse_func (which must be a side-effect-free parser identified by parser_key) at the current position in the
+# stream, reusing the result of a previous run of the same parser at the same position if context.use_parse_memo is set
+# This avoids re-parsing the same tokens over and over as the parsers backtrack and try alternatives
+def parse_memoized(context, stream, parser_key, parse_func):
+    if not context.use_parse_memo:
+        return parse_func()
+    result = stream.memoize_parse(parser_key, parse_func)
+    if result is not None:
+        # A reused result may have been claimed by an element that was subsequently discarded when the parser
+        # backtracked, so reset it to the state a fresh parse would have returned
+        result.parent = None
+    return result
+
+
+# Token values that collapse_tokens_to_string() treats as punctuation
+collapse_punctuation_values = frozenset(['+', '-', '<', '>', '(', ')', '=', '/', '\\', '!', '~', '[', ']', '&', '"',
+                                         "'", '%', '^', '*', ':', ';', '?', ',', '.', '{', '}'])
+
+
 # Collapse a list of tokens back into a C-style string, attempting to be reasonably intelligent and/or aesthetic
 # about the use of whitespace
 def collapse_tokens_to_string(tokens):
-    result = ""
+    return collapse_token_values_to_string([token.value for token in tokens])
+
+
+# Collapse a list of token values (strings) back into a C-style string, as collapse_tokens_to_string() does
+def collapse_token_values_to_string(values):
+    result = []
     need_space = False
     need_forced_space = False
-    for token in tokens:
-        token_is_punctuation = token.value in ['+', '-', '<', '>', '(', ')', '=', '/', '\\', '!', '~',
-                                               '[', ']', '&', '"', "'", '%', '^', '*', ':', ';', '?',
-                                               '!', ',', '.', '{', '}']
+    for value in values:
+        token_is_punctuation = value in collapse_punctuation_values
         if (need_space and not token_is_punctuation) or need_forced_space:
-            result += " "
-        result += token.value
+            result.append(" ")
+        result.append(value)
         need_space = not token_is_punctuation
         # Special-case here - semicolon and comma do not get a space before them, but do get a space after them,
         # even if the next character is punctuation
-        need_forced_space = token.value in [';', ',']
-    return result
+        need_forced_space = (value == ';') or (value == ',')
+    return "".join(result)
 
 
 # Collapse a list of tokens back into a C-style string, assuming the tokens already have suitable whitespace
 def collapse_tokens_to_string_with_whitespace(tokens):
-    result = ""
-    for token in tokens:
-        result += token.value
-    return result
+    return "".join([token.value for token in tokens])
 
 
 # Write a C-style line with indentation, and any trailing whitespace removed
@@ -4,9 +4,12 @@ from src import code_dom
 
 # A #define statement
 class DOMDefine(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'content')
+
     def __init__(self):
         super().__init__()
         self.name = None  # The name of the define
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.content = None  # The actual content of the define (None if it is just a basic #define)
 
     # Parse tokens from the token stream given
@@ -36,14 +39,17 @@ class DOMDefine(code_dom.element.DOMElement):
     # Write this element out as C code
     def write_to_c(self, file, indent=0, context=WriteContext()):
         self.write_preceding_comments(file, indent, context)
+        write_c_line(file, indent, self.add_attached_comment_to_line(self.get_c_line(context)))
+
+    def get_c_line(self, context=WriteContext()):
         # This is a little bit weird because we want to try and preserve formatting (whitespace), which means if we
         # have tokens we use those to generate the output, otherwise we synthesize a new statement
         if len(self.tokens) > 0:
-            write_c_line(file, indent, self.add_attached_comment_to_line(collapse_tokens_to_string(self.tokens)))
+            return collapse_tokens_to_string(self.tokens)
         elif self.content is not None:
-            write_c_line(file, indent, self.add_attached_comment_to_line("#define " + self.name + " " + self.content))
+            return "#define " + self.name + " " + self.content
         else:
-            write_c_line(file, indent, self.add_attached_comment_to_line("#define " + self.name))
+            return "#define " + self.name
 
     def __str__(self):
         return "Define: " + str(self.tokens)
@@ -1,57 +1,288 @@
 from .common import *
 import copy
+import itertools
+import operator
+import src.c_lexer
 import src.code_dom
 
+# Possible results from classify_declaration()
+DECLARATION_KIND_FUNCTION = 0  # Might be a function declaration (or a field, or unparsable)
+DECLARATION_KIND_FIELD = 1  # Cannot be a function declaration, but might be a field (or unparsable)
+DECLARATION_KIND_UNPARSABLE = 2  # Cannot be either a function or field declaration
+
+# Element parsers indexed by the type of the token that starts the element, built on first use (as the element
+# classes are not all available when this module is loaded)
+_common_element_parsers = None  # Elements that can appear anywhere
+_basic_element_parsers = None  # Elements that can appear in most scopes
+
+
+# Get the parsers for elements that can appear anywhere, indexed by leading token type
+def get_common_element_parsers():
+    global _common_element_parsers
+    if _common_element_parsers is None:
+        _common_element_parsers = {
+            'LINE_COMMENT': src.code_dom.comment.DOMComment.parse,
+            'BLOCK_COMMENT': src.code_dom.comment.DOMComment.parse,
+            'PPDEFINE': src.code_dom.define.DOMDefine.parse,
+            'PPUNDEF': src.code_dom.undef.DOMUndef.parse,
+            'PPIF': src.code_dom.preprocessorif.DOMPreprocessorIf.parse,
+            'PPIFDEF': src.code_dom.preprocessorif.DOMPreprocessorIf.parse,
+            'PPIFNDEF': src.code_dom.preprocessorif.DOMPreprocessorIf.parse,
+            'PRAGMA': src.code_dom.pragma.DOMPragma.parse,
+            'PPERROR': src.code_dom.error.DOMError.parse,
+            'PPINCLUDE': src.code_dom.include.DOMInclude.parse,
+        }
+    return _common_element_parsers
+
+
+# Get the parsers for elements that can appear in most scopes, indexed by leading token type
+def get_basic_element_parsers():
+    global _basic_element_parsers
+    if _basic_element_parsers is None:
+        _basic_element_parsers = {
+            'STRUCT': src.code_dom.classstructunion.DOMClassStructUnion.parse,
+            'CLASS': src.code_dom.classstructunion.DOMClassStructUnion.parse,
+            'UNION': src.code_dom.classstructunion.DOMClassStructUnion.parse,
+            'NAMESPACE': src.code_dom.namespace.DOMNamespace.parse,
+            'TYPEDEF': src.code_dom.typedef.DOMTypedef.parse,
+            'ENUM': src.code_dom.enum.DOMEnum.parse,
+            'TEMPLATE': src.code_dom.template.DOMTemplate.parse,
+            'THING': DOMElement.parse_declaration,
+            'CONST': DOMElement.parse_declaration,
+            'CONSTEXPR': DOMElement.parse_declaration,
+            'SIGNED': DOMElement.parse_declaration,
+            'UNSIGNED': DOMElement.parse_declaration,
+            '~': DOMElement.parse_declaration,  # ~ is necessary because destructor names start with it
+        }
+        # Anything that can appear anywhere can also appear here
+        for token_type, parser in get_common_element_parsers().items():
+            _basic_element_parsers.setdefault(token_type, parser)
+    return _basic_element_parsers
+
+
+# Scan ahead (without consuming anything) from the start of a declaration-like statement to determine which parsers
+# could possibly accept it, returning one of the DECLARATION_KIND_ values
+# This is conservative - it only rules out a parser when the tokens it would need cannot be reached:
+# - A function declaration needs an LPAREN, and the only way for DOMFunctionDeclaration to read past a top-level
+#   semicolon or brace looking for one is inside template brackets or an operator name
+# - A field declaration needs a terminating SEMICOLON or COMMA, and can only read past a top-level brace inside
+#   template brackets or array bounds
+def classify_declaration(stream):
+    checkpoint = stream.get_checkpoint()
+    triangle_depth = 0
+    seen_operator = False
+    seen_square_bracket = False
+    seen_semicolon = False
+    result = DECLARATION_KIND_FUNCTION
+    while True:
+        tok = stream.get_token()
+        if tok is None:
+            # With no LPAREN this can't be a function, and with no semicolon anywhere it can't be a field either
+            result = DECLARATION_KIND_FIELD if seen_semicolon else DECLARATION_KIND_UNPARSABLE
+            break
+        if tok.type == 'LPAREN':
+            break
+        elif tok.type == 'LTRIANGLE':
+            triangle_depth += 1
+        elif tok.type == 'RTRIANGLE':
+            triangle_depth -= 1
+            if triangle_depth < 0:
+                break  # Stray bracket, so we can't reason about what the parsers will do
+        elif tok.type == 'LSQUARE':
+            seen_square_bracket = True
+        elif (tok.type == 'THING') and (tok.value == 'operator'):
+            seen_operator = True
+        elif tok.type == 'SEMICOLON':
+            seen_semicolon = True
+        if ((tok.type == 'SEMICOLON') or (tok.type == 'LBRACE')) and (triangle_depth == 0):
+            if not seen_operator:
+                if (tok.type == 'LBRACE') and not seen_square_bracket:
+                    result = DECLARATION_KIND_UNPARSABLE
+                else:
+                    result = DECLARATION_KIND_FIELD
+            break
+    stream.rewind(checkpoint)
+    return result
+
+
+# Make a copy of an attribute value for a snapshot - lists (including nested lists) and tokens are copied so that they
+# can subsequently be modified in-place without affecting the snapshot, but elements are not
+def copy_snapshot_value(value):
+    if isinstance(value, list):
+        return [copy_snapshot_value(item) for item in value]
+    if isinstance(value, src.c_lexer.Token):
+        return copy.copy(value)
+    return value
+
+
+# Attribute names of each element class (the slots declared by it and all of its base classes), along with a function
+# to fetch the values of those attributes from an instance as a tuple, indexed by class
+_element_attributes = {}
+
+
+# Get the names of all the attributes instances of the element class given can have, and a function that returns the
+# values of them all for an instance
+# Element classes store their attributes in slots rather than a per-instance dictionary to save memory, so this is what
+# code that needs to copy or snapshot an element uses to enumerate them
+def get_element_attributes(element_class):
+    attributes = _element_attributes.get(element_class)
+    if attributes is None:
+        if element_class.__dictoffset__ != 0:
+            raise Exception("Element class " + element_class.__name__ + " does not declare __slots__")
+        names = []
+        for base_class in reversed(element_class.__mro__):
+            for name in base_class.__dict__.get('__slots__', ()):
+                if name not in names:
+                    names.append(name)
+        attributes = (tuple(names), operator.attrgetter(*names))
+        _element_attributes[element_class] = attributes
+    return attributes
+
 
 # Base class for all DOM elements
 class DOMElement:
+    # Every element class needs to declare its attributes in __slots__
+    __slots__ = ('tokens', 'parent', 'lazy_children', 'lazy_pre_comments', 'attached_comment', 'no_default_add',
+                 'unmodified_source', 'unmodified_state', 'unmodified_view', 'shares_data', 'original_name_override',
+                 'is_internal', 'exclude_from_metadata', 'accessibility', 'child_positions',
+                 'fully_qualified_name_cache', 'conditional_context_cache')
+
+    # Attributes that are not part of the content of the element (bookkeeping or cached data), and so are not tracked
+    # by the unmodified snapshot
+    untracked_attributes = frozenset(['unmodified_source', 'unmodified_state', 'unmodified_view', 'child_positions',
+                                      'shares_data', 'fully_qualified_name_cache', 'conditional_context_cache'])
+
+    # Attributes that the fully-qualified names of an element and its descendants can depend on
+    fully_qualified_name_attributes = frozenset(['parent', 'name', 'names', 'is_enum_class', 'is_static'])
+
     def __init__(self):
+        self.unmodified_source = None  # The element whose snapshotted original state is the unmodified version of
+        #                                this one (itself, for elements that were in the tree when the snapshot was
+        #                                taken, or the element it was cloned from for clones) - see unmodified_element
+        self.fully_qualified_name_cache = None  # Cached results of get_fully_qualified_name(), indexed by arguments
+        #                                         (if this is set, it is also set on all of our ancestors)
+        self.conditional_context_cache = None  # Cached result of get_conditional_context()
+        #                                        (again, if this is set, it is also set on all of our ancestors)
+        #                                        (these all need to be set first, as __setattr__ checks them)
         self.tokens = []
         self.parent = None  # The parent element
-        self.children = []  # Basic child elements (note that some elements have multiple child lists)
-        self.pre_comments = []  # If this element is preceded with comments that are related to it, they go here
+        self.lazy_children = None  # List backing children, allocated on first use as most elements have no children
+        self.lazy_pre_comments = None  # List backing pre_comments, allocated on first use
         self.attached_comment = None  # If a comment appears after this element (on the same line), this is it
         self.no_default_add = False  # Should this element not be added to the DOM upon creation? (mainly for
         #                              attached comments)
-        self.unmodified_element = None  # The original (unmodified) element, as part of a complete clone of the
-        #                                 pre-modification document structure
+        self.unmodified_state = None  # If this element has been modified since the snapshot was taken, a copy of its
+        #                               attributes as they were beforehand
+        self.unmodified_view = None  # Element representing the unmodified version of this one, built on demand
+        self.shares_data = False  # Are our lists/tokens (other than child lists) shared with a clone of this element?
         self.original_name_override = None  # Optional name to use for the original name of this type
         #                                     (primarily for template parameter expansion and the like)
         self.is_internal = False  # Indicates that the associated element is an internal API component
         self.exclude_from_metadata = False  # Should this element be excluded from the generated metadata?
+        self.accessibility = None  # The accessibility of this element, if it is declared inside a class
+        self.child_positions = None  # Cached (child list, index) position of each child, indexed by child - these are
+        #                              only hints, and are checked (falling back to a search if wrong) when used
+
+    # Record our original state before any attribute is changed, if we are part of the unmodified snapshot
+    # (this doesn't need to worry about shares_data, as replacing a shared value doesn't modify it)
+    # Also invalidates cached fully-qualified names and conditional contexts if this is something that affects them
+    def __setattr__(self, name, value):
+        if name not in self.untracked_attributes:
+            if self.unmodified_source is self:
+                self.prepare_for_modification()
+            if (name in self.fully_qualified_name_attributes) and (self.fully_qualified_name_cache is not None):
+                self.clear_fully_qualified_name_caches()
+            if (name == 'parent') and (self.conditional_context_cache is not None):
+                self.clear_conditional_context_caches()
+        object.__setattr__(self, name, value)
+
+    # Basic child elements (note that some elements have multiple child lists)
+    @property
+    def children(self):
+        if self.lazy_children is None:
+            object.__setattr__(self, 'lazy_children', [])
+        return self.lazy_children
+
+    @children.setter
+    def children(self, value):
+        self.lazy_children = value
+
+    # If this element is preceded with comments that are related to it, they go here
+    @property
+    def pre_comments(self):
+        if self.lazy_pre_comments is None:
+            object.__setattr__(self, 'lazy_pre_comments', [])
+        return self.lazy_pre_comments
+
+    @pre_comments.setter
+    def pre_comments(self, value):
+        self.lazy_pre_comments = value
+
+    # This must be called before modifying any of the lists or tokens belonging to this element in-place, so that the
+    # original state can be recorded for the unmodified snapshot, and so that any data shared with clones gets copied
+    # (assigning to attributes and using add_child()/remove_child()/etc handles the former automatically)
+    def prepare_for_modification(self):
+        if self.shares_data:
+            self.__unshare_data()
+        if (self.unmodified_source is not self) or (self.unmodified_state is not None):
+            return  # Either not in the snapshot or already recorded
+        state = {}
+        for name, value in self.__get_attributes().items():
+            if name not in self.untracked_attributes:
+                state[name] = copy_snapshot_value(value)
+        self.unmodified_state = state
+        if self.unmodified_view is not None:
+            # The view was sharing our lists/tokens, so switch it over to the copies before they get modified
+            self.unmodified_view.__set_attributes(DOMElement.__map_to_unmodified_views(state))
+
+    # Make our own copies of any lists (other than child lists, which are never shared) and tokens we share with clones
+    def __unshare_data(self):
+        child_lists = self.get_writable_child_lists()
+        for name, value in self.__get_attributes().items():
+            if isinstance(value, list) and not any(value is child_list for child_list in child_lists):
+                object.__setattr__(self, name, copy_snapshot_value(value))
+        self.shares_data = False
+
+    # Get a dictionary of all our attribute values
+    def __get_attributes(self):
+        names, getter = get_element_attributes(type(self))
+        return dict(zip(names, getter(self)))
+
+    # Set attributes from a dictionary of attribute values, bypassing __setattr__
+    def __set_attributes(self, state):
+        set_attribute = object.__setattr__
+        for name, value in state.items():
+            set_attribute(self, name, value)
+
+    # The unmodified version of this element (as it was when save_unmodified_clones() was called), or None if this
+    # element did not exist at that point
+    # The unmodified elements form a complete tree mirroring the original document, which is built on demand
+    @property
+    def unmodified_element(self):
+        if self.unmodified_source is None:
+            return None
+        return self.unmodified_source.__get_unmodified_view()
 
     # Parse tokens that can appear anywhere, returning an appropriate element if possible or None if not
     @staticmethod
     def parse_common(context, stream):
-        tok = stream.peek_token(skip_newlines=False)
-        if tok is None:
-            return None
-        if (tok.type == 'LINE_COMMENT') or (tok.type == 'BLOCK_COMMENT'):
-            return src.code_dom.comment.DOMComment.parse(context, stream)
-        elif tok.type == 'PPDEFINE':
-            return src.code_dom.define.DOMDefine.parse(context, stream)
-        elif tok.type == 'PPUNDEF':
-            return src.code_dom.undef.DOMUndef.parse(context, stream)
-        elif (tok.type == 'PPIF') or (tok.type == 'PPIFDEF') or (tok.type == 'PPIFNDEF'):
-            return src.code_dom.preprocessorif.DOMPreprocessorIf.parse(context, stream)
-        elif tok.type == 'PRAGMA':
-            return src.code_dom.pragma.DOMPragma.parse(context, stream)
-        elif tok.type == 'PPERROR':
-            return src.code_dom.error.DOMError.parse(context, stream)
-        elif tok.type == 'PPINCLUDE':
-            return src.code_dom.include.DOMInclude.parse(context, stream)
-        elif tok.type == 'NEWLINE':
-            blank_lines = src.code_dom.blanklines.DOMBlankLines.parse(context, stream)
-            # A little bit of a convenience hack here - we don't really want tons of "zero blank lines"
-            # entries cluttering up the DOM every time we see a newline, so only return blank line elements if they
-            # actually represent a blank line as opposed to just a single newline
-            if blank_lines.num_blank_lines > 0:
-                return blank_lines
-            else:
+        while True:
+            tok = stream.peek_token(skip_newlines=False)
+            if tok is None:
+                return None
+            if tok.type == 'NEWLINE':
+                blank_lines = src.code_dom.blanklines.DOMBlankLines.parse(context, stream)
+                # A little bit of a convenience hack here - we don't really want tons of "zero blank lines"
+                # entries cluttering up the DOM every time we see a newline, so only return blank line elements if
+                # they actually represent a blank line as opposed to just a single newline
+                if blank_lines.num_blank_lines > 0:
+                    return blank_lines
                 context.last_element = None  # Clear last_element to avoid comments attaching across newlines
-                return DOMElement.parse_common(context, stream)
-        else:
-            return None
+                continue
+            parser = get_common_element_parsers().get(tok.type)
+            if parser is None:
+                return None
+            return parser(context, stream)
 
     # Parse tokens that can appear in most scopes, returning an appropriate element if possible or None if not
     @staticmethod
@@ -63,62 +294,51 @@ class DOMElement:
         tok = stream.peek_token()
         if tok is None:
             return None
-        if (tok.type == 'STRUCT') or (tok.type == 'CLASS') or (tok.type == 'UNION'):
-            return src.code_dom.classstructunion.DOMClassStructUnion.parse(context, stream)
-        elif tok.type == 'PPDEFINE':
-            return src.code_dom.define.DOMDefine.parse(context, stream)
-        elif tok.type == 'PPUNDEF':
-            return src.code_dom.undef.DOMUndef.parse(context, stream)
-        elif (tok.type == 'PPIF') or (tok.type == 'PPIFDEF') or (tok.type == 'PPIFNDEF'):
-            return src.code_dom.preprocessorif.DOMPreprocessorIf.parse(context, stream)
-        elif tok.type == 'PRAGMA':
-            return src.code_dom.pragma.DOMPragma.parse(context, stream)
-        elif tok.type == 'PPERROR':
-            return src.code_dom.error.DOMError.parse(context, stream)
-        elif tok.type == 'PPINCLUDE':
-            return src.code_dom.include.DOMInclude.parse(context, stream)
-        elif tok.type == 'NAMESPACE':
-            return src.code_dom.namespace.DOMNamespace.parse(context, stream)
-        elif tok.type == 'TYPEDEF':
-            return src.code_dom.typedef.DOMTypedef.parse(context, stream)
-        elif tok.type == 'ENUM':
-            return src.code_dom.enum.DOMEnum.parse(context, stream)
-        elif tok.type == 'TEMPLATE':
-            return src.code_dom.template.DOMTemplate.parse(context, stream)
-        elif (tok.type == 'THING') or (tok.type == 'CONST') or (tok.type == 'CONSTEXPR') or (tok.type == 'SIGNED') or \
-                (tok.type == 'UNSIGNED') or \
-                (tok.type == '~'):  # ~ is necessary because destructor names start with it
-
-            # It might be an extern "C" statement
-
-            if tok.value == 'extern':
-                extern = src.code_dom.externc.DOMExternC.parse(context, stream)
-                if extern is not None:
-                    return extern
-
-            # This could be either a field declaration or a function declaration, so try both
+        parser = get_basic_element_parsers().get(tok.type)
+        if parser is None:
+            return None
+        return parser(context, stream)
+
+    # Parse a declaration-like statement (one starting with a name, type or type prefix)
+    @staticmethod
+    def parse_declaration(context, stream):
+        tok = stream.peek_token()
+
+        # It might be an extern "C" statement
 
+        if tok.value == 'extern':
+            extern = src.code_dom.externc.DOMExternC.parse(context, stream)
+            if extern is not None:
+                return extern
+
+        # This could be a function declaration, a field declaration or something we don't understand, so scan ahead
+        # to rule out the parsers that cannot possibly succeed before trying the rest in order
+
+        declaration_kind = classify_declaration(stream)
+
+        if declaration_kind == DECLARATION_KIND_FUNCTION:
             function_declaration = src.code_dom.functiondeclaration.DOMFunctionDeclaration.parse(context, stream)
             if function_declaration is not None:
                 return function_declaration
 
+        if declaration_kind != DECLARATION_KIND_UNPARSABLE:
             field_declaration = src.code_dom.fielddeclaration.DOMFieldDeclaration.parse(context, stream)
             if field_declaration is not None:
                 return field_declaration
 
-            # It may be a macro or something else we don't understand, so record it as unparsable and move on
-            return src.code_dom.unparsablething.DOMUnparsableThing.parse(context, stream)
-        else:
-            return None
+        # It may be a macro or something else we don't understand, so record it as unparsable and move on
+        return src.code_dom.unparsablething.DOMUnparsableThing.parse(context, stream)
 
     # Attach preceding comments
     def attach_preceding_comments(self, comments):
+        self.prepare_for_modification()
         for comment in comments:
             if comment.parent:
                 comment.parent.remove_child(comment)
             self.pre_comments.append(comment)
             comment.parent = self
             comment.is_preceding_comment = True
+        self.notify_children_changed(comments)
 
     # Add an attached comment (if present) to the output line text given, respecting the comment alignment
     def add_attached_comment_to_line(self, line):
@@ -133,9 +353,17 @@ class DOMElement:
     def write_preceding_comments(self, file, indent=0, context=WriteContext()):
         if context.for_implementation:
             return  # No comments in implementation code
-        for comment in self.pre_comments:
+        if self.lazy_pre_comments is None:
+            return
+        for comment in self.lazy_pre_comments:
             write_c_line(file, indent, comment.to_c_string())
 
+    # Get the single line of C code this element is written as (without any comments), or None if it is not written
+    # as a single line
+    # This allows the layout code to measure elements without writing them out (see layout.py)
+    def get_c_line(self, context=WriteContext()):
+        return None
+
     # Write this element out as C code
     def write_to_c(self, file, indent=0, context=WriteContext()):
         self.write_preceding_comments(file, indent, context)
@@ -146,9 +374,18 @@ class DOMElement:
 
     # Dump this element for debugging
     def dump(self, indent=0):
-        print("".ljust(indent * 4) + str(self))
-        for child in self.children:
-            child.dump(indent + 1)
+        pending = [(self, indent)]
+        while len(pending) > 0:
+            entry, entry_indent = pending.pop()
+            print("".ljust(entry_indent * 4) + str(entry))
+            if isinstance(entry, DOMElement):
+                # Reversed so that they get popped in order
+                pending.extend(reversed(entry.get_dump_children(entry_indent)))
+
+    # Get the children to show under this element when dumping it, as a list of (child, indent) pairs
+    # Strings can be used in place of child elements to add headings
+    def get_dump_children(self, indent):
+        return [(child, indent + 1) for child in self.children]
 
     # Get the original filename of this element
     def get_source_filename(self):
@@ -170,7 +407,76 @@ class DOMElement:
     # Gets the fully-qualified name (C++-style) of this element (including namespaces/etc)
     # If include_leading_colons is true then the name will be returned in a genuinely "fully-qualified" fashion -
     # i.e. "::MyClass::Something"
+    # The result is cached until this element or one of its ancestors is renamed or moved, so element classes should
+    # override build_fully_qualified_name() rather than this
     def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+        return self.get_cached_fully_qualified_name((leaf_name, include_leading_colons))
+
+    # Get a fully-qualified name from our cache, building it (by calling build_fully_qualified_name() with the
+    # key given as arguments) if it isn't there
+    def get_cached_fully_qualified_name(self, key):
+        cache = self.fully_qualified_name_cache
+        if cache is None:
+            cache = {}
+            self.fully_qualified_name_cache = cache
+            # Make sure our ancestors have caches too, so that clear_fully_qualified_name_caches() knows to visit us
+            ancestor = self.parent
+            while (ancestor is not None) and (ancestor.fully_qualified_name_cache is None):
+                ancestor.fully_qualified_name_cache = {}
+                ancestor = ancestor.parent
+        elif key in cache:
+            return cache[key]
+        name = self.build_fully_qualified_name(*key)
+        cache[key] = name
+        return name
+
+    # Discard the cached fully-qualified names of this element and all of its descendants
+    def clear_fully_qualified_name_caches(self):
+        if self.fully_qualified_name_cache is None:
+            return  # Nothing below us can have a cache either
+        self.fully_qualified_name_cache = None
+        for child_list in self.get_child_lists():
+            for child in child_list:
+                child.clear_fully_qualified_name_caches()
+
+    # Get the preprocessor conditionals this element is inside (see ConditionalContext)
+    # The result is cached until this element or one of its ancestors is moved
+    def get_conditional_context(self):
+        context = self.conditional_context_cache
+        if context is not None:
+            return context
+
+        # Find the nearest ancestor with a cached context, and then work back down from there (rather than recursing,
+        # as this may be a long way)
+        uncached_elements = [self]
+        parent = self.parent
+        while (parent is not None) and (parent.conditional_context_cache is None):
+            uncached_elements.append(parent)
+            parent = parent.parent
+        context = parent.conditional_context_cache if parent is not None else empty_conditional_context
+        for element in reversed(uncached_elements):
+            if parent is not None:
+                context = parent.get_conditional_context_for_child(context, element)
+            object.__setattr__(element, 'conditional_context_cache', context)  # (skipping __setattr__ for speed)
+            parent = element
+        return context
+
+    # Get the conditional context for a child of this element, given our own context
+    def get_conditional_context_for_child(self, context, child):
+        return context
+
+    # Discard the cached conditional contexts of this element and all of its descendants
+    def clear_conditional_context_caches(self):
+        pending = [self]
+        while len(pending) > 0:
+            element = pending.pop()
+            if element.conditional_context_cache is not None:  # (if not, nothing below it can have a cache either)
+                element.conditional_context_cache = None
+                for child_list in element.get_child_lists():
+                    pending.extend(child_list)
+
+    # Build the fully-qualified name of this element for get_fully_qualified_name()
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(leaf_name, include_leading_colons)
         else:
@@ -201,8 +507,12 @@ class DOMElement:
     def add_child(self, child, context=None):
         if child.parent is not None:
             child.parent.remove_child(child)
+        self.prepare_for_modification()
         child.parent = self
         self.children.append(child)
+        if self.child_positions is not None:
+            self.child_positions[child] = (self.children, len(self.children) - 1)
+        self.notify_children_changed([child])
         if context is not None:
             context.last_element = child
 
@@ -212,152 +522,397 @@ class DOMElement:
             self.add_child(child, context)
 
     # Remove a child from this element
+    # This is linear in the size of the child list (both for the removal itself and for the position lookup if the
+    # position hint for the child is stale)
     def remove_child(self, child):
         if child.parent is not self:
             raise Exception("Attempt to remove child from element other than parent")
+        position = self.find_child_position(child, writable_only=True)
+        if position is None:
+            # Types are not stored in a list, but are returned in one for traversal purposes. Thus they cannot be
+            # removed with remove_child() (because the temporary list returned by get_child_lists() is not returned
+            # by get_writable_child_lists()).
+            raise Exception("Child not found in any list - this may be because it is attached as a type or similar")
+        child_list, index = position
+        self.prepare_for_modification()
+        del child_list[index]
+        del self.child_positions[child]
+        child.parent = None
+        self.notify_children_changed([child])
+
+    # Remove multiple children from this element
+    # This does a single pass over each child list, so it is much faster than calling remove_child() for each child
+    # when a lot of children are being removed from a large list (as each removal shifts the position of everything
+    # after it)
+    def remove_children(self, children):
+        children_to_remove = set()
+        for child in children:
+            if child.parent is not self:
+                raise Exception("Attempt to remove child from element other than parent")
+            children_to_remove.add(child)
+
+        self.prepare_for_modification()
+        num_removed = 0
+        remaining_lists = []
         for child_list in self.get_writable_child_lists():
-            if child in child_list:
-                child_list.remove(child)
-                child.parent = None
-                return
-        # Types are not stored in a list, but are returned in one for traversal purposes. Thus they cannot be
-        # removed with remove_child() (because the temporary list returned by get_child_lists() is not returned
-        # by get_writable_child_lists()).
-        raise Exception("Child not found in any list - this may be because it is attached as a type or similar")
+            remaining = [child for child in child_list if child not in children_to_remove]
+            if len(remaining) != len(child_list):
+                num_removed += len(child_list) - len(remaining)
+                remaining_lists.append((child_list, remaining))
+        if num_removed != len(children_to_remove):
+            # As with remove_child(), types and similar cannot be removed this way
+            raise Exception("Child not found in any list - this may be because it is attached as a type or similar")
+
+        for (child_list, remaining) in remaining_lists:
+            child_list[:] = remaining
+        self.child_positions = None  # Almost all of the positions will have changed
+        for child in children_to_remove:
+            child.parent = None
+        self.notify_children_changed(list(children_to_remove))
+
+    # Find the child list containing the child given and the index of the child within it, returning
+    # (child list, index) or None if the child could not be found
+    # This is not constant-time - the positions in child_positions are hints that are checked on use, with a linear
+    # search of the list as the fallback whenever the hint is stale (inserting or removing a child shifts everything
+    # after it, so the first lookup of each shifted child has to search for it again)
+    # The hints pay off for code that walks siblings while only changing things near the current position (such as
+    # mod_remove_blank_lines), but code that removes a lot of children from a large list should use remove_children()
+    # rather than repeatedly calling remove_child()
+    # If writable_only is set, only lists returned by get_writable_child_lists() are considered
+    def find_child_position(self, child, writable_only=False):
+        writable_lists = self.get_writable_child_lists()
+
+        if self.child_positions is not None:
+            position = self.child_positions.get(child)
+            if position is not None:
+                child_list, index = position
+                # Check that the list is still one of ours, as lists are sometimes replaced wholesale
+                for writable_list in writable_lists:
+                    if writable_list is child_list:
+                        if (index < len(child_list)) and (child_list[index] is child):
+                            return position
+                        # Children have been added or removed before this one since the position was recorded,
+                        # so find where it is now
+                        try:
+                            position = (child_list, child_list.index(child))
+                        except ValueError:
+                            break
+                        self.child_positions[child] = position
+                        return position
+
+        # We don't have a valid position for this child, so (re)build the cache
+        self.child_positions = {}
+        for child_list in writable_lists:
+            for index, list_child in enumerate(child_list):
+                self.child_positions[list_child] = (child_list, index)
+
+        position = self.child_positions.get(child)
+        if (position is not None) or writable_only:
+            return position
+
+        # Look in any temporary lists (these aren't cached as the lists are regenerated on each call)
+        for child_list in self.get_child_lists():
+            for index, list_child in enumerate(child_list):
+                if list_child is child:
+                    return child_list, index
+        return None
 
     # Find the element immediately prior to the child given
     def get_prev_child(self, child):
-        for child_list in self.get_child_lists():
-            for i in range(0, len(child_list)):
-                if child_list[i] == child:
-                    if i > 0:
-                        return child_list[i - 1]
-                    else:
-                        return None
-        raise Exception("Child not found in any list")
+        position = self.find_child_position(child)
+        if position is None:
+            raise Exception("Child not found in any list")
+        child_list, index = position
+        if index > 0:
+            return child_list[index - 1]
+        else:
+            return None
 
     # Find the element immediately after the child given
     def get_next_child(self, child):
-        for child_list in self.get_child_lists():
-            for i in range(0, len(child_list)):
-                if child_list[i] == child:
-                    if i < (len(child_list) - 1):
-                        return child_list[i + 1]
-                    else:
-                        return None
-        raise Exception("Child not found in any list")
+        position = self.find_child_position(child)
+        if position is None:
+            raise Exception("Child not found in any list")
+        child_list, index = position
+        if index < (len(child_list) - 1):
+            return child_list[index + 1]
+        else:
+            return None
+
+    # Notify the root of the tree this element is in that the elements given (along with all of their children) have
+    # been added to, removed from or moved within the tree, so that it can update any indices it holds
+    # This is called automatically by add_child()/remove_child()/etc, but code that modifies child lists (or fields
+    # such as attached_comment) directly on elements that are in the tree needs to call it by hand
+    def notify_children_changed(self, elements):
+        root = self
+        while root.parent is not None:
+            root = root.parent
+        root.on_descendants_changed(elements)
+
+    # Called on the root element of a tree when elements in it have changed (see notify_children_changed())
+    def on_descendants_changed(self, elements):
+        pass
 
     # Debug function - raises exception if the hierarchy is not valid
     def validate_hierarchy(self):
-        for child_list in self.get_child_lists():
-            for child in child_list:
-                if child.parent is not self:
-                    raise Exception("Node " + str(child) + " has parent " + str(child.parent) + " when it should be " +
-                                    str(self))
-                child.validate_hierarchy()
+        # Stack of iterators over the children of each element we are currently inside (as in walk())
+        stack = [iter((self,))]
+        while len(stack) > 0:
+            for element in stack[-1]:
+                child_lists = element.get_child_lists()
+                for child_list in child_lists:
+                    for child in child_list:
+                        if child.parent is not element:
+                            raise Exception("Node " + str(child) + " has parent " + str(child.parent) +
+                                            " when it should be " + str(element))
+                if len(child_lists) > 0:
+                    stack.append(itertools.chain.from_iterable(child_lists))
+                    break  # Descend into the children before continuing with the siblings
+            else:
+                stack.pop()
 
     # Returns a list of all the lists in this element that contain children
+    # (child lists that have not been allocated yet are empty by definition, and so are omitted)
     def get_child_lists(self):
+        lists = DOMElement.get_writable_child_lists(self)
         if self.attached_comment is not None:
-            return [self.children, self.pre_comments, [self.attached_comment]]
-        else:
-            return [self.children, self.pre_comments]
+            lists.append([self.attached_comment])
+        return lists
 
     # Returns a list of all the lists in this element that contain children and can be modified
     # This may be different from get_child_lists in that the former can return temporary lists to enumerate children
     # which are not part of a normal list (e.g. types) and thus cannot be manipulated that way.
     def get_writable_child_lists(self):
-        return [self.children, self.pre_comments]
+        lists = []
+        if self.lazy_children is not None:
+            lists.append(self.lazy_children)
+        if self.lazy_pre_comments is not None:
+            lists.append(self.lazy_pre_comments)
+        return lists
 
     # Tests if this element is a descendant of (or the same as) the element given
     def is_descendant_of(self, parent):
-        if self is parent:
-            return True
-        if self.parent is None:
-            return False
-        return self.parent.is_descendant_of(parent)
+        current = self
+        while current is not None:
+            if current is parent:
+                return True
+            current = current.parent
+        return False
 
     # Walk this element and all children, calling a function on them
+    # This is iterative rather than recursive, so it can cope with any depth of tree
     def walk(self, func):
-        func(self)
-        for child_list in self.get_child_lists():
-            for child in child_list:
-                child.walk(func)
+        # Stack of iterators over the children of each element we are currently inside
+        stack = [iter((self,))]
+        while len(stack) > 0:
+            for element in stack[-1]:
+                func(element)
+                child_lists = element.get_child_lists()
+                if len(child_lists) > 0:
+                    stack.append(itertools.chain.from_iterable(child_lists))
+                    break  # Descend into the children before continuing with the siblings
+            else:
+                stack.pop()
+
+    # Iterate over this element and all of its descendants in document order (the same order walk() uses), yielding
+    # those that are of the type given and/or pass the predicate given (if either is None then it is not checked)
+    # If prune is supplied then it is called on each element, and if it returns true then that element's descendants
+    # are skipped (the element itself is still yielded if it matches)
+    # This doesn't recurse (so it can cope with any depth of tree), and only does work as elements are requested, so
+    # callers that just want the first match can stop early
+    # Children are gathered lazily, so if the caller modifies the tree during iteration it should use
+    # list_all_children_of_type() instead
+    def iter_descendants(self, element_type=None, predicate=None, prune=None):
+        # Stack of iterators over the children of each element we are currently inside (as in walk())
+        stack = [iter((self,))]
+        while len(stack) > 0:
+            for element in stack[-1]:
+                if ((element_type is None) or isinstance(element, element_type)) and \
+                        ((predicate is None) or predicate(element)):
+                    yield element
+                if (prune is None) or not prune(element):
+                    child_lists = element.get_child_lists()
+                    if len(child_lists) > 0:
+                        stack.append(itertools.chain.from_iterable(child_lists))
+                        break  # Descend into the children before continuing with the siblings
+            else:
+                stack.pop()
 
-    # Recursively find all the children of this element (and this element itself) that match the type supplied,
+    # Find all the children of this element (and this element itself) that match the type supplied,
     # and return them as a list
+    # (this is a specialised version of iter_descendants(), as it is used a lot and the generator overhead adds up)
     def list_all_children_of_type(self, element_type):
         result = []
-
-        def walker(element):
-            if isinstance(element, element_type):
-                result.append(element)
-
-        self.walk(walker)
-
+        stack = [iter((self,))]
+        while len(stack) > 0:
+            for element in stack[-1]:
+                if isinstance(element, element_type):
+                    result.append(element)
+                child_lists = element.get_child_lists()
+                if len(child_lists) > 0:
+                    stack.append(itertools.chain.from_iterable(child_lists))
+                    break  # Descend into the children before continuing with the siblings
+            else:
+                stack.pop()
         return result
 
-    # Override for pickling that removes unmodified_element (mainly for cloning, as otherwise we would basically
-    # end up cloning the entire unmodified tree every time we cloned anything)
+    # Override for pickling that removes the unmodified snapshot (mainly for cloning, as otherwise we would basically
+    # end up cloning the entire unmodified tree every time we cloned anything) and cached data
     def __getstate__(self):
-        state = self.__dict__.copy()
-        if "unmodified_element" in state:
-            state["unmodified_element"] = None
+        state = self.__get_attributes()
+        state["unmodified_source"] = None
+        state["unmodified_state"] = None
+        state["unmodified_view"] = None
+        state["shares_data"] = False
+        state["child_positions"] = None  # This refers to the original children, so is not valid for the copy
+        state["fully_qualified_name_cache"] = None
+        state["conditional_context_cache"] = None
         return state
 
+    # Restore state saved by __getstate__() when unpickling
+    def __setstate__(self, state):
+        self.__set_attributes(state)
+
+    # Clear any cached data this element holds
+    def clear_caches(self):
+        self.child_positions = None
+        self.fully_qualified_name_cache = None
+        self.conditional_context_cache = None
+
     # Performs a deep clone of this element and all children
+    # Lists of tokens and other values are shared between the original and the clone until one of them is modified (see
+    # prepare_for_modification()), so cloning is cheap
     def clone(self):
-        # We need to temporarily remove our parent reference to prevent the tree above us getting cloned
-        temp_parent = self.parent
-        self.parent = None
-        clone = copy.deepcopy(self)
-        self.parent = temp_parent
-        clone.__reconnect_unmodified(self)
-        return clone
+        return self.__clone_structure(None, [])
 
     # Clone this element but without any children, where "children" means explicit children, such as contained
     # function/fields or similar, but not technically-children like types/arguments/etc. Attached comments are cloned.
     def clone_without_children(self):
-        temp_children = self.children
-        self.children = []
-        clone = self.clone()
-        self.children = temp_children
-        return clone
-
-    # Reconnect "unmodified_element" on a whole tree of elements
-    # (used after cloning, as we don't clone unmodified_element)
-    def __reconnect_unmodified(self, original):
-        self.unmodified_element = original.unmodified_element
+        return self.__clone_structure(None, self.get_explicit_child_lists())
+
+    # Returns a list of the lists in this element that hold explicit children (see clone_without_children())
+    def get_explicit_child_lists(self):
+        if self.lazy_children is None:
+            return []
+        return [self.lazy_children]
+
+    # Clone this element (with the parent given) and all children, except for the contents of any of our child lists
+    # in excluded_child_lists
+    def __clone_structure(self, parent, excluded_child_lists):
+        clone = object.__new__(type(self))
+        clone_state = self.__get_attributes()
+        clone_state["parent"] = parent
+        clone_state["unmodified_source"] = self.unmodified_source
+        clone_state["unmodified_state"] = None
+        clone_state["unmodified_view"] = None
+        clone_state["child_positions"] = None
+        clone_state["shares_data"] = True
+        clone.__set_attributes(clone_state)
+        clone.clear_caches()
+
+        # Give the clone its own child lists and children, but share everything else
+        child_list_ids = set(id(child_list) for child_list in self.get_writable_child_lists())
+        excluded_list_ids = set(id(child_list) for child_list in excluded_child_lists)
+        for name, value in clone_state.items():
+            if isinstance(value, list):
+                if id(value) in child_list_ids:
+                    if id(value) in excluded_list_ids:
+                        object.__setattr__(clone, name, [])
+                    else:
+                        object.__setattr__(clone, name, [child.__clone_structure(clone, []) for child in value])
+            elif isinstance(value, DOMElement) and (value.parent is self) and (name != "parent"):
+                # Single children such as types and attached comments
+                object.__setattr__(clone, name, value.__clone_structure(clone, []))
 
-        for child_list, original_child_list in zip(self.get_child_lists(), original.get_child_lists()):
-            for child, original_child in zip(child_list, original_child_list):
-                child.__reconnect_unmodified(original_child)
+        object.__setattr__(self, "shares_data", True)
+        return clone
 
-    # This creates a clone of this element and all children, stored in the "unmodified_element" field of each
-    # corresponding element
+    # This takes a snapshot of this element and all children, so that their unmodified versions can be retrieved later
+    # via unmodified_element
+    # Nothing is actually copied at this point - each element records its original state the first time it gets
+    # modified (see prepare_for_modification()), and unmodified_element is built from those states on demand
     def save_unmodified_clones(self):
-        clone = copy.deepcopy(self)
-        self.__attach_unmodified_clones(clone)
-
-    # Attach unmodified clones to the tree recursively
-    def __attach_unmodified_clones(self, clone):
-
-        # This shouldn't really be necessary, but as a sanity check make sure we're matching (probably) the correct
-        # elements to each other
-        if str(self) != str(clone):
-            raise Exception("Unmodified clone mismatch error")
-
-        self.unmodified_element = clone
-
-        if len(self.get_child_lists()) != len(clone.get_child_lists()):
-            raise Exception("Unmodified clone mismatch error")
+        self.unmodified_source = self
+        self.unmodified_state = None
+        self.unmodified_view = None
+        for child_list in self.get_child_lists():
+            for child in child_list:
+                child.save_unmodified_clones()
+
+    # Get an attribute value as it was when the snapshot was taken
+    def __get_unmodified_value(self, name):
+        if self.unmodified_state is not None:
+            return self.unmodified_state[name]
+        return getattr(self, name)
+
+    # Get the unmodified view of this (snapshotted) element, building the unmodified tree if necessary
+    def __get_unmodified_view(self):
+        if self.unmodified_view is None:
+            # Build views for the entire original tree this element was in
+            root = self
+            while root.__get_unmodified_value("parent") is not None:
+                root = root.__get_unmodified_value("parent")
+            if root.unmodified_view is None:
+                elements = []
+                root.__create_unmodified_views(elements)
+                for element in elements:
+                    view = element.unmodified_view
+                    view.__set_attributes(DOMElement.__map_to_unmodified_views(view.__get_attributes()))
+            if self.unmodified_view is None:
+                raise Exception("Element " + str(self) + " not found in unmodified tree")
+        return self.unmodified_view
+
+    # Create (but don't fully initialise) views for this element and all of the children it originally had, adding
+    # the elements processed to elements
+    def __create_unmodified_views(self, elements):
+        if self.unmodified_state is not None:
+            state = self.unmodified_state
+        else:
+            state = self.__get_attributes()
+        view = object.__new__(type(self))
+        view_state = {}
+        for name, value in state.items():
+            if name not in self.untracked_attributes:
+                view_state[name] = value
+        view_state["unmodified_source"] = None
+        view_state["unmodified_state"] = None
+        view_state["unmodified_view"] = None
+        view_state["shares_data"] = False
+        view_state["child_positions"] = None
+        view.__set_attributes(view_state)
+        view.clear_caches()
+        self.unmodified_view = view
+        elements.append(self)
+
+        # The view's child lists are (at this point) the original child lists, so use them to find the children
+        for child_list in view.get_child_lists():
+            for child in child_list:
+                if (child.unmodified_source is child) and (child.unmodified_view is None):
+                    child.__create_unmodified_views(elements)
 
-        for child_list, clone_child_list in zip(self.get_child_lists(), clone.get_child_lists()):
-            if len(child_list) != len(clone_child_list):
-                raise Exception("Unmodified clone mismatch error")
+    # Take a dictionary of attribute values and return a copy with any references to snapshotted elements replaced
+    # with their unmodified views (lists and tokens that don't need to be changed are shared rather than copied)
+    @staticmethod
+    def __map_to_unmodified_views(state):
+        result = {}
+        for name, value in state.items():
+            result[name] = DOMElement.__map_value_to_unmodified_views(value)
+        return result
 
-            for child, clone_child in zip(child_list, clone_child_list):
-                child.__attach_unmodified_clones(clone_child)
+    # Map a single value for __map_to_unmodified_views()
+    @staticmethod
+    def __map_value_to_unmodified_views(value):
+        if isinstance(value, DOMElement):
+            if (value.unmodified_source is value) and (value.unmodified_view is not None):
+                return value.unmodified_view
+            return value
+        if isinstance(value, list):
+            mapped = [DOMElement.__map_value_to_unmodified_views(item) for item in value]
+            for item, mapped_item in zip(value, mapped):
+                if item is not mapped_item:
+                    return mapped
+            return value
+        return value
 
     # Is this element a preprocessor container (#if or similar)?
     def __is_preprocessor_container(self):
@@ -368,14 +923,15 @@ class DOMElement:
     # (so in other words, what the C compiler would consider children, after preprocessing has been done)
     def list_directly_contained_children(self):
         result = []
-        for child_list in self.get_child_lists():
-            for child in child_list:
-                if child.__is_preprocessor_container():
-                    # Recurse into preprocessor containers
-                    for container_child in child.list_directly_contained_children():
-                        result.append(container_child)
-                else:
-                    result.append(child)
+        pending = [self]
+        while len(pending) > 0:
+            element = pending.pop()
+            if (element is self) or element.__is_preprocessor_container():
+                # Look inside preprocessor containers (reversed so that the children get popped in order)
+                for child_list in reversed(element.get_child_lists()):
+                    pending.extend(reversed(child_list))
+            else:
+                result.append(element)
         return result
 
     # Get a list of all directly contained children that match the type supplied
@@ -392,46 +948,44 @@ class DOMElement:
     # Replace the direct child element given with one or more new children
     # Removes the child from any previous parent
     def replace_child(self, old_child, new_children):
+        position = self.find_child_position(old_child)
+        if position is None:
+            raise Exception("Unable to find child to replace")
         old_child.parent = None
-        new_children.reverse()  # We're going to insert in backwards order
-        for child_list in self.get_child_lists():
-            for i in range(0, len(child_list)):
-                if child_list[i] == old_child:
-                    child_list.remove(old_child)
-                    for new_child in new_children:
-                        if new_child.parent is not None:
-                            new_child.parent.remove_child(new_child)
-                        child_list.insert(i, new_child)
-                        new_child.parent = self
-                    return
-        raise Exception("Unable to find child to replace")
+        child_list, index = position
+        self.prepare_for_modification()
+        del child_list[index]
+        self.__insert_children_at(child_list, index, new_children)
+        self.notify_children_changed([old_child] + new_children)
 
     # Insert children before the direct child element given
     # Removes the children from any previous parent
     def insert_before_child(self, existing_child, new_children):
-        new_children.reverse()  # We're going to insert in backwards order
-        for child_list in self.get_child_lists():
-            for i in range(0, len(child_list)):
-                if child_list[i] == existing_child:
-                    for new_child in new_children:
-                        if new_child.parent is not None:
-                            new_child.parent.remove_child(new_child)
-                        child_list.insert(i, new_child)
-                        new_child.parent = self
-                    return
-        raise Exception("Unable to find child to insert after")
+        position = self.find_child_position(existing_child)
+        if position is None:
+            raise Exception("Unable to find child to insert after")
+        child_list, index = position
+        self.__insert_children_at(child_list, index, new_children)
+        self.notify_children_changed(new_children)
 
     # Insert children after the direct child element given
     # Removes the children from any previous parent
     def insert_after_child(self, existing_child, new_children):
+        position = self.find_child_position(existing_child)
+        if position is None:
+            raise Exception("Unable to find child to insert after")
+        child_list, index = position
+        self.__insert_children_at(child_list, index + 1, new_children)
+        self.notify_children_changed(new_children)
+
+    # Insert children into one of our child lists at the index given, removing them from any previous parent
+    def __insert_children_at(self, child_list, index, new_children):
+        self.prepare_for_modification()
         new_children.reverse()  # We're going to insert in backwards order
-        for child_list in self.get_child_lists():
-            for i in range(0, len(child_list)):
-                if child_list[i] == existing_child:
-                    for new_child in new_children:
-                        if new_child.parent is not None:
-                            new_child.parent.remove_child(new_child)
-                        child_list.insert(i + 1, new_child)
-                        new_child.parent = self
-                    return
-        raise Exception("Unable to find child to insert after")
+        for new_child in new_children:
+            if new_child.parent is not None:
+                new_child.parent.remove_child(new_child)
+            child_list.insert(index, new_child)
+            new_child.parent = self
+            if self.child_positions is not None:
+                self.child_positions[new_child] = (child_list, index)
@@ -4,9 +4,13 @@ from src import code_dom
 
 # An enum
 class DOMEnum(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'is_enum_class', 'is_forward_declaration', 'emit_as_anonymous_for_c',
+                 'storage_type', 'is_flags_enum')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.is_enum_class = False
         self.is_forward_declaration = False
         self.emit_as_anonymous_for_c = False  # If this is true, then the enum will be emitted as anonymous in C
@@ -82,7 +86,7 @@ class DOMEnum(code_dom.element.DOMElement):
         else:
             return None
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.is_enum_class:
             # Namespaced "enum class" enum
             name = self.name
@@ -4,9 +4,12 @@ from src import code_dom
 
 # A single element within an enum
 class DOMEnumElement(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'value_tokens', 'value_alignment', 'value', 'is_count')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.value_tokens = None
         self.value_alignment = 0  # Column to align values to (for aesthetic purposes)
         self.value = None  # Evaluated actual value (if known)
@@ -59,7 +62,7 @@ class DOMEnumElement(code_dom.element.DOMElement):
         stream.get_token_of_type(['COMMA'])  # Eat any trailing comma
         return dom_element
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(self.name, include_leading_colons)
         else:
@@ -76,16 +79,17 @@ class DOMEnumElement(code_dom.element.DOMElement):
     # Write this element out as C code
     def write_to_c(self, file, indent=0, context=WriteContext()):
         self.write_preceding_comments(file, indent, context)
+        write_c_line(file, indent, self.add_attached_comment_to_line(self.get_c_line(context)))
+
+    def get_c_line(self, context=WriteContext()):
         if self.value_tokens is not None:
             # Generate padded version of name to align value
             name_padded = self.name
             if self.value_alignment > len(self.name):
                 name_padded = name_padded + (" " * (self.value_alignment - len(self.name)))
-            write_c_line(file, indent, self.add_attached_comment_to_line(name_padded + " = " +
-                                                                         collapse_tokens_to_string(self.value_tokens) +
-                                                                         ","))
+            return name_padded + " = " + collapse_tokens_to_string(self.value_tokens) + ","
         else:
-            write_c_line(file, indent, self.add_attached_comment_to_line(self.name + ","))
+            return self.name + ","
 
     def __str__(self):
         if self.value_tokens is None:
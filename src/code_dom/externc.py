@@ -4,6 +4,8 @@ from src import code_dom
 
 # An "extern C" statement
 class DOMExternC(code_dom.element.DOMElement):
+    __slots__ = ('is_cpp_guarded',)
+
     def __init__(self):
         super().__init__()
         self.is_cpp_guarded = False  # Is this extern block surrounded with an implicit #ifdef __cplusplus guard?
@@ -40,7 +42,7 @@ class DOMExternC(code_dom.element.DOMElement):
                 if not child_element.no_default_add:
                     dom_element.add_child(child_element, context)
             else:
-                print("Unrecognised element: " + str(vars(tok)))
+                print("Unrecognised element: " + str(tok))
                 break
 
             if not has_braces:
@@ -4,10 +4,14 @@ from src import code_dom
 
 # A field declaration
 class DOMFieldDeclaration(code_dom.element.DOMElement):
+    __slots__ = ('field_type', 'names', 'old_names', 'is_static', 'is_extern', 'is_anonymous', 'is_array',
+                 'width_specifiers', 'array_bounds_tokens', 'is_imgui_api', 'name_alignment')
+
     def __init__(self):
         super().__init__()
         self.field_type = None
         self.names = []
+        self.old_names = None  # The names this field had before being prefixed by mod_flatten_namespaces
         self.is_static = False
         self.is_extern = False
         self.is_anonymous = False  # True if the field is anonymous (an implicit field for a nested type declaration)
@@ -15,7 +19,6 @@ class DOMFieldDeclaration(code_dom.element.DOMElement):
         self.width_specifiers = []  # One per name
         self.array_bounds_tokens = []  # One list of tokens per name
         self.is_imgui_api = False  # Does this use IMGUI_API?
-        self.accessibility = None  # The field accessibility
         self.name_alignment = 0  # Column to align name to (for aesthetic purposes)
 
     # Parse tokens from the token stream given
@@ -117,15 +120,15 @@ class DOMFieldDeclaration(code_dom.element.DOMElement):
     def get_writable_child_lists(self):
         return code_dom.element.DOMElement.get_writable_child_lists(self)
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(self.names[0] if len(self.names) > 0 else leaf_name,
                                                         include_leading_colons)
         else:
             return self.names[0] if len(self.names) > 0 else leaf_name
 
-    # Get the initial (pre-name) part of the declaration. This is a separate function because
-    # mod_align_structure_field_names needs it
+    # Get the initial (pre-name) part of the declaration. This is a separate function because the layout code needs it
+    # to align field names
     def get_prefix_and_type(self, context):
         declaration = self.field_type.to_c_string(context)
 
@@ -144,9 +147,7 @@ class DOMFieldDeclaration(code_dom.element.DOMElement):
 
         return declaration
 
-    # Write this element out as C code
-    def write_to_c(self, file, indent=0, context=WriteContext()):
-        self.write_preceding_comments(file, indent, context)
+    def get_c_line(self, context=WriteContext()):
         declaration = self.get_prefix_and_type(context)
 
         # Function pointers have the name/etc included
@@ -171,7 +172,12 @@ class DOMFieldDeclaration(code_dom.element.DOMElement):
                     declaration += " : " + str(self.width_specifiers[i])
                 first_name = False
 
-        write_c_line(file, indent, self.add_attached_comment_to_line(declaration + ";"))
+        return declaration + ";"
+
+    # Write this element out as C code
+    def write_to_c(self, file, indent=0, context=WriteContext()):
+        self.write_preceding_comments(file, indent, context)
+        write_c_line(file, indent, self.add_attached_comment_to_line(self.get_c_line(context)))
 
     def __str__(self):
         result = "Field: Type=" + str(self.field_type) + " Names="
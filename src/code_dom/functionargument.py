@@ -4,10 +4,14 @@ from src import code_dom
 
 # A single function argument
 class DOMFunctionArgument(code_dom.element.DOMElement):
+    __slots__ = ('arg_type', 'name', 'old_name', 'default_value_tokens', 'is_varargs', 'is_array', 'array_bounds',
+                 'is_implicit_default', 'is_instance_pointer')
+
     def __init__(self):
         super().__init__()
         self.arg_type = None
         self.name = None  # May be none as arguments can be unnamed
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.default_value_tokens = None
         self.is_varargs = False
         self.is_array = False
@@ -19,6 +23,12 @@ class DOMFunctionArgument(code_dom.element.DOMElement):
     # Parse tokens from the token stream given
     @staticmethod
     def parse(context, stream):
+        return parse_memoized(context, stream, DOMFunctionArgument,
+                              lambda: DOMFunctionArgument.parse_without_memo(context, stream))
+
+    # Parse tokens from the token stream given, bypassing the parse memo
+    @staticmethod
+    def parse_without_memo(context, stream):
         checkpoint = stream.get_checkpoint()
         dom_element = DOMFunctionArgument()
 
@@ -96,7 +106,7 @@ class DOMFunctionArgument(code_dom.element.DOMElement):
     def get_writable_child_lists(self):
         return code_dom.DOMElement.get_writable_child_lists(self)
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(self.name, include_leading_colons)
         else:
@@ -4,9 +4,16 @@ from src import code_dom
 
 # A function declaration
 class DOMFunctionDeclaration(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'return_type', 'arguments', 'initialiser_list_tokens', 'body', 'is_const',
+                 'is_constexpr', 'is_static', 'is_inline', 'is_operator', 'is_constructor', 'is_by_value_constructor',
+                 'is_destructor', 'is_imgui_api', 'im_fmtargs', 'im_fmtlist', 'original_class',
+                 'is_default_argument_helper', 'is_manual_helper', 'has_imstr_helper', 'is_imstr_helper',
+                 'function_name_alignment')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.return_type = None
         self.arguments = []
         self.initialiser_list_tokens = None  # List of tokens making up the initialiser list if one exists
@@ -22,7 +29,6 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
         self.is_imgui_api = False
         self.im_fmtargs = None
         self.im_fmtlist = None
-        self.accessibility = None  # The function accessibility (if part of a class)
         self.original_class = None  # The class this function belonged to pre-flattening
         #                             (set when functions are flattened)
         self.is_default_argument_helper = False  # Set if this is an autogenerated function with arguments defaulted
@@ -229,6 +235,10 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
 
     def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False,
                                  return_fqn_even_for_member_functions=False):
+        return self.get_cached_fully_qualified_name((leaf_name, include_leading_colons,
+                                                     return_fqn_even_for_member_functions))
+
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons, return_fqn_even_for_member_functions):
         if self.parent is not None:
             # When referring to non-static class member functions we use the leaf name (as the class name is supplied
             # by the instance)
@@ -241,15 +251,19 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
 
     # Add a new argument to this element
     def add_argument(self, child):
+        self.prepare_for_modification()
         child.parent = self
         self.arguments.append(child)
+        self.notify_children_changed([child])
 
     # Remove an argument from this element
     def remove_argument(self, child):
         if child.parent is not self:
             raise Exception("Attempt to remove argument from element other than parent")
+        self.prepare_for_modification()
         self.arguments.remove(child)
         child.parent = None
+        self.notify_children_changed([child])
 
     def get_child_lists(self):
         lists = code_dom.element.DOMElement.get_child_lists(self)
@@ -263,17 +277,8 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
         lists.append(self.arguments)
         return lists
 
-    def clone(self):
-        # We don't want to clone the original class, but just keep a shallow reference to it
-        old_original_class = self.original_class
-        self.original_class = None
-        clone = code_dom.element.DOMElement.clone(self)
-        self.original_class = old_original_class
-        clone.original_class = old_original_class
-        return clone
-
     # Get the prefixes and return type for this function
-    # This is a separate function largely because mod_align_function_names needs it
+    # This is a separate function largely because the layout code needs it to align function names
     def get_prefixes_and_return_type(self, context=WriteContext()):
         declaration = ""
         if self.is_imgui_api:
@@ -292,9 +297,8 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
             declaration += self.return_type.to_c_string(context) + " "
         return declaration
 
-    # Write this element out as C code
-    def write_to_c(self, file, indent=0, context=WriteContext()):
-        self.write_preceding_comments(file, indent, context)
+    # Get the declaration of this function (without the trailing ; or any comments)
+    def get_declaration(self, context=WriteContext()):
         declaration = self.get_prefixes_and_return_type(context)
 
         # Pad declaration to align name
@@ -328,6 +332,19 @@ class DOMFunctionDeclaration(code_dom.element.DOMElement):
                 declaration += " IM_FMTARGS(" + self.im_fmtargs + ")"
             if self.im_fmtlist is not None:
                 declaration += " IM_FMTLIST(" + self.im_fmtlist + ")"
+        return declaration
+
+    def get_c_line(self, context=WriteContext()):
+        if context.for_implementation:
+            return self.get_declaration(context)
+        if self.body is not None:
+            return None  # The body gets written on subsequent lines
+        return self.get_declaration(context) + ";"
+
+    # Write this element out as C code
+    def write_to_c(self, file, indent=0, context=WriteContext()):
+        self.write_preceding_comments(file, indent, context)
+        declaration = self.get_declaration(context)
 
         if context.for_implementation:
             write_c_line(file, indent, declaration)
@@ -4,9 +4,12 @@ from src import code_dom
 
 # A function pointer type
 class DOMFunctionPointerType(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'return_type', 'arguments', 'is_cdecl')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.return_type = None
         self.arguments = []
         self.is_cdecl = False
@@ -14,6 +17,12 @@ class DOMFunctionPointerType(code_dom.element.DOMElement):
     # Parse tokens from the token stream given
     @staticmethod
     def parse(context, stream):
+        return parse_memoized(context, stream, DOMFunctionPointerType,
+                              lambda: DOMFunctionPointerType.parse_without_memo(context, stream))
+
+    # Parse tokens from the token stream given, bypassing the parse memo
+    @staticmethod
+    def parse_without_memo(context, stream):
         checkpoint = stream.get_checkpoint()
         dom_element = DOMFunctionPointerType()
 
@@ -95,7 +104,7 @@ class DOMFunctionPointerType(code_dom.element.DOMElement):
         lists.append(self.arguments)
         return lists
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(self.name, include_leading_colons)
         else:
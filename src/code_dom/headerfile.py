@@ -4,9 +4,12 @@ from src import code_dom
 
 # A single header file
 class DOMHeaderFile(code_dom.element.DOMElement):
+    __slots__ = ('source_filename', 'dest_filename')
+
     def __init__(self):
         super().__init__()
         self.source_filename = None  # The filename this header came from
+        self.dest_filename = None  # The filename this header is being written to (if known)
 
     # Parse tokens from the token stream given
     @staticmethod
@@ -4,8 +4,60 @@ from src import code_dom
 
 # A collection of header files
 class DOMHeaderFileSet(code_dom.element.DOMElement):
+    __slots__ = ('element_index',)
+
+    untracked_attributes = code_dom.element.DOMElement.untracked_attributes | frozenset(['element_index'])
+
     def __init__(self):
         super().__init__()
+        self.element_index = {}  # Lists of all the elements of a given type in the set (in document order), indexed
+        #                          by type - these are built on demand, and discarded whenever an element of that type
+        #                          is added/removed/moved
+
+    # Find all the children of this element that match the type supplied, using (and populating) the element index
+    # to avoid walking the entire tree each time
+    def list_all_children_of_type(self, element_type):
+        elements = self.element_index.get(element_type)
+        if elements is None:
+            elements = super().list_all_children_of_type(element_type)
+            self.element_index[element_type] = elements
+        # Return a copy as the caller may well modify the tree (and thus the index) whilst iterating over the result
+        return elements.copy()
+
+    # Iterate over matching elements using the element index if it has an entry for the type requested, or walk the
+    # tree (without populating the index, as the caller may not need everything) otherwise
+    # (see DOMElement.iter_descendants())
+    def iter_descendants(self, element_type=None, predicate=None, prune=None):
+        elements = self.element_index.get(element_type) if (element_type is not None) and (prune is None) else None
+        if elements is None:
+            return super().iter_descendants(element_type, predicate, prune)
+        if predicate is None:
+            return iter(elements.copy())
+        return filter(predicate, elements.copy())
+
+    # Discard the index entries for any types that the changed elements (or their children) are instances of
+    def on_descendants_changed(self, elements):
+        if len(self.element_index) == 0:
+            return
+        changed_types = set()
+        for element in elements:
+            for child in element.iter_descendants():
+                changed_types.add(type(child))
+        for element_type in list(self.element_index.keys()):
+            for changed_type in changed_types:
+                if issubclass(changed_type, element_type):
+                    del self.element_index[element_type]
+                    break
+
+    def clear_caches(self):
+        super().clear_caches()
+        self.element_index = {}
+
+    # Don't clone or pickle the element index, as it refers to the elements in this tree rather than the copy
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["element_index"] = {}
+        return state
 
     # Write this element out as C code
     def write_to_c(self, file, indent=0, context=WriteContext()):
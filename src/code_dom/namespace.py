@@ -4,9 +4,12 @@ from src import code_dom
 
 # Namespace
 class DOMNamespace(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
 
     # Parse tokens from the token stream given
     @staticmethod
@@ -44,12 +47,12 @@ class DOMNamespace(code_dom.element.DOMElement):
                 if not child_element.no_default_add:
                     dom_element.add_child(child_element, context)
             else:
-                print("Unrecognised element: " + str(vars(tok)))
+                print("Unrecognised element: " + str(tok))
                 break
 
         return dom_element
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         name = self.name
         if leaf_name != "":
             name += "::" + leaf_name
@@ -1,9 +1,18 @@
 from .common import *
 from src import code_dom
+from src import preprocessor_conditions
 
 
 # A #if or #ifdef block (or #elif inside one)
 class DOMPreprocessorIf(code_dom.element.DOMElement):
+    __slots__ = ('is_ifdef', 'is_elif', 'is_negated', 'is_include_guard', 'expression_tokens', 'else_children',
+                 'condition_cache')
+
+    untracked_attributes = code_dom.element.DOMElement.untracked_attributes | frozenset(['condition_cache'])
+
+    # Attributes our condition depends on
+    condition_attributes = frozenset(['is_ifdef', 'is_negated', 'expression_tokens'])
+
     def __init__(self):
         super().__init__()
         self.is_ifdef = False
@@ -12,6 +21,29 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
         self.is_include_guard = False  # Set externally, indicates if this was an added include guard
         self.expression_tokens = []
         self.else_children = []
+        self.condition_cache = None  # Cached result of get_condition() - this is discarded whenever our condition
+        #                              changes or we are prepared for modification
+
+    # Discard our cached condition if anything it depends on changes
+    def __setattr__(self, name, value):
+        if name in self.condition_attributes:
+            object.__setattr__(self, 'condition_cache', None)
+        super().__setattr__(name, value)
+
+    # Discard our cached condition, as our expression tokens may be about to be modified
+    def prepare_for_modification(self):
+        self.condition_cache = None
+        super().prepare_for_modification()
+
+    def clear_caches(self):
+        super().clear_caches()
+        self.condition_cache = None
+
+    # Don't clone or pickle our cached condition
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["condition_cache"] = None
+        return state
 
     # Parse tokens from the token stream given
     @staticmethod
@@ -87,26 +119,24 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
                (self.is_elif == other.is_elif) and \
                (self.is_negated == other.is_negated)
 
-    # Returns true if this is mutually exclusive with another condition
-    # (i.e. it is impossible for both to be active at the same time)
-    # Note that this currently only detects #ifdef/#ifndef pairs, not more complex expressions, nor does it check for
-    # the effect of being in the else-side of a conditional
-    def condition_is_mutually_exclusive(self, other):
-        return (self.get_expression() == other.get_expression()) and \
-               (self.is_ifdef == other.is_ifdef) and \
-               (self.is_elif == other.is_elif) and \
-               (self.is_negated != other.is_negated)
-
     # Returns true if the element given is part of our else block
-    # (see utils.is_in_else_clause for a version of this that works for non-direct-children)
+    # (this works for any descendant, and returns false for elements that are not inside us at all)
     def is_element_in_else_block(self, element):
-        if element in self.else_children:
-            return True
-        if element in self.children:
-            return False
-        if element.parent is None:
-            return False
-        return self.is_element_in_else_block(element.parent)
+        return element.get_conditional_context().is_in_else_block_of(self)
+
+    # Children in our else block are in the negated version of our condition, everything else (including comments)
+    # is in the normal version
+    def get_conditional_context_for_child(self, context, child):
+        position = self.find_child_position(child)
+        is_in_else_block = (position is not None) and (position[0] is self.else_children)
+        return context.extend(self, is_in_else_block)
+
+    # Get our condition in canonical form (see preprocessor_conditions), which is true when our primary children are
+    # compiled
+    def get_condition(self):
+        if self.condition_cache is None:
+            self.condition_cache = preprocessor_conditions.get_conditional_node(self)
+        return self.condition_cache
 
     # Get the expression used as a string
     def get_expression(self):
@@ -150,8 +180,10 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
 
     # Add a new child to the else list of this element, optionally setting the last element information in the context
     def add_child_to_else(self, child, context=None):
+        self.prepare_for_modification()
         child.parent = self
         self.else_children.append(child)
+        self.notify_children_changed([child])
         if context is not None:
             context.last_element = child
 
@@ -159,8 +191,10 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
     def remove_child_from_else(self, child):
         if child.parent is not self:
             raise Exception("Attempt to remove child from element other than parent")
+        self.prepare_for_modification()
         self.else_children.remove(child)
         child.parent = None
+        self.notify_children_changed([child])
 
     def __is_preprocessor_container(self):
         return True
@@ -175,12 +209,10 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
         lists.append(self.else_children)
         return lists
 
-    def clone_without_children(self):
-        temp_else_children = self.else_children
-        self.else_children = []
-        clone = code_dom.element.DOMElement.clone_without_children(self)
-        self.else_children = temp_else_children
-        return clone
+    def get_explicit_child_lists(self):
+        lists = code_dom.element.DOMElement.get_explicit_child_lists(self)
+        lists.append(self.else_children)
+        return lists
 
     def __str__(self):
         if self.is_ifdef:
@@ -191,13 +223,11 @@ class DOMPreprocessorIf(code_dom.element.DOMElement):
         else:
             return "If: " + collapse_tokens_to_string(self.expression_tokens)
 
-    # Dump this element for debugging
-    def dump(self, indent=0):
-        print("".ljust(indent * 4) + str(self))
-        print("".ljust((indent + 1) * 4) + "If-block:")
-        for child in self.children:
-            child.dump(indent + 2)
+    # Get the children to show under this element when dumping it (see DOMElement.dump())
+    def get_dump_children(self, indent):
+        result = [("If-block:", indent + 1)]
+        result.extend((child, indent + 2) for child in self.children)
         if len(self.else_children) > 0:
-            print("".ljust((indent + 1) * 4) + "Else-block:")
-            for child in self.else_children:
-                child.dump(indent + 2)
+            result.append(("Else-block:", indent + 1))
+            result.extend((child, indent + 2) for child in self.else_children)
+        return result
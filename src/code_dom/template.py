@@ -4,6 +4,8 @@ from src import code_dom
 
 # A C++ template
 class DOMTemplate(code_dom.element.DOMElement):
+    __slots__ = ('template_parameter_tokens',)
+
     def __init__(self):
         super().__init__()
         self.template_parameter_tokens = []
@@ -1,16 +1,52 @@
 from .common import *
 from src import code_dom
-import copy
+
+# Names of built-in types, which the lexer treats as normal identifiers but which can't be qualified with leading colons
+builtin_type_names = frozenset(['void', 'bool', 'char', 'short', 'int', 'long', 'float', 'double', 'signed', 'unsigned',
+                                'wchar_t', 'size_t'])
 
 
 # A type, represented by a sequence of tokens that define it
 class DOMType(code_dom.element.DOMElement):
+    __slots__ = ('c_string_cache',)
+
+    untracked_attributes = code_dom.element.DOMElement.untracked_attributes | frozenset(['c_string_cache'])
+
     def __init__(self):
         super().__init__()
+        self.c_string_cache = None  # Strings generated by to_c_string(), indexed by the relevant WriteContext flags -
+        #                             this is discarded whenever our tokens are replaced or prepared for modification
+
+    # Discard our cached strings if our tokens get replaced
+    def __setattr__(self, name, value):
+        if name == 'tokens':
+            object.__setattr__(self, 'c_string_cache', None)
+        super().__setattr__(name, value)
+
+    # Discard our cached strings, as our tokens are about to be modified
+    def prepare_for_modification(self):
+        self.c_string_cache = None
+        super().prepare_for_modification()
+
+    def clear_caches(self):
+        super().clear_caches()
+        self.c_string_cache = None
+
+    # Don't clone or pickle cached strings
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["c_string_cache"] = None
+        return state
 
     # Parse tokens from the token stream given
     @staticmethod
     def parse(context, stream, allow_function_pointer=True):
+        return parse_memoized(context, stream, (DOMType, allow_function_pointer),
+                              lambda: DOMType.parse_without_memo(context, stream, allow_function_pointer))
+
+    # Parse tokens from the token stream given, bypassing the parse memo
+    @staticmethod
+    def parse_without_memo(context, stream, allow_function_pointer):
 
         if allow_function_pointer:
             # Types may be a function pointer, so check for that first
@@ -19,7 +55,11 @@ class DOMType(code_dom.element.DOMElement):
             if dom_element is not None:
                 return dom_element
 
-        # If it wasn't a function pointer, it's probably a normal type
+            # If it wasn't a function pointer, it's probably a normal type
+            # (the function pointer parser will have already tried parsing one here as the return type, so this is
+            # typically satisfied from the parse memo)
+
+            return DOMType.parse(context, stream, allow_function_pointer=False)
 
         checkpoint = stream.get_checkpoint()
         dom_element = DOMType()
@@ -126,6 +166,7 @@ class DOMType(code_dom.element.DOMElement):
         return primary_name
 
     # Gets the fully-qualified name (C++-style) of this element (including namespaces/etc)
+    # (this isn't cached, as it comes from our tokens, which get modified in-place)
     def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
         context = WriteContext()
         context.include_leading_colons = include_leading_colons
@@ -139,29 +180,31 @@ class DOMType(code_dom.element.DOMElement):
             elif self.unmodified_element is not None:
                 return self.unmodified_element.to_c_string(context)
 
-        tokens_to_emit = self.tokens
-
-        if context.mark_non_nullable_pointers:
-            # Change any non-nullable pointers to ^s
-            fudged_tokens = []
-            for tok in tokens_to_emit:
-                new_tok = copy.deepcopy(tok)
-                if (new_tok.value == '*') and (hasattr(new_tok, 'nullable')) and (not new_tok.nullable):
-                    new_tok.value = "^"
-                fudged_tokens.append(new_tok)
-            tokens_to_emit = fudged_tokens
-
-        if context.include_leading_colons:
-            # Add leading colons to anything that looks like a user type
-            fudged_tokens = []
-            for tok in tokens_to_emit:
-                new_tok = copy.deepcopy(tok)
-                if new_tok.type == 'THING':
-                    new_tok.value = "::" + new_tok.value
-                fudged_tokens.append(new_tok)
-            tokens_to_emit = fudged_tokens
-
-        return collapse_tokens_to_string(tokens_to_emit)
+        cache_key = (context.mark_non_nullable_pointers, context.include_leading_colons)
+        if self.c_string_cache is None:
+            self.c_string_cache = {}
+        else:
+            result = self.c_string_cache.get(cache_key)
+            if result is not None:
+                return result
+
+        values_to_emit = []
+        previous_tok = None
+        for tok in self.tokens:
+            value = tok.value
+            if context.mark_non_nullable_pointers and (value == '*') and (tok.nullable is False):
+                # Change any non-nullable pointers to ^s
+                value = "^"
+            if context.include_leading_colons and (tok.type == 'THING') and (value not in builtin_type_names) and \
+                    ((previous_tok is None) or (previous_tok.type != 'COLON')):
+                # Add leading colons to anything that looks like a user type (and isn't already qualified)
+                value = "::" + value
+            values_to_emit.append(value)
+            previous_tok = tok
+
+        result = collapse_token_values_to_string(values_to_emit)
+        self.c_string_cache[cache_key] = result
+        return result
 
     def __str__(self):
         result = "Type: " + collapse_tokens_to_string(self.tokens)
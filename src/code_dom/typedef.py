@@ -4,9 +4,12 @@ from src import code_dom
 
 # A typedef statement
 class DOMTypedef(code_dom.element.DOMElement):
+    __slots__ = ('name', 'old_name', 'type')
+
     def __init__(self):
         super().__init__()
         self.name = None
+        self.old_name = None  # The name this element had before being prefixed by mod_flatten_namespaces
         self.type = None
 
     # Parse tokens from the token stream given
@@ -48,7 +51,7 @@ class DOMTypedef(code_dom.element.DOMElement):
     def get_writable_child_lists(self):
         return code_dom.element.DOMElement.get_writable_child_lists(self)
 
-    def get_fully_qualified_name(self, leaf_name="", include_leading_colons=False):
+    def build_fully_qualified_name(self, leaf_name, include_leading_colons):
         if self.parent is not None:
             return self.parent.get_fully_qualified_name(self.name, include_leading_colons)
         else:
@@ -57,13 +60,14 @@ class DOMTypedef(code_dom.element.DOMElement):
     # Write this element out as C code
     def write_to_c(self, file, indent=0, context=WriteContext()):
         self.write_preceding_comments(file, indent, context)
+        write_c_line(file, indent, self.add_attached_comment_to_line(self.get_c_line(context)))
 
+    def get_c_line(self, context=WriteContext()):
         # Function pointers have the name/etc included
         if isinstance(self.type, code_dom.functionpointertype.DOMFunctionPointerType):
-            write_c_line(file, indent, self.add_attached_comment_to_line("typedef " + self.type.to_c_string() + ";"))
+            return "typedef " + self.type.to_c_string() + ";"
         else:
-            write_c_line(file, indent, self.add_attached_comment_to_line("typedef " + self.type.to_c_string() +
-                                                                         " " + self.name + ";"))
+            return "typedef " + self.type.to_c_string() + " " + self.name + ";"
 
     def __str__(self):
         return "Typedef: " + self.name + " type=" + str(self.type)
@@ -4,6 +4,8 @@ from src import code_dom
 
 # An #undef statement
 class DOMUndef(code_dom.element.DOMElement):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -8,22 +8,31 @@ from src.code_dom.common import write_c_line
 class ConditionalGenerator:
     def __init__(self):
         self.current_conditionals = []  # The current stack of preprocessor conditionals we have emitted
+        self.current_context = None  # The conditional context of the element we last wrote conditionals for
 
     # Write the conditionals necessary to bring us to the state needed by element
     def write_conditionals(self, element, file, indent=0):
-        wanted_conditionals = utils.get_preprocessor_conditionals(element)
+        # Conditional contexts are interned, so if this element is in the same one as the last there is nothing to do
+        # (which is the case most of the time)
+        context = utils.get_preprocessor_conditional_context(element)
+        if context is self.current_context:
+            return
+        self.current_context = context
 
-        # Remove the include guard from our list of conditionals
-        for i in range(0, len(wanted_conditionals)):
-            if wanted_conditionals[i].is_include_guard:
-                del wanted_conditionals[i]
-                break
+        wanted_conditionals = []
+        skipped_include_guard = False
+        for conditional, is_in_else_block in context.entries:
+            # Remove the include guard from our list of conditionals
+            if conditional.is_include_guard and not skipped_include_guard:
+                skipped_include_guard = True
+                continue
 
-        # Convert any cases where the element is in an else block into an inverted conditional
-        for i in range(0, len(wanted_conditionals)):
-            if utils.is_in_else_clause(element, wanted_conditionals[i]):
-                wanted_conditionals[i] = wanted_conditionals[i].clone()
-                wanted_conditionals[i].is_negated = not wanted_conditionals[i].is_negated
+            # Convert any cases where the element is in an else block into an inverted conditional
+            if is_in_else_block:
+                conditional = conditional.clone_without_children()
+                conditional.is_negated = not conditional.is_negated
+
+            wanted_conditionals.append(conditional)
 
         # Close any unwanted conditionals
         first_endif = True
@@ -57,4 +66,5 @@ class ConditionalGenerator:
             conditional = self.current_conditionals.pop(len(self.current_conditionals) - 1)
             write_c_line(file, indent, "#endif // " + conditional.get_opening_clause())
         self.current_conditionals = []
+        self.current_context = None
 
@@ -0,0 +1,415 @@
+# This implements evaluation of C constant expressions (enum values, #define contents and the like) from their tokens
+# Supported are integer, floating-point and character literals, the usual unary, binary and ternary operators, casts to
+# integer types and references to named values (such as enum elements) supplied by the caller
+# Integer arithmetic is performed at arbitrary precision, except where a cast to a fixed-size type is made
+
+# Integer types we understand casts to, as (size in bits, is signed)
+integer_types = {
+    'char': (8, True),
+    'signed char': (8, True),
+    'unsigned char': (8, False),
+    'short': (16, True),
+    'unsigned short': (16, False),
+    'int': (32, True),
+    'signed': (32, True),
+    'signed int': (32, True),
+    'unsigned': (32, False),
+    'unsigned int': (32, False),
+    'long long': (64, True),
+    'unsigned long long': (64, False),
+    'ImS8': (8, True),
+    'ImU8': (8, False),
+    'ImS16': (16, True),
+    'ImU16': (16, False),
+    'ImS32': (32, True),
+    'ImU32': (32, False),
+    'ImS64': (64, True),
+    'ImU64': (64, False),
+    'int8_t': (8, True),
+    'uint8_t': (8, False),
+    'int16_t': (16, True),
+    'uint16_t': (16, False),
+    'int32_t': (32, True),
+    'uint32_t': (32, False),
+    'int64_t': (64, True),
+    'uint64_t': (64, False),
+}
+
+# Token types that can form part of a type name in a cast
+type_name_token_types = {'THING', 'KEYWORD', 'SIGNED', 'UNSIGNED'}
+
+# Pairs of adjacent tokens that make up a single two-character operator
+combined_operators = {
+    ('<', '<'): '<<',
+    ('>', '>'): '>>',
+    ('<', '='): '<=',
+    ('>', '='): '>=',
+    ('=', '='): '==',
+    ('!', '='): '!=',
+}
+
+# Binary operators, along with their precedence (higher binds more tightly)
+binary_operators = {
+    '||': 1,
+    '&&': 2,
+    '|': 3,
+    '^': 4,
+    '&': 5,
+    '==': 6,
+    '!=': 6,
+    '<': 7,
+    '<=': 7,
+    '>': 7,
+    '>=': 7,
+    '<<': 8,
+    '>>': 8,
+    '+': 9,
+    '-': 9,
+    '*': 10,
+    '/': 10,
+    '%': 10,
+}
+
+# Escape sequences allowed in character literals
+character_escapes = {
+    'n': 10,
+    't': 9,
+    'r': 13,
+    '0': 0,
+    'a': 7,
+    'b': 8,
+    'f': 12,
+    'v': 11,
+    '\\': 92,
+    '\'': 39,
+    '"': 34,
+    '?': 63,
+}
+
+
+# Parse the text of an integer literal, returning None if it isn't one
+def parse_integer_literal(text):
+    text = text.rstrip('uUlL')
+    try:
+        if text.startswith(('0x', '0X')):
+            return int(text[2:], 16)
+        if (len(text) > 1) and text.startswith('0'):
+            return int(text[1:], 8)
+        return int(text)
+    except ValueError:
+        return None
+
+
+# Parse the text of a floating-point literal, returning None if it isn't one
+def parse_float_literal(text):
+    try:
+        return float(text.rstrip('fFlL'))
+    except ValueError:
+        return None
+
+
+# Parse the text of a character literal, returning None if it isn't one we understand
+def parse_character_literal(text):
+    content = text[1:-1]
+    if len(content) == 1:
+        return ord(content)
+    if (len(content) == 2) and (content[0] == '\\'):
+        return character_escapes.get(content[1])
+    return None
+
+
+# Convert a value to an integer type of the size given, wrapping it as C would
+def convert_to_integer_type(value, integer_type):
+    size, is_signed = integer_type
+    value &= (1 << size) - 1
+    if is_signed and (value >= (1 << (size - 1))):
+        value -= 1 << size
+    return value
+
+
+# Divide two integers, rounding towards zero as C does (Python rounds towards negative infinity)
+def divide_integers(left, right):
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+# Convert a list of tokens into a list of (kind, value) terms, where kind is 'integer', 'float', 'name' or 'operator',
+# or return None if the tokens contain a literal we don't understand
+def get_terms(tokens):
+    terms = []
+    for token in tokens:
+        token_type = token.type
+        if (token_type == 'WHITESPACE') or (token_type == 'NEWLINE'):
+            continue
+
+        if token_type in ('DECIMAL_LITERAL', 'HEX_LITERAL', 'OCTAL_LITERAL', 'FLOAT_LITERAL'):
+            text = token.value
+            if text[0] in '+-':
+                # The lexer includes signs in numeric literals, so "A-1" is lexed as "A" followed by "-1" - we treat
+                # the sign as a separate operator to get the right result in such cases
+                terms.append(('operator', text[0]))
+                text = text[1:]
+            if token_type == 'FLOAT_LITERAL':
+                value = parse_float_literal(text)
+                kind = 'float'
+            else:
+                value = parse_integer_literal(text)
+                kind = 'integer'
+            if value is None:
+                return None
+            terms.append((kind, value))
+        elif token_type == 'CHARACTER_LITERAL':
+            value = parse_character_literal(token.value)
+            if value is None:
+                return None
+            terms.append(('integer', value))
+        elif token_type == 'BOOL_LITERAL':
+            terms.append(('integer', 1 if token.value == 'true' else 0))
+        elif token_type in type_name_token_types:
+            terms.append(('name', token.value))
+        else:
+            operator = token.value
+            if len(terms) > 0:
+                previous_kind, previous_value = terms[-1]
+                combined_operator = combined_operators.get((previous_value, operator))
+                if (previous_kind == 'operator') and (combined_operator is not None):
+                    terms[-1] = ('operator', combined_operator)
+                    continue
+            terms.append(('operator', operator))
+    return terms
+
+
+# A recursive-descent parser that turns a list of terms into an expression tree
+# Expression trees are tuples, the first entry of which is the node type:
+# ('integer', value)/('float', value) - A literal
+# ('name', name)                      - A reference to a named value
+# ('cast', type name, operand)        - A cast
+# ('unary', operator, operand)        - A unary operator
+# ('binary', operator, left, right)   - A binary operator
+# ('?', condition, true value, false value) - The ternary operator
+class ExpressionParser:
+    def __init__(self, terms):
+        self.terms = terms
+        self.index = 0  # Index of the next term to consume
+
+    # Check if the next term is the operator given
+    def next_is_operator(self, operator):
+        return (self.index < len(self.terms)) and (self.terms[self.index] == ('operator', operator))
+
+    # Parse a complete expression, including the ternary operator
+    def parse_expression(self):
+        condition = self.parse_binary(1)
+        if (condition is None) or not self.next_is_operator('?'):
+            return condition
+        self.index += 1
+        true_value = self.parse_expression()
+        if (true_value is None) or not self.next_is_operator(':'):
+            return None
+        self.index += 1
+        false_value = self.parse_expression()
+        if false_value is None:
+            return None
+        return '?', condition, true_value, false_value
+
+    # Parse a sequence of binary operators with at least the precedence given
+    def parse_binary(self, min_precedence):
+        left = self.parse_unary()
+        while (left is not None) and (self.index < len(self.terms)):
+            kind, operator = self.terms[self.index]
+            precedence = binary_operators.get(operator) if kind == 'operator' else None
+            if (precedence is None) or (precedence < min_precedence):
+                break
+            self.index += 1
+            right = self.parse_binary(precedence + 1)
+            if right is None:
+                return None
+            left = ('binary', operator, left, right)
+        return left
+
+    # Parse a unary expression, cast or primary term
+    def parse_unary(self):
+        if self.index >= len(self.terms):
+            return None
+        kind, value = self.terms[self.index]
+
+        if kind != 'operator':
+            self.index += 1
+            return kind, value
+
+        if value in ('-', '+', '~', '!'):
+            self.index += 1
+            operand = self.parse_unary()
+            if operand is None:
+                return None
+            return 'unary', value, operand
+
+        if value == '(':
+            self.index += 1
+            # Check for a cast, which is a parenthesised sequence of names followed by an operand
+            # Something like "(A) - 1" is ambiguous without knowing if A is a type, so we only consider that a cast if
+            # A is an integer type we know about
+            end_index = self.index
+            while (end_index < len(self.terms)) and (self.terms[end_index][0] == 'name'):
+                end_index += 1
+            if (end_index > self.index) and (end_index + 1 < len(self.terms)) and \
+                    (self.terms[end_index] == ('operator', ')')):
+                type_name = " ".join(name for kind, name in self.terms[self.index:end_index])
+                next_kind, next_value = self.terms[end_index + 1]
+                if (next_kind != 'operator') or (next_value == '(') or \
+                        ((type_name in integer_types) and (next_value in ('-', '+', '~', '!'))):
+                    self.index = end_index + 1
+                    operand = self.parse_unary()
+                    if operand is None:
+                        return None
+                    return 'cast', type_name, operand
+
+            expression = self.parse_expression()
+            if (expression is None) or not self.next_is_operator(')'):
+                return None
+            self.index += 1
+            return expression
+
+        return None
+
+
+# Evaluates constant expressions, caching the results for expressions (and subexpressions) that have been seen before
+class ConstantEvaluator:
+    def __init__(self):
+        self.values = {}  # Known named values (e.g. enum elements), indexed by name
+        self.expressions = {}  # Parsed expression trees (or None for unparsable expressions), indexed by token values
+        self.results = {}  # Values of expression trees that have been successfully evaluated
+
+    # Set a named value that can be referenced in expressions
+    def set_value(self, name, value):
+        if (name in self.values) and (self.values[name] != value):
+            self.results = {}  # Anything we have evaluated may depend on the old value
+        self.values[name] = value
+
+    # Get the expression tree for a list of tokens, or None if they are not a valid expression
+    def get_expression(self, tokens):
+        key = tuple((token.type, token.value) for token in tokens)
+        if key in self.expressions:
+            return self.expressions[key]
+        expression = None
+        terms = get_terms(tokens)
+        if terms is not None:
+            parser = ExpressionParser(terms)
+            expression = parser.parse_expression()
+            if parser.index != len(terms):
+                expression = None
+        self.expressions[key] = expression
+        return expression
+
+    # Evaluate a list of tokens, returning the resulting value (an int or float), or None if they are not a constant
+    # expression we can evaluate
+    def evaluate(self, tokens):
+        expression = self.get_expression(tokens)
+        if expression is None:
+            return None
+        return self.evaluate_expression(expression)
+
+    # Evaluate an expression tree, returning None if it cannot be evaluated
+    def evaluate_expression(self, expression):
+        node_type = expression[0]
+        if (node_type == 'integer') or (node_type == 'float'):
+            return expression[1]
+        if node_type == 'name':
+            return self.values.get(expression[1])
+
+        result = self.results.get(expression)
+        if result is not None:
+            return result
+
+        if node_type == 'cast':
+            integer_type = integer_types.get(expression[1])
+            if integer_type is None:
+                return None  # Not a type we know about (which probably means the result isn't a number)
+            operand = self.evaluate_expression(expression[2])
+            if operand is None:
+                return None
+            result = convert_to_integer_type(int(operand), integer_type)
+        elif node_type == 'unary':
+            operand = self.evaluate_expression(expression[2])
+            if operand is None:
+                return None
+            result = evaluate_unary_operator(expression[1], operand)
+        elif node_type == 'binary':
+            left = self.evaluate_expression(expression[2])
+            if left is None:
+                return None
+            right = self.evaluate_expression(expression[3])
+            if right is None:
+                return None
+            result = evaluate_binary_operator(expression[1], left, right)
+        else:
+            condition = self.evaluate_expression(expression[1])
+            if condition is None:
+                return None
+            result = self.evaluate_expression(expression[2] if condition else expression[3])
+
+        if result is not None:
+            self.results[expression] = result
+        return result
+
+
+# Evaluate a unary operator, returning None if it isn't valid for the operand given
+def evaluate_unary_operator(operator, operand):
+    if operator == '-':
+        return -operand
+    if operator == '+':
+        return operand
+    if operator == '!':
+        return 0 if operand else 1
+    if isinstance(operand, float):
+        return None  # Bitwise operators are only valid on integers
+    return ~operand
+
+
+# Evaluate a binary operator, returning None if it isn't valid for the operands given
+def evaluate_binary_operator(operator, left, right):
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '*':
+        return left * right
+    if operator == '==':
+        return 1 if left == right else 0
+    if operator == '!=':
+        return 1 if left != right else 0
+    if operator == '<':
+        return 1 if left < right else 0
+    if operator == '<=':
+        return 1 if left <= right else 0
+    if operator == '>':
+        return 1 if left > right else 0
+    if operator == '>=':
+        return 1 if left >= right else 0
+    if operator == '&&':
+        return 1 if (left and right) else 0
+    if operator == '||':
+        return 1 if (left or right) else 0
+
+    if operator == '/':
+        if right == 0:
+            return None
+        if isinstance(left, float) or isinstance(right, float):
+            return left / right
+        return divide_integers(left, right)
+
+    # The remaining operators are only valid on integers
+    if isinstance(left, float) or isinstance(right, float):
+        return None
+    if operator == '%':
+        if right == 0:
+            return None
+        return left - divide_integers(left, right) * right
+    if operator == '<<':
+        return left << right if right >= 0 else None
+    if operator == '>>':
+        return left >> right if right >= 0 else None
+    if operator == '&':
+        return left & right
+    if operator == '|':
+        return left | right
+    return left ^ right
@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+# This implements a simple persistent on-disk cache, used to avoid repeating expensive work between runs
+
+
+# Get the default directory to store cache data in
+def get_default_cache_dir():
+    cache_root = os.environ.get('XDG_CACHE_HOME')
+    if not cache_root:
+        cache_root = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_root, 'dear_bindings')
+
+
+# Get a sorted list of all the Python source files that make up Dear Bindings itself
+def get_generator_source_files():
+    root_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    result = [os.path.join(root_dir, 'dear_bindings.py')]
+    for dir_path, dir_names, file_names in os.walk(os.path.join(root_dir, 'src')):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith('.py'):
+                result.append(os.path.join(dir_path, file_name))
+    return result
+
+
+_generator_fingerprint = None
+
+
+# Get a hash of the Dear Bindings source code (and the Python version running it), so that cached data can be
+# invalidated whenever the code that generated it changes
+def get_generator_fingerprint():
+    global _generator_fingerprint
+    if _generator_fingerprint is None:
+        hasher = hashlib.sha256()
+        hasher.update(sys.version.encode('utf-8'))
+        for source_file in get_generator_source_files():
+            hasher.update(os.path.basename(source_file).encode('utf-8'))
+            with open(source_file, 'rb') as f:
+                hasher.update(f.read())
+        _generator_fingerprint = hasher.hexdigest()
+    return _generator_fingerprint
+
+
+# A directory of binary blobs indexed by key (which should be a hash or similar filename-safe string)
+# The total size of the cache is capped at max_size bytes, with the least-recently-used entries being evicted to keep
+# it under that limit (entry modification times are used to track usage)
+class DiskCache:
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size  # Maximum total size of all entries, in bytes
+        self.is_writable = True  # Cleared if writing to the cache fails, so we only try (and warn) once
+
+    # Get the path of the file holding the entry with the given key
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.bin')
+
+    # Get the data stored under the given key, or None if there is no such entry
+    def get(self, key):
+        path = self.get_entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # Mark as recently used
+        except OSError:
+            pass
+        return data
+
+    # Store data under the given key, evicting old entries if the cache is now too large
+    # Failing to write to the cache (because the directory can't be created, is read-only, the disk is full or
+    # similar) isn't an error, as the cache is purely an optimisation - instead we warn and carry on without it
+    def put(self, key, data):
+        if not self.is_writable:
+            return
+        try:
+            self.write_entry(key, data)
+            self.evict()
+        except OSError as e:
+            print("Warning: Unable to write to cache directory " + self.cache_dir + " (" + str(e) +
+                  "), continuing without caching")
+            self.is_writable = False
+
+    # Write an entry to disk
+    def write_entry(self, key, data):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write to a temporary file first so that other processes never see a partially-written entry
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(temp_fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.get_entry_path(key))
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    # Remove an entry (if it exists)
+    def remove(self, key):
+        try:
+            os.remove(self.get_entry_path(key))
+        except OSError:
+            pass
+
+    # Evict least-recently-used entries until the cache is within its size limit
+    def evict(self):
+        entries = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.bin'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # Probably removed by another process
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+
+# An in-memory cache with the same interface as DiskCache, optionally layered in front of another cache (typically a
+# DiskCache) which it reads through to and writes through to
+# This is used to share data between multiple conversions performed in the same process
+# As with DiskCache, the total size of the entries held in memory is capped at max_size bytes, with the
+# least-recently-used entries being discarded to keep it under that limit (they remain in the backing cache, if any)
+class MemoryCache:
+    def __init__(self, max_size, backing_cache=None):
+        self.max_size = max_size  # Maximum total size of all entries, in bytes
+        self.backing_cache = backing_cache
+        self.entries = {}  # Entries indexed by key, in order of least to most recently used
+        self.total_size = 0  # Total size of all entries, in bytes
+
+    # Get the data stored under the given key, or None if there is no such entry
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            # Move the entry to the end to mark it as recently used
+            del self.entries[key]
+            self.entries[key] = data
+        elif self.backing_cache is not None:
+            data = self.backing_cache.get(key)
+            if data is not None:
+                self.add_entry(key, data)
+        return data
+
+    # Store data under the given key
+    def put(self, key, data):
+        self.add_entry(key, data)
+        if self.backing_cache is not None:
+            self.backing_cache.put(key, data)
+
+    # Remove an entry (if it exists)
+    def remove(self, key):
+        self.remove_entry(key)
+        if self.backing_cache is not None:
+            self.backing_cache.remove(key)
+
+    # Add an entry to memory, evicting least-recently-used entries if the cache is now too large
+    def add_entry(self, key, data):
+        self.remove_entry(key)
+        if len(data) > self.max_size:
+            return  # Would never fit
+        self.entries[key] = data
+        self.total_size += len(data)
+        while self.total_size > self.max_size:
+            self.remove_entry(next(iter(self.entries)))
+
+    # Remove an entry from memory (if it exists)
+    def remove_entry(self, key):
+        data = self.entries.pop(key, None)
+        if data is not None:
+            self.total_size -= len(data)
@@ -1,3 +1,4 @@
+import re
 from src import code_dom
 from src import utils
 from src import conditional_generator
@@ -81,6 +82,43 @@ def generate_cast(from_type, to_type, imgui_custom_types, nested_classes, to_cpp
     return cast_prefix, cast_suffix
 
 
+# Fully-qualify the names of any Dear ImGui types in a C++ type name, as inside the cimgui namespace they would otherwise
+# resolve to the C versions of the types
+def qualify_imgui_type_names(text, imgui_custom_types):
+    return re.sub(r'(?<![\w:])([A-Za-z_]\w*)',
+                  lambda match: ("::" + match.group(1)) if match.group(1) in imgui_custom_types else match.group(1),
+                  text)
+
+
+# Get the (C++) name to use when casting to the class a function is a member of
+def get_self_class_name(self_class_type, imgui_custom_types):
+    name = self_class_type.get_original_fully_qualified_name(include_leading_colons=True)
+    if self_class_type.template_parameter_values is not None:
+        # The template arguments need qualifying too
+        name = qualify_imgui_type_names(name, imgui_custom_types)
+    return name
+
+
+# Get a version of a type from the original (C++) version of a function in a template instantiation, with any template
+# parameters replaced by the values given (a dictionary of values indexed by parameter name), as the original function
+# is the one from the template itself
+def substitute_template_parameters(type_element, template_parameter_values):
+    if (type_element is None) or (template_parameter_values is None):
+        return type_element
+    if not any((tok.value in template_parameter_values) for tok in type_element.tokens):
+        return type_element
+
+    substituted_type = code_dom.DOMType()
+    substituted_type.tokens = []
+    for tok in type_element.tokens:
+        value = template_parameter_values.get(tok.value)
+        if value is not None:
+            substituted_type.tokens.extend(utils.create_tokens_for_type(value))
+        else:
+            substituted_type.tokens.append(tok)
+    return substituted_type
+
+
 # Generate function stub bodies
 def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
     generator = conditional_generator.ConditionalGenerator()
@@ -159,6 +197,11 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
             # self argument will be const in the case it was originally const
             is_const_function = function.arguments[0].arg_type.tokens[0].value == 'const'
 
+        # If this is part of a template instantiation, the original function still refers to the template parameters
+        template_parameter_values = None
+        if self_class_type is not None:
+            template_parameter_values = self_class_type.template_parameter_values
+
         # Check if varargs is involved
 
         uses_varargs = False
@@ -171,6 +214,7 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
         function = function.clone_without_children()  # Clone so we aren't altering the original
         function.name = "cimgui::" + function.name
         for type_data in function.list_all_children_of_type(code_dom.DOMType):
+            type_data.prepare_for_modification()
             for tok in type_data.tokens:
                 if tok.value in imgui_custom_types:
                     tok.value = "cimgui::" + tok.value
@@ -256,7 +300,9 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
                                                                    nested_classes,
                                                                    to_cpp=False)
         else:
-            return_cast_prefix, return_cast_suffix = generate_cast(original_function.return_type,
+            return_cast_prefix, return_cast_suffix = generate_cast(substitute_template_parameters(
+                                                                       original_function.return_type,
+                                                                       template_parameter_values),
                                                                    function.return_type,
                                                                    imgui_custom_types,
                                                                    nested_classes,
@@ -277,18 +323,18 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
             # Cast self pointer
             if is_const_function:
                 thunk_call += "reinterpret_cast<const " + \
-                              self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
+                              get_self_class_name(self_class_type, imgui_custom_types) + \
                               "*>(self)->"
             else:
                 thunk_call += "reinterpret_cast<" + \
-                              self_class_type.get_original_fully_qualified_name(include_leading_colons=True) + \
+                              get_self_class_name(self_class_type, imgui_custom_types) + \
                               "*>(self)->"
 
         if (function.return_type is not None) and (function.return_type.to_c_string() != "void"):
             # If the return type was a reference that we turned into a pointer, turn it into a pointer here
             # (note that we do no marshalling to make sure this is safe memory-wise!)
             for tok in function.return_type.tokens:
-                if hasattr(tok, "was_reference") and tok.was_reference:
+                if tok.was_reference:
                     thunk_call += "&"
 
         if function.is_constructor:
@@ -296,7 +342,7 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
                 # Add new (unless this is by-value, in which case we don't want it)
                 thunk_call += "new "
             # Constructor calls use the typename, not the nominal function name within the type
-            function_call_name = self_class_type.get_original_fully_qualified_name(include_leading_colons=True)
+            function_call_name = get_self_class_name(self_class_type, imgui_custom_types)
 
         thunk_call += function_call_name + "("
 
@@ -311,11 +357,13 @@ def generate(dom_root, file, indent=0, custom_varargs_list_suffixes={}):
             dereferences = ""
             if arg.arg_type is not None:
                 for tok in arg.arg_type.tokens:
-                    if hasattr(tok, "was_reference") and tok.was_reference:
+                    if tok.was_reference:
                         dereferences += "*"
 
             # Generate a cast if required
-            cast_prefix, cast_suffix = generate_cast(arg.arg_type, original_arg.arg_type,
+            cast_prefix, cast_suffix = generate_cast(arg.arg_type,
+                                                     substitute_template_parameters(original_arg.arg_type,
+                                                                                    template_parameter_values),
                                                      imgui_custom_types, nested_classes, to_cpp=True)
 
             if not first_arg:
@@ -1,4 +1,6 @@
 from src import code_dom
+from src import c_lexer
+from src import constant_evaluator
 from src import utils
 from src import type_comprehension
 import json
@@ -8,7 +10,7 @@ import json
 def add_comments(element, root):
     comments_root = {}
     had_any_comments = False
-    if element.pre_comments:
+    if element.lazy_pre_comments:  # (avoids allocating pre_comments for elements that have none)
         preceding_root = []
         comments_root["preceding"] = preceding_root
         for comment in element.pre_comments:
@@ -27,9 +29,7 @@ def add_preprocessor_conditionals(element, root):
     conditionals_root = []
     had_any_conditionals = False
 
-    conditionals = utils.get_preprocessor_conditionals(element)
-
-    for conditional in conditionals:
+    for conditional, is_in_else_block in utils.get_preprocessor_conditional_context(element).entries:
         if conditional.is_include_guard:
             continue  # Don't include include guards
 
@@ -42,8 +42,6 @@ def add_preprocessor_conditionals(element, root):
         conditional_root = {}
         conditionals_root.append(conditional_root)
 
-        is_in_else_block = conditional.is_element_in_else_block(element)
-
         if conditional.is_ifdef:
             if conditional.is_negated ^ is_in_else_block:
                 conditional_root["condition"] = "ifndef"
@@ -270,7 +268,7 @@ def emit_enum(enum):
     elements_root = []
     result["elements"] = elements_root
 
-    for element in enum.list_all_children_of_type(code_dom.DOMEnumElement):
+    for element in enum.iter_descendants(code_dom.DOMEnumElement):
         elements_root.append(emit_enum_element(element))
 
     add_comments(enum, result)
@@ -451,6 +449,11 @@ def emit_function(function):
     return result
 
 
+# The evaluator used to calculate the values of defines (defines can't reference each other, as we don't know which
+# of several conditional definitions would apply, so this is only used to cache expressions)
+define_evaluator = constant_evaluator.ConstantEvaluator()
+
+
 def emit_define(define):
     result = {}
 
@@ -462,6 +465,13 @@ def emit_define(define):
             content = content[1:len(content)-1]
         result["content"] = content
 
+        # Add the value if the content is a numeric constant, so that consumers don't need to parse it themselves
+        # (function-style defines are never constants, whatever their content)
+        if "(" not in define.name:
+            value = define_evaluator.evaluate(c_lexer.tokenize(define.content).tokens)
+            if value is not None:
+                result["value"] = value
+
     add_comments(define, result)
     add_preprocessor_conditionals(define, result)
     add_internal_flag(define, result)
@@ -0,0 +1,250 @@
+from src import code_dom
+
+# This implements the layout pass that aligns function names, structure field names, enum values and attached comments
+# in the output (purely for aesthetic purposes)
+# All four alignments are calculated from a single walk of the DOM. Elements that are written as a single line (see
+# DOMElement.get_c_line()) are measured from that line, which is built from cached type strings, and each one is only
+# measured once. Anything else (structs with bodies, enums, conditionals and so on) gets measured by writing it out to
+# a dummy file, as its width depends on its children.
+
+
+# A fake file we get the DOM to write C code to so we can evaluate the length of the longest line
+class LineLengthMeasuringFile:
+    def __init__(self):
+        self.max_length = 0
+
+    def write(self, line):
+        self.max_length = max(self.max_length, len(line))
+
+
+# Get the width of a line of text as written by write_c_line() at zero indent
+# (this includes the newline, as historically that was counted when measuring statements)
+def get_line_width(text):
+    return len(text.rstrip()) + 1
+
+
+# Calculate the alignment column for a group of elements given their lengths, ignoring any that are more than
+# tolerance characters over the average (to avoid a single very long line pushing everything far to the right)
+# padding is added to the longest length to give the alignment
+def calculate_alignment(lengths, tolerance, padding):
+    average = 0
+    if len(lengths) > 0:
+        average = sum(lengths) / len(lengths)
+
+    alignment = 0
+    for length in lengths:
+        if length < (average + tolerance):
+            alignment = max(alignment, length + padding)
+    return alignment
+
+
+# Holds the information gathered from the DOM that alignments are calculated from
+class Layout:
+    def __init__(self, write_context):
+        self.write_context = write_context  # Context used to generate text - this needs to match that used by the
+        #                                     actual header file output
+        self.struct_fields = {}  # Field declarations in each struct (including those in nested structs), indexed by
+        #                          struct, in document order
+        self.enum_elements = {}  # Enum elements in each enum, indexed by enum, in document order
+        self.struct_comment_groups = {}  # Elements with attached comments in each (non-forward-declared) struct,
+        #                                  indexed by struct, in document order
+        self.enum_comment_groups = {}  # Elements with attached comments in each enum, indexed by enum
+        self.functions = []  # Function declarations, as (function, child list, index in child list) tuples
+        self.commented_elements = []  # Elements with attached comments, as (element, child list, index) tuples
+        self.statement_widths = {}  # Widths of single-line statements that have been measured, indexed by element
+
+    # Walk the DOM and gather everything we need
+    def gather(self, dom_root):
+        # Stack of iterators over (child list, index, child) for the children of each element we are currently inside,
+        # along with the structs/enums that those children are inside
+        stack = [(iter([([dom_root], 0, dom_root)]), ())]
+        while len(stack) > 0:
+            iterator, containers = stack[-1]
+            for (child_list, index, element) in iterator:
+                if isinstance(element, code_dom.DOMFieldDeclaration):
+                    for container in containers:
+                        if container in self.struct_fields:
+                            self.struct_fields[container].append(element)
+                elif isinstance(element, code_dom.DOMEnumElement):
+                    for container in containers:
+                        if container in self.enum_elements:
+                            self.enum_elements[container].append(element)
+                elif isinstance(element, code_dom.DOMFunctionDeclaration):
+                    self.functions.append((element, child_list, index))
+
+                if element.attached_comment is not None:
+                    for container in containers:
+                        comment_group = self.struct_comment_groups.get(container)
+                        if comment_group is None:
+                            comment_group = self.enum_comment_groups[container]
+                        comment_group.append(element)
+                    self.commented_elements.append((element, child_list, index))
+
+                child_containers = containers
+                if isinstance(element, code_dom.DOMClassStructUnion):
+                    self.struct_fields[element] = []
+                    # Don't try and do anything with forward declarations here, as they don't have any children
+                    # and trying to be clever here just impairs our ability to nicely align blocks of
+                    # "typedef struct" statements (which the loose element grouping will do just fine)
+                    if not element.is_forward_declaration:
+                        self.struct_comment_groups[element] = self.get_initial_comment_group(element)
+                        child_containers = containers + (element,)
+                elif isinstance(element, code_dom.DOMEnum):
+                    self.enum_elements[element] = []
+                    self.enum_comment_groups[element] = self.get_initial_comment_group(element)
+                    child_containers = containers + (element,)
+
+                child_lists = element.get_child_lists()
+                if len(child_lists) > 0:
+                    stack.append((((child_list, index, child)
+                                   for child_list in child_lists
+                                   for (index, child) in enumerate(child_list)),
+                                  child_containers))
+                    break  # Descend into the children before continuing with the siblings
+            else:
+                stack.pop()
+
+    # Get the initial comment group for a struct/enum (before any of its children are added)
+    @staticmethod
+    def get_initial_comment_group(container):
+        if container.attached_comment is None:
+            return []
+        # The container itself gets counted twice if it has a comment (once explicitly and once as the first element
+        # of the search for commented elements that this was originally done with) - this only affects the average
+        # length of the group, but is retained so that the output doesn't change
+        return [container, container]
+
+    # Get the width of the statement an element represents (not including any attached or preceding comments)
+    def get_statement_width(self, element):
+        width = self.statement_widths.get(element)
+        if width is not None:
+            return width
+
+        line = element.get_c_line(self.write_context)
+        if line is not None:
+            width = get_line_width(line)
+            self.statement_widths[element] = width
+            return width
+
+        # This isn't a single line, so we need to write it out to measure it
+        # Temporarily remove any comments so we can get the actual statement length without them
+        comment = element.attached_comment
+        pre_comments = element.pre_comments
+        element.attached_comment = None
+        element.pre_comments = []
+
+        file = LineLengthMeasuringFile()
+        element.write_to_c(file, 0, self.write_context)
+
+        # Reattach comments
+        element.attached_comment = comment
+        element.pre_comments = pre_comments
+
+        # This isn't cached, as the width can change as the comments of our children get aligned
+        return file.max_length
+
+    # Align enum values within each enum
+    def align_enum_values(self):
+        for enum_elements in self.enum_elements.values():
+            # Calculate the maximum name length within the enum
+            max_name_length = 0
+            for enum_element in enum_elements:
+                max_name_length = max(max_name_length, len(enum_element.name))
+
+            # Set all the enum items to pad to that length
+            for enum_element in enum_elements:
+                enum_element.value_alignment = max_name_length
+
+    # Align the names of functions that appear together (i.e. without a blank line between them)
+    def align_function_names(self):
+        grouped_functions = set()
+
+        for (function, child_list, index) in self.functions:
+            if function in grouped_functions:
+                continue
+
+            # Scan down until we hit a blank line or an already-grouped function
+            group = []
+            for current in child_list[index:]:
+                if isinstance(current, code_dom.DOMBlankLines) or (current in grouped_functions):
+                    break
+                if isinstance(current, code_dom.DOMFunctionDeclaration):
+                    group.append(current)
+                    grouped_functions.add(current)
+
+            # -1 to remove the trailing space from the prefixes
+            prefix_lengths = [len(function.get_prefixes_and_return_type(self.write_context)) - 1
+                              for function in group]
+            alignment = calculate_alignment(prefix_lengths, 20, 1)  # +1 to leave a space after the prefixes
+
+            # Set all functions in the group to align to the same value
+            for function in group:
+                function.function_name_alignment = alignment
+
+    # Align field names within each struct
+    def align_structure_field_names(self):
+        for fields in self.struct_fields.values():
+            prefix_lengths = [len(field.get_prefix_and_type(self.write_context)) for field in fields]
+            alignment = calculate_alignment(prefix_lengths, 20, 0)
+
+            # Set all the names to align to that
+            for field in fields:
+                field.name_alignment = alignment
+
+    # Align attached comments that appear together
+    def align_comments(self):
+        # Comments in structures/enums are grouped together first, as we want to be sure those get aligned together
+        comment_groups = list(self.struct_comment_groups.values()) + list(self.enum_comment_groups.values())
+        grouped_elements = set()
+        for group in comment_groups:
+            grouped_elements.update(group)
+
+        # Next look for any other elements with comments and group them according to their position in the file
+        for (element, child_list, index) in self.commented_elements:
+            if element in grouped_elements:
+                continue
+
+            # Scan down until we hit a blank line or an already-grouped element
+            group = []
+            for current in child_list[index:]:
+                if isinstance(current, code_dom.DOMBlankLines) or (current in grouped_elements):
+                    break
+                # We add statements here even if they don't have an attached comment themselves, because it looks bad
+                # if we have a bunch of interspaced statements that are longer than the comment alignment.
+                # But we ignore full-on comments as they tend to be long and don't affect the aesthetics so much.
+                if not isinstance(current, code_dom.DOMComment):
+                    group.append(current)
+                    grouped_elements.add(current)
+
+            comment_groups.append(group)
+
+        # Now we have our groups, we just need to align everything within them
+        # (this has to be done group-by-group, as measuring elements that are not single statements includes the
+        # comments of their children, which may have been aligned by an earlier group)
+        for group in comment_groups:
+            statement_lengths = [self.get_statement_width(element) for element in group]
+            alignment = calculate_alignment(statement_lengths, 40, 1)  # +1 to leave a space after the statement
+
+            for element in group:
+                if element.attached_comment is not None:
+                    element.attached_comment.alignment = alignment
+
+
+# Apply alignment to the DOM given
+# The alignments to calculate can be selected individually, but note that comment alignment depends on the others (as
+# it needs the final width of each line), so if that is being done it should generally be last
+def apply_alignment(dom_root, enum_values=True, function_names=True, structure_field_names=True, comments=True):
+    write_context = code_dom.WriteContext()
+    write_context.for_c = True
+
+    layout = Layout(write_context)
+    layout.gather(dom_root)
+
+    if enum_values:
+        layout.align_enum_values()
+    if function_names:
+        layout.align_function_names()
+    if structure_field_names:
+        layout.align_structure_field_names()
+    if comments:
+        layout.align_comments()
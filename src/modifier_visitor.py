@@ -0,0 +1,59 @@
+# This implements a simple visitor framework that allows several modifiers to be applied to the DOM in a single
+# traversal, instead of each of them walking the whole tree separately
+# Modifiers register callbacks for the element types they are interested in, and these are invoked on each element in
+# document order (the same order list_all_children_of_type() produces), in the order they were registered.
+# This gives the same results as applying the modifiers one after another, as long as:
+# - Each callback only modifies the element it is given (and its descendants), although it may look at its ancestors
+# - Modifiers that remove elements are registered before any that would otherwise see those elements
+# - Callbacks do not add new elements to the tree or move existing ones
+class ModifierVisitor:
+    def __init__(self):
+        self.callbacks = []  # List of (element type, callback) pairs, in registration order
+        self.callbacks_by_class = {}  # Callbacks applicable to each concrete element class, built on demand
+
+    # Register a callback to be invoked on every element of the type given (including subclasses of it)
+    def add_callback(self, element_type, callback):
+        self.callbacks.append((element_type, callback))
+        self.callbacks_by_class = {}
+
+    # Get the callbacks applicable to elements of the class given, in registration order
+    def get_callbacks_for_class(self, element_class):
+        callbacks = self.callbacks_by_class.get(element_class)
+        if callbacks is None:
+            callbacks = tuple(callback for element_type, callback in self.callbacks
+                              if issubclass(element_class, element_type))
+            self.callbacks_by_class[element_class] = callbacks
+        return callbacks
+
+    # Visit dom_root and all of its descendants, invoking the registered callbacks on each
+    def apply(self, dom_root):
+        element_types = tuple(dict.fromkeys(element_type for element_type, callback in self.callbacks))
+        if len(element_types) == 0:
+            return
+
+        # We get all the elements any callback is interested in with a single query, which is one walk of the tree
+        # (or none if the root has an up-to-date element index for this set of types)
+        for element in dom_root.list_all_children_of_type(element_types):
+            if not is_attached(element, dom_root):
+                continue  # Removed (possibly along with an ancestor) by an earlier callback
+            parent = element.parent
+            for callback in self.get_callbacks_for_class(type(element)):
+                callback(element)
+                if element.parent is not parent:
+                    break  # Once an element has been removed subsequent callbacks should not see it
+
+
+# Check if an element is still part of the tree under dom_root
+def is_attached(element, dom_root):
+    while element is not dom_root:
+        element = element.parent
+        if element is None:
+            return False
+    return True
+
+
+# Apply a single modifier that uses the visitor framework, given its registration function and any arguments to it
+def apply_modifier(dom_root, register_function, *args):
+    visitor = ModifierVisitor()
+    register_function(visitor, *args)
+    visitor.apply(dom_root)
@@ -19,8 +19,8 @@ def apply(dom_root, declarations):
 
     insert_point = dom_root.children[0]  # Default to adding at the top of the file if we can't find anywhere else
 
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
-        insert_point = function.parent.get_prev_child(function)
-        break
+    first_function = next(dom_root.iter_descendants(code_dom.DOMFunctionDeclaration), None)
+    if first_function is not None:
+        insert_point = first_function.parent.get_prev_child(first_function)
 
     insert_point.parent.insert_before_child(insert_point, elements_to_append)
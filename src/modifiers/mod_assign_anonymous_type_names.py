@@ -1,12 +1,21 @@
 from src import code_dom
-from src import utils
+from src import modifier_visitor
 
 
 # This modifier assigns synthetic names to any anonymous types
 # These aren't relevant to the C generator but are used by the JSON metadata
 def apply(dom_root):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
     index = 0
-    for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
+
+    def visit_struct(struct):
+        nonlocal index
         if struct.is_anonymous and struct.name is None:
             struct.name = "__anonymous_type" + str(index)
             index += 1
+
+    visitor.add_callback(code_dom.DOMClassStructUnion, visit_struct)
@@ -5,30 +5,37 @@ from src import utils
 # This modifier looks for comments that precede an element and attaches them so they get manipulated with it
 def apply(dom_root):
 
-    elements_to_consider = []
-
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMFieldDeclaration))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMTypedef))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMTemplate))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMPreprocessorIf))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMEnum))
-    elements_to_consider.extend(dom_root.list_all_children_of_type(code_dom.DOMEnumElement))
-
-    for element in elements_to_consider:
-        comments = []
-
-        # Walk backwards from the element looking for comments immediately above
-        comment_element = element.parent.get_prev_child(element)
-        while isinstance(comment_element, code_dom.DOMComment) and not comment_element.is_attached_comment \
-                and not comment_element.is_preceding_comment:
-            comments.append(comment_element)
-            comment_element = comment_element.parent.get_prev_child(comment_element)
-
-        if len(comments) > 0:
-            # Reverse the order of the comments as we collected them backwards
-            comments.reverse()
-
-            # Add them to the element as preceding comments
-            element.attach_preceding_comments(comments)
+    element_types_to_consider = (code_dom.DOMFunctionDeclaration,
+                                 code_dom.DOMClassStructUnion,
+                                 code_dom.DOMFieldDeclaration,
+                                 code_dom.DOMTypedef,
+                                 code_dom.DOMTemplate,
+                                 code_dom.DOMPreprocessorIf,
+                                 code_dom.DOMEnum,
+                                 code_dom.DOMEnumElement)
+
+    # Each child list is scanned forwards once (rather than walking backwards from each element), collecting runs of
+    # comments and attaching them to the element that immediately follows them
+    # The comments are then removed from each parent in one go, as removing them individually is slow for large
+    # structs
+    for parent in dom_root.list_all_children_of_type(code_dom.DOMElement):
+        comments_to_attach = []  # List of (element, comments) tuples
+
+        for child_list in parent.get_writable_child_lists():
+            comments = []
+            for element in child_list:
+                if isinstance(element, code_dom.DOMComment) and not element.is_attached_comment \
+                        and not element.is_preceding_comment:
+                    comments.append(element)
+                    continue
+
+                if (len(comments) > 0) and isinstance(element, element_types_to_consider):
+                    comments_to_attach.append((element, comments))
+                comments = []
+
+        if len(comments_to_attach) > 0:
+            parent.remove_children([comment for (_, comments) in comments_to_attach for comment in comments])
+
+            # Add them to the elements as preceding comments
+            for (element, comments) in comments_to_attach:
+                element.attach_preceding_comments(comments)
@@ -1,10 +1,15 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes all references and turns them into pointers or straight pass-by-value
 def apply(dom_root):
-    for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
+    modifier_visitor.apply_modifier(dom_root, register)
 
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_type(type_element):
         is_argument = isinstance(type_element.parent, code_dom.DOMFunctionArgument)
 
         # For function arguments, if the argument is of the form "const X&", then convert it to just "X"
@@ -16,6 +21,10 @@ def apply(dom_root):
                     # is necessary to turn a value into a reference
 
         # Find all references and convert them to pointers
+        # (this prepares for modification before looking at the tokens, as doing so may replace them with copies)
+        if not any(tok.type == 'AMPERSAND' for tok in type_element.tokens):
+            return
+        type_element.prepare_for_modification()
         for tok in type_element.tokens:
             if tok.type == 'AMPERSAND':
                 # We need to convert this to use a pointer
@@ -25,3 +34,5 @@ def apply(dom_root):
                 tok.was_reference = True
                 # Also note that it cannot be null
                 tok.nullable = False
+
+    visitor.add_callback(code_dom.DOMType, visit_type)
@@ -16,7 +16,7 @@ def apply(dom_root, name_suffix_remaps, functions_to_ignore, functions_to_rename
 
     functions_by_name = {}  # Contains lists of functions
 
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+    for function in dom_root.iter_descendants(code_dom.DOMFunctionDeclaration):
         if function.name not in functions_by_name:
             # Create list
             functions_by_name[function.name] = [function]
@@ -0,0 +1,69 @@
+from src import code_dom
+from src import preprocessor_evaluator
+
+
+# Get the name of the symbol a #define or #undef affects
+def get_affected_symbol(element):
+    if isinstance(element, code_dom.DOMDefine):
+        return element.name.split('(', 1)[0]  # Remove the argument list from function-like macros
+    if len(element.tokens) > 0:
+        return element.tokens[0].value
+    return None
+
+
+# This modifier evaluates preprocessor conditionals given the state of a set of symbols (as supplied with -D/-U on the
+# command line), and flattens any whose outcome is known, retaining either their primary or else content as
+# appropriate. Conditionals that depend on symbols not mentioned are left alone.
+# defines is a dictionary mapping symbol names to their values, and undefines a list of symbols known to be undefined.
+# The header is processed in order, so #defines and #undefs of the symbols given are taken into account (if these
+# are themselves inside a conditional we can't evaluate, the symbol becomes unknown from that point onwards).
+def apply(dom_root, defines, undefines):
+    symbols = {}
+    for name in undefines:
+        symbols[name] = None
+    for name, value in defines.items():
+        symbols[name] = value
+    tracked_symbols = set(symbols.keys())
+
+    # Each entry is an element to process, along with a flag indicating if it is definitely compiled (i.e. not inside
+    # any conditional we couldn't evaluate)
+    # Conditionals inside ones we couldn't evaluate can still be flattened, as the symbol state is the same either
+    # way (other than for symbols (un)defined earlier in the same block, which we treat as unknown)
+    pending = [(dom_root, True)]
+    while len(pending) > 0:
+        element, is_unconditional = pending.pop()
+
+        if isinstance(element, code_dom.DOMPreprocessorIf):
+            outcome = preprocessor_evaluator.evaluate_condition(element, symbols)
+            if outcome is None:
+                children = element.children + element.else_children
+                pending.extend((child, False) for child in reversed(children))
+                continue
+
+            content_to_retain = list(element.children if outcome else element.else_children)
+            parent = element.parent
+            if len(content_to_retain) > 0:
+                # Promote the retained content to the parent scope
+                parent.insert_after_child(element, list(content_to_retain))
+                for child in content_to_retain:
+                    if isinstance(child, code_dom.DOMPreprocessorIf) and child.is_elif:
+                        # A promoted #elif is now a conditional in its own right
+                        child.prepare_for_modification()
+                        child.is_elif = False
+            parent.remove_child(element)
+            pending.extend((child, is_unconditional) for child in reversed(content_to_retain))
+            continue
+
+        if isinstance(element, (code_dom.DOMDefine, code_dom.DOMUndef)):
+            name = get_affected_symbol(element)
+            if name in tracked_symbols:
+                if not is_unconditional:
+                    symbols.pop(name, None)
+                elif isinstance(element, code_dom.DOMDefine):
+                    symbols[name] = element.content if element.content is not None else ""
+                else:
+                    symbols[name] = None
+            continue
+
+        for child_list in element.get_writable_child_lists():
+            pending.extend((child, is_unconditional) for child in reversed(child_list))
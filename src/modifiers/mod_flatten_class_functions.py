@@ -69,8 +69,12 @@ def apply(dom_root):
                 self_arg.name = "self"
                 self_arg.parent = function
                 self_arg.is_instance_pointer = True
+                function.prepare_for_modification()
                 function.arguments.insert(0, self_arg)
 
+            # We modified the return type/arguments directly above, so let the DOM know they have changed
+            function.notify_children_changed([function])
+
             # Remove const-ness as that has no meaning when the function is moved outside
             # (and we've applied const to the self parameter, which achieves the same effect in C-land)
             function.is_const = False
@@ -22,8 +22,7 @@ def apply(dom_root, custom_mappings=None):
             # ...but field declarations can have multiple names
             if hasattr(child, "names"):
                 child.old_names = child.names.copy()
-                for i in range(0..len(child.names)):
-                    child.names[i] = prefix + child.names[i]
+                child.names = [prefix + name for name in child.names]
 
         # Remove the namespace element and promote the children into the parent scope
         children = namespace.children.copy()
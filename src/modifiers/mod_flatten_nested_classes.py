@@ -27,6 +27,7 @@ def apply(dom_root):
             found_element_to_change = False
             for i in range(0, len(type_element.tokens)):
                 if type_element.tokens[i].value == struct.name:
+                    type_element.prepare_for_modification()
                     type_element.tokens[i].value = new_name
                     found_element_to_change = True
 
@@ -49,6 +50,7 @@ def apply(dom_root):
             found_element_to_change = False
             for i in range(0, len(type_element.tokens)):
                 if type_element.tokens[i].value == qualified_name:
+                    type_element.prepare_for_modification()
                     type_element.tokens[i].value = new_name
 
             if found_element_to_change:
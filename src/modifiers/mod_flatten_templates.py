@@ -1,93 +1,234 @@
+import re
 from src import code_dom
 from src import utils
 
 
-# Extract the first template parameter for the template name given from a token list
-# Returns the parameter as a string, along with the first and last token indices that
-# the parameter occupies (not including any <>s)
-# This is kinda shonky and only works for templates with a single parameter
-def extract_template_parameter(template_name, tokens):
-    for i in range(0, len(tokens) - 3):
-        if (tokens[i].value == template_name) and \
-                (tokens[i + 1].value == '<'):
-            end_index = -1
-            for j in range(i + 2, len(tokens)):
-                if tokens[j].value == '>':
-                    end_index = j
-                    break
-            if end_index >= 0:
-                instantiation_parameter = ""
-                for k in range(i + 2, end_index):
-                    instantiation_parameter += tokens[k].value
-                return instantiation_parameter, i + 2, end_index
-    return None, -1, -1
+# A single instantiation of a template (i.e. a set of template arguments it is used with), along with the types that
+# reference it
+class TemplateInstantiation:
+    def __init__(self, arguments, implementation_arguments):
+        self.arguments = arguments  # Tuple of the template arguments as they exist in the DOM at present
+        self.implementation_arguments = implementation_arguments  # Tuple of the arguments in their implementation form
+        #                                                           (if that exists, None if not)
+        self.references = []  # List of DOMTypes that reference this instantiation
+
+
+# Join the token values making up a template argument back into a string
+def get_argument_string(values):
+    result = ""
+    for value in values:
+        # Keep identifiers/keywords separate (e.g. "const char"), but otherwise pack things together as the original
+        # version of this did (so we get "ImDrawList*" and not "ImDrawList *")
+        if (len(result) > 0) and (len(value) > 0) and \
+                (result[-1].isalnum() or result[-1] == '_') and (value[0].isalnum() or value[0] == '_'):
+            result += " "
+        result += value
+    return result.strip()
+
+
+# Parse the template argument list that starts with the < at values[start_index], where values is either a list of
+# token values or a string
+# Returns a list of the arguments (each being the list of values it contains), along with the index of the closing >,
+# or None, -1 if the argument list isn't terminated
+def parse_template_arguments(values, start_index):
+    arguments = [[]]
+    depth = 0  # Depth of nested brackets
+    for i in range(start_index + 1, len(values)):
+        value = values[i]
+        if (value == '<') or (value == '(') or (value == '['):
+            depth += 1
+        elif (value == '>') or (value == ')') or (value == ']'):
+            if depth == 0:
+                if value != '>':
+                    return None, -1
+                if (len(arguments) == 1) and (len(arguments[0]) == 0):
+                    return [], i  # Empty argument list
+                return arguments, i
+            depth -= 1
+        elif (value == ',') and (depth == 0):
+            arguments.append([])
+            continue
+        arguments[-1].append(value)
+    return None, -1
+
+
+# Get the parameters of a template, as a list of (parameter name, default value) tuples (with None as the default
+# value if there isn't one)
+def get_template_parameters(template):
+    values = ['<'] + [token.value for token in template.template_parameter_tokens] + ['>']
+    parameters, _ = parse_template_arguments(values, 0)
+    result = []
+    for parameter in parameters:
+        default_value = None
+        if '=' in parameter:
+            default_index = parameter.index('=')
+            default_value = get_argument_string(parameter[default_index + 1:])
+            parameter = parameter[:default_index]
+        # The name is always the last thing in the declaration ("typename T", "int COUNT" and so on)
+        result.append((parameter[-1], default_value))
+    return result
+
+
+# Find all references to the templates named in a list of tokens
+# Returns a list of (template name, arguments, first token index, last token index) tuples, where arguments is a tuple
+# of argument strings and the token indices cover the whole reference from the template name to the closing >
+# Template references nested inside the arguments of another reference are not returned
+def find_template_references(tokens, template_names):
+    references = []
+    values = None
+    i = 0
+    while i < len(tokens) - 1:
+        if (tokens[i].value in template_names) and (tokens[i + 1].value == '<'):
+            if values is None:
+                values = [token.value for token in tokens]
+            arguments, end_index = parse_template_arguments(values, i + 1)
+            if arguments is not None:
+                references.append((values[i], tuple(get_argument_string(argument) for argument in arguments),
+                                   i, end_index))
+                i = end_index
+        i += 1
+    return references
+
+
+# Extract the template arguments from the implementation (original) name of a type, returning None if there aren't
+# the number expected
+def get_implementation_arguments(original_name, expected_count):
+    if original_name is None:
+        return None
+    opening_bracket = original_name.find('<')
+    if opening_bracket < 0:
+        return None
+    arguments, _ = parse_template_arguments(original_name, opening_bracket)
+    if (arguments is None) or (len(arguments) != expected_count):
+        return None
+    return tuple("".join(argument).strip() for argument in arguments)
+
+
+# Add the default values for any template parameters that were not supplied to a set of arguments
+def complete_template_arguments(template, parameters, arguments):
+    if len(arguments) > len(parameters):
+        raise Exception("Template " + str(template) + " referenced with too many parameters (" +
+                        ", ".join(arguments) + ")")
+    if len(arguments) == len(parameters):
+        return arguments
+    completed_arguments = list(arguments)
+    for (parameter_name, default_value) in parameters[len(arguments):]:
+        if default_value is None:
+            raise Exception("Template " + str(template) + " referenced without a value for parameter " +
+                            parameter_name + " (" + ", ".join(arguments) + ")")
+        completed_arguments.append(default_value)
+    return tuple(completed_arguments)
 
 
 # This modifier finds templates and flattens them, creating concrete classes/functions for each required instantiation
-# It currently only supports templates with a single type parameter
+# Templates with multiple parameters and default parameter values are supported, but template references nested
+# inside the arguments of another template reference are not
 # custom_type_fudges can be used to supply strings which will be matched and replaced in modified types within the
 # instantiation as a way of working around some issues with the subtleties of template expansion rules (notably
 # "const T*" with T as "Blah *" expanding to "Blah* const*" rather than the lexical substitution "const Blah**")
 def apply(dom_root, custom_type_fudges={}):
-    # Iterate through all templates
+    # Gather all the templates (other than member templates of other templates, which get cloned along with their
+    # parent), along with the types inside each
+    templates = []
+    template_types = {}
     for template in dom_root.list_all_children_of_type(code_dom.DOMTemplate):
+        template_types[template] = template.list_all_children_of_type(code_dom.DOMType)
+        parent = template.parent
+        while (parent is not None) and not isinstance(parent, code_dom.DOMTemplate):
+            parent = parent.parent
+        if parent is None:
+            templates.append(template)
+
+    if len(templates) == 0:
+        return
+
+    # If more than one template has the same name then the first one gets all the references
+    templates_by_name = {}
+    template_parameters = {}
+    for template in templates:
+        templates_by_name.setdefault(template.get_templated_object().name, template)
+        template_parameters[template] = get_template_parameters(template)
+
+    # Types inside templates are skipped when looking for instantiations (technically this is wrong, but it simplifies
+    # things for now as otherwise we'd need to be able to tell the difference between template parameters and concrete
+    # types) - instead the types in each instantiation get checked once it has been created
+    types_inside_templates = set()
+    for types in template_types.values():
+        types_inside_templates.update(types)
+
+    # Index of instantiations, by template name and then by arguments (in the order they were first seen)
+    instantiation_index = {}
+    # The same instantiations as lists by template name, so they can be processed in order as more get added
+    instantiation_lists = {}
+
+    # Add any template references in the types given to the instantiation index
+    def index_template_references(types, template_names):
+        for type_element in types:
+            for (template_name, arguments, _, _) in find_template_references(type_element.tokens, template_names):
+                template = templates_by_name[template_name]
+                parameters = template_parameters[template]
+                instantiations = instantiation_index.setdefault(template_name, {})
+                completed_arguments = complete_template_arguments(template, parameters, arguments)
+                instantiation = instantiations.get(completed_arguments)
+                if instantiation is None:
+                    # Figure out what the implementation arguments are and record those
+                    implementation_arguments = \
+                        get_implementation_arguments(type_element.original_name_override, len(arguments))
+                    if implementation_arguments is not None:
+                        implementation_arguments = \
+                            complete_template_arguments(template, parameters, implementation_arguments)
+                    instantiation = TemplateInstantiation(completed_arguments, implementation_arguments)
+                    instantiations[completed_arguments] = instantiation
+                    instantiation_lists.setdefault(template_name, []).append(instantiation)
+                if (len(instantiation.references) == 0) or (instantiation.references[-1] is not type_element):
+                    instantiation.references.append(type_element)
+
+    index_template_references([type_element for type_element in dom_root.list_all_children_of_type(code_dom.DOMType)
+                               if type_element not in types_inside_templates],
+                              templates_by_name)
+
+    # The names of the templates that each template references internally
+    template_dependencies = {}
+    for template in templates:
+        dependencies = set()
+        for type_element in template_types[template]:
+            for (template_name, _, _, _) in find_template_references(type_element.tokens, templates_by_name):
+                dependencies.add(template_name)
+        dependencies.discard(template.get_templated_object().name)
+        template_dependencies[template] = dependencies
+
+    # Flatten templates that reference other templates first, as instantiating them can add new references (for
+    # example, each instantiation of ImPool<T> needs an instantiation of ImVector<T>)
+    remaining_templates = templates
+    while len(remaining_templates) > 0:
+        template = remaining_templates[0]
+        for candidate in remaining_templates:
+            candidate_name = candidate.get_templated_object().name
+            if not any(candidate_name in template_dependencies[other] for other in remaining_templates):
+                template = candidate
+                break
+        remaining_templates = [other for other in remaining_templates if other is not template]
+
         templated_obj = template.get_templated_object()
         template_name = templated_obj.name
+        parameters = template_parameters[template]
 
-        # Figure out the template parameter name
-        template_parameter_name = None
-        for token in template.template_parameter_tokens:
-            if token.value != 'typename':
-                if template_parameter_name is not None:
-                    raise Exception(
-                        "Template " + str(template) +
-                        " appears to have more than one parameter (which is not currently supported)")
-                template_parameter_name = token.value
-
-        # Instantiation parameters as they exist in the DOM at present
-        instantiation_parameters = []
-        # Instantiation parameters in their implementation form (if that exists, None if not)
-        implementation_instantiation_parameters = []
-
-        # Find all references to this
-        for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
-            # Don't look for instantiations inside the template itself (technically this is wrong, but it simplifies
-            # things for now as otherwise we'd need to be able to tell the difference between template parameters
-            # and concrete types)
-            if type_element.is_descendant_of(template):
-                continue
-
-            instantiation_parameter, _, _ = extract_template_parameter(template_name, type_element.tokens)
-
-            if instantiation_parameter is not None:
-                if instantiation_parameter not in instantiation_parameters:
-                    instantiation_parameters.append(instantiation_parameter)
-
-                    # print("Template " + template_name + " referenced in " + str(type_element) + " with parameter " +
-                    #      instantiation_parameter)
-
-                    # Figure out what the implementation parameter is and record that
-                    implementation_parameter = None
-                    if type_element.original_name_override is not None:
-                        opening_bracket = type_element.original_name_override.index('<')
-                        closing_bracket = type_element.original_name_override.index('>')
-                        if (opening_bracket >= 0) and (closing_bracket > opening_bracket):
-                            implementation_parameter = \
-                                type_element.original_name_override[opening_bracket + 1:closing_bracket]
-
-                    implementation_instantiation_parameters.append(implementation_parameter)
-
-        # Reverse so that when we add these to the DOM (which in turn reverses the order), they end up in the original
-        # order they were seen
-        instantiation_parameters.reverse()
-        implementation_instantiation_parameters.reverse()
+        # Templates which may be referenced by (and thus need to be checked for in) instantiations of this one
+        unflattened_template_names = set(other.get_templated_object().name for other in remaining_templates)
+        unflattened_template_names.add(template_name)
 
         # Duplicate the template for each instantiation
+        # (instantiating one can add new instantiations if the template references itself, hence the loop here)
 
+        instantiations = instantiation_lists.get(template_name, [])
         instantiation_names = []
+        insertion_point = template
+
+        while len(instantiation_names) < len(instantiations):
+            template_instantiation = instantiations[len(instantiation_names)]
+            arguments = template_instantiation.arguments
+            implementation_arguments = template_instantiation.implementation_arguments
 
-        for (instantiation_parameter, implementation_instantiation_parameter) in \
-                zip(instantiation_parameters, implementation_instantiation_parameters):
             instantiation = templated_obj.clone()
             instantiation.parent = None
 
@@ -96,46 +237,64 @@ def apply(dom_root, custom_type_fudges={}):
             if instantiation.original_name_override is None:
                 instantiation.original_name_override = instantiation.get_fully_qualified_name()
 
-            # The implementation name should use the implementation version of the instantiation parameter if
+            # The implementation name should use the implementation version of the instantiation arguments if
             # possible, so we get "ImVector<ImGuiTextFilter::TextRange>" instead of
             # "ImVector<ImGuiTextFilter_TextRange>"
             instantiation.original_name_override += "<" + \
-                                                    (implementation_instantiation_parameter or
-                                                     instantiation_parameter) + ">"
+                                                    ", ".join(implementation_arguments or arguments) + ">"
+
+            # Record the parameter values so the implementation of the instantiation's functions can use them
+            instantiation.template_parameter_values = {}
+            for ((parameter_name, _), implementation_argument) in \
+                    zip(parameters, implementation_arguments or arguments):
+                instantiation.template_parameter_values[parameter_name] = implementation_argument
 
             # Generate a new name for the instantiation
-            instantiation.name += "_" + utils.sanitise_name_for_identifier(instantiation_parameter)
+            # (any spaces in the arguments are removed, so "unsigned char" gives "ImVector_unsignedchar")
+            for argument in arguments:
+                instantiation.name += "_" + utils.sanitise_name_for_identifier(argument.replace(" ", ""))
             instantiation_names.append(instantiation.name)
 
-            # Replace all occurrences of the type parameter with the instantiation parameter
+            # Replace all occurrences of the type parameters with the instantiation arguments
+
+            argument_values = {}
+            for ((parameter_name, _), argument) in zip(parameters, arguments):
+                argument_values[parameter_name] = argument
+
+            instantiation_types = instantiation.list_all_children_of_type(code_dom.DOMType)
 
-            for element in instantiation.list_all_children_of_type(code_dom.DOMType):
+            for element in instantiation_types:
 
                 modified_anything = False
 
                 for i in range(0, len(element.tokens)):
-                    if element.tokens[i].value == template_parameter_name:
-                        element.tokens[i].value = instantiation_parameter
+                    argument = argument_values.get(element.tokens[i].value)
+                    if argument is not None:
+                        element.prepare_for_modification()
+                        element.tokens[i].value = argument
                         modified_anything = True
 
                 if modified_anything:
                     # Do the same for any original name overrides, using the original override version of
-                    # the parameter
-                    if implementation_instantiation_parameter is not None:
-                        if element.original_name_override is None:
+                    # the arguments
+                    if element.original_name_override is None:
+                        if implementation_arguments is not None:
                             write_context = code_dom.WriteContext()
                             write_context.for_implementation = True
                             element.original_name_override = element.to_c_string(write_context)
-                            element.original_name_override = element.original_name_override \
-                                .replace(instantiation_parameter,
-                                         implementation_instantiation_parameter)
-                        else:
-                            # This is kinda dubious because parameter names can be things like T, which will then match
-                            # *any* T in the type, but for now I'm banking on that not happening as template types
-                            # aren't very complicated and have little aside from the odd "const", * or & on them.
-                            element.original_name_override = element.original_name_override \
-                                .replace(template_parameter_name,
-                                         implementation_instantiation_parameter)
+                            for (argument, implementation_argument) in zip(arguments, implementation_arguments):
+                                element.original_name_override = element.original_name_override \
+                                    .replace(argument, implementation_argument)
+                    else:
+                        # Only whole identifiers are replaced here, as parameter names are often things like T that
+                        # would otherwise match parts of other names (if there is no implementation version of the
+                        # arguments then the override still needs updating, so just use the normal ones)
+                        for ((parameter_name, _), implementation_argument) in \
+                                zip(parameters, implementation_arguments or arguments):
+                            element.original_name_override = \
+                                re.sub(r'\b' + re.escape(parameter_name) + r'\b',
+                                       lambda match: implementation_argument,
+                                       element.original_name_override)
 
                     # Apply any custom fudges
 
@@ -148,7 +307,7 @@ def apply(dom_root, custom_type_fudges={}):
                             # Figure out if any of our source type had reference->pointer conversions done on it
                             num_converted_references = 0
                             for tok in element.tokens:
-                                if hasattr(tok, "was_reference") and tok.was_reference:
+                                if tok.was_reference:
                                     num_converted_references += 1
 
                             # Supporting this wouldn't be horrifically difficult, but right now it's hard due to the
@@ -168,9 +327,17 @@ def apply(dom_root, custom_type_fudges={}):
                                 element.original_name_override = element.original_name_override \
                                     .replace(fudge_key, custom_type_fudges[fudge_key])
 
+            # The instantiation may reference other templates (or this one), which now need instantiating too
+            types_inside_member_templates = set()
+            for member_template in instantiation.list_all_children_of_type(code_dom.DOMTemplate):
+                types_inside_member_templates.update(member_template.list_all_children_of_type(code_dom.DOMType))
+            index_template_references([element for element in instantiation_types
+                                       if element not in types_inside_member_templates],
+                                      unflattened_template_names)
+
             # Create a comment to note where this came from
             comment = code_dom.DOMComment()
-            comment.comment_text = "// Instantiation of " + template_name + "<" + instantiation_parameter + ">"
+            comment.comment_text = "// Instantiation of " + template_name + "<" + ", ".join(arguments) + ">"
 
             # Optionally insert new struct instances into the DOM at the very end to avoid problems with referencing
             # things that aren't declared yet at the point the template appears
@@ -181,13 +348,14 @@ def apply(dom_root, custom_type_fudges={}):
 
                 declaration_comment = code_dom.DOMComment()
                 declaration_comment.comment_text = "// Forward declaration of " + template_name + \
-                                                   "<" + instantiation_parameter + ">"
+                                                   "<" + ", ".join(arguments) + ">"
 
                 declaration = instantiation.clone()
                 declaration.children.clear()
                 declaration.is_forward_declaration = True
 
-                template.parent.insert_after_child(template, [declaration_comment, declaration])
+                insertion_point.parent.insert_after_child(insertion_point, [declaration_comment, declaration])
+                insertion_point = declaration
 
                 # Add at end of file
                 dom_root.add_children([code_dom.DOMBlankLines(1),
@@ -195,31 +363,33 @@ def apply(dom_root, custom_type_fudges={}):
                                        code_dom.DOMBlankLines(1),
                                        instantiation])
             else:
-                # Insert new instance at point of template
-                template.parent.insert_after_child(template,
-                                                   [code_dom.DOMBlankLines(1),
-                                                    comment,
-                                                    code_dom.DOMBlankLines(1),
-                                                    instantiation])
+                # Insert new instance at point of template (after any previous instances)
+                insertion_point.parent.insert_after_child(insertion_point,
+                                                          [code_dom.DOMBlankLines(1),
+                                                           comment,
+                                                           code_dom.DOMBlankLines(1),
+                                                           instantiation])
+                insertion_point = instantiation
 
         # Remove the original template
         template.parent.remove_child(template)
 
         # Replace any references to the original template types with the new instantiations
-        for (instantiation_parameter, instantiation_name) in zip(instantiation_parameters, instantiation_names):
-            for type_element in dom_root.list_all_children_of_type(code_dom.DOMType):
-                element_instantiation_parameter, first_token, last_token = \
-                    extract_template_parameter(template_name, type_element.tokens)
-                if element_instantiation_parameter == instantiation_parameter:
+        for (template_instantiation, instantiation_name) in zip(instantiations, instantiation_names):
+            for type_element in template_instantiation.references:
+                for (_, arguments, first_token, last_token) in \
+                        find_template_references(type_element.tokens, (template_name,)):
+                    if complete_template_arguments(template, parameters, arguments) != \
+                            template_instantiation.arguments:
+                        continue
+
                     # Set the original (parameterised) name as the override so it gets used for the
                     # implementation code
                     write_context = code_dom.WriteContext()
                     write_context.use_original_names = True
                     type_element.original_name_override = type_element.to_c_string(write_context)
                     # ...then replace the main name with our instance name
-
-                    # -2 because first_token is the parameter, so we need to step back over the < and the template name
-                    first_token_of_reference = first_token - 2
-
-                    type_element.tokens[first_token_of_reference].value = instantiation_name
-                    del type_element.tokens[first_token_of_reference + 1:last_token + 1]  # +1 to eat the closing >
+                    type_element.prepare_for_modification()
+                    type_element.tokens[first_token].value = instantiation_name
+                    del type_element.tokens[first_token + 1:last_token + 1]  # +1 to eat the closing >
+                    break
@@ -1,10 +1,17 @@
 from src import code_dom
-from src import utils
+from src import modifier_visitor
 
 
 # This modifier adds a marker to structs that should be treated as pass-by-value, which subsequent modifiers
 # (and the code generator) can use
 def apply(dom_root, by_value_structs):
-    for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
+    modifier_visitor.apply_modifier(dom_root, register, by_value_structs)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor, by_value_structs):
+    def visit_struct(struct):
         if struct.name in by_value_structs:
             struct.is_by_value = True
+
+    visitor.add_callback(code_dom.DOMClassStructUnion, visit_struct)
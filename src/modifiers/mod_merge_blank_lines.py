@@ -5,27 +5,26 @@ from src import utils
 # This modifier finds anywhere that has ended up with adjacent blank line elements and merges them
 def apply(dom_root):
 
-    elements_to_consider = dom_root.list_all_children_of_type(code_dom.DOMBlankLines)
-
-    for element in elements_to_consider:
-        if element.parent is None:
-            continue  # Element has been removed
-
-        surrounding_lines = []
-
-        # Walk backwards from the element looking for more blank lines
-        walk_element = element.parent.get_prev_child(element)
-        while isinstance(walk_element, code_dom.DOMBlankLines):
-            surrounding_lines.append(walk_element)
-            walk_element = walk_element.parent.get_prev_child(walk_element)
-
-        # Walk forward from the element looking for more blank lines
-        walk_element = element.parent.get_next_child(element)
-        while isinstance(walk_element, code_dom.DOMBlankLines):
-            surrounding_lines.append(walk_element)
-            walk_element = walk_element.parent.get_next_child(walk_element)
-
-        # Merge lines into this one
-        for line in surrounding_lines:
-            line.parent.remove_child(line)
-            element.num_blank_lines += line.num_blank_lines
+    # Find the elements that contain blank lines (in document order)
+    parents = {}
+    for element in dom_root.list_all_children_of_type(code_dom.DOMBlankLines):
+        parents[element.parent] = True
+
+    for parent in parents:
+        lines_to_remove = []
+
+        # Merge each run of blank lines into the first line in it
+        for child_list in parent.get_writable_child_lists():
+            first_line = None
+            for element in child_list:
+                if not isinstance(element, code_dom.DOMBlankLines):
+                    first_line = None
+                elif first_line is None:
+                    first_line = element
+                else:
+                    first_line.num_blank_lines += element.num_blank_lines
+                    lines_to_remove.append(element)
+
+        # Remove the merged lines in one go, as removing them individually is slow for large structs
+        if len(lines_to_remove) > 0:
+            parent.remove_children(lines_to_remove)
@@ -1,18 +1,26 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes constexpr from everything in the DOM that has it
 def apply(dom_root):
+    modifier_visitor.apply_modifier(dom_root, register)
 
-    # First functions
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    # Functions
+    def visit_function(function):
         function.is_constexpr = False
 
-    # Then any constexpr tokens in types
-    for domType in dom_root.list_all_children_of_type(code_dom.DOMType):
-        if domType.is_constexpr():
+    # Any constexpr tokens in types
+    def visit_type(dom_type):
+        if dom_type.is_constexpr():
             new_tokens = []
-            for token in domType.tokens:
+            for token in dom_type.tokens:
                 if token.type != 'CONSTEXPR':
                     new_tokens.append(token)
-            domType.tokens = new_tokens
+            dom_type.tokens = new_tokens
+
+    visitor.add_callback(code_dom.DOMFunctionDeclaration, visit_function)
+    visitor.add_callback(code_dom.DOMType, visit_type)
@@ -1,11 +1,19 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes any function bodies. Inline functions are set to be IMGUI_API and the inline modifier removed.
 def apply(dom_root):
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_function(function):
         function.body = None
         if function.is_inline or function.is_static:
             function.is_inline = False
             function.is_static = False
             function.is_imgui_api = True
+
+    visitor.add_callback(code_dom.DOMFunctionDeclaration, visit_function)
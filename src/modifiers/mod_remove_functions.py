@@ -5,12 +5,18 @@ from src import utils
 # This modifier removes functions with the (fully-qualified) names specified
 # Optionally removal can be limited to only functions within a specified preprocessor conditional expression
 def apply(dom_root, function_names, preprocessor_conditional_expression=None):
+    # Index the functions by name, so that we can find the ones to remove without testing every function against every
+    # name
+    functions_by_name = {}
     for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
-        if function.get_fully_qualified_name(return_fqn_even_for_member_functions=True) in function_names:
+        function_name = function.get_fully_qualified_name(return_fqn_even_for_member_functions=True)
+        functions_by_name.setdefault(function_name, []).append(function)
+
+    for function_name in dict.fromkeys(function_names):  # (removing any duplicate names)
+        for function in functions_by_name.get(function_name, []):
             if preprocessor_conditional_expression is not None:
                 do_not_remove = True
-                for conditional in utils.get_preprocessor_conditionals(function):
-                    in_else = utils.is_in_else_clause(function, conditional)
+                for conditional, in_else in function.get_conditional_context().entries:
                     if (conditional.get_expression() == preprocessor_conditional_expression) and \
                             not (conditional.is_negated ^ in_else):
                         do_not_remove = False
@@ -1,11 +1,19 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes constructions and destructors that would result in heap allocations
 # (i.e. those not on value types)
 def apply(dom_root):
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_function(function):
         if function.is_constructor or function.is_destructor:
             parent_class = function.get_parent_class()
             if (parent_class is not None) and (not parent_class.is_by_value):
                 function.parent.remove_child(function)
+
+    visitor.add_callback(code_dom.DOMFunctionDeclaration, visit_function)
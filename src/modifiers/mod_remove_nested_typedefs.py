@@ -1,9 +1,17 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes any typedefs that are left inside classes/structs
 # (since C doesn't allow that, but fortunately we know none are relevant)
 def apply(dom_root):
-    for typedef in dom_root.list_all_children_of_type(code_dom.DOMTypedef):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_typedef(typedef):
         if typedef.get_parent_class() is not None:
             typedef.parent.remove_child(typedef)
+
+    visitor.add_callback(code_dom.DOMTypedef, visit_typedef)
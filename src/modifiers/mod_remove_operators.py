@@ -1,8 +1,16 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes any operator methods
 def apply(dom_root):
-    for function in dom_root.list_all_children_of_type(code_dom.DOMFunctionDeclaration):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_function(function):
         if function.is_operator:
             function.parent.remove_child(function)
+
+    visitor.add_callback(code_dom.DOMFunctionDeclaration, visit_function)
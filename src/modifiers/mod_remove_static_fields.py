@@ -1,10 +1,18 @@
 from src import code_dom
+from src import modifier_visitor
 
 
 # This modifier removes any static fields
 # (on the basis that C doesn't allow them and we'd need to add accessor functions, but right now there aren't any
 # static fields that are actually particularly useful to expose)
 def apply(dom_root):
-    for field in dom_root.list_all_children_of_type(code_dom.DOMFieldDeclaration):
+    modifier_visitor.apply_modifier(dom_root, register)
+
+
+# Register the callbacks for this modifier with a visitor (see modifier_visitor)
+def register(visitor):
+    def visit_field(field):
         if field.is_static:
             field.parent.remove_child(field)
+
+    visitor.add_callback(code_dom.DOMFieldDeclaration, visit_field)
@@ -3,8 +3,13 @@ from src import code_dom
 
 # This modifier removes structs/classes with the (fully-qualified) names specified
 def apply(dom_root, struct_names):
+    # Index the structs by name, so that we can find the ones to remove without testing every struct against every name
+    structs_by_name = {}
     for struct in dom_root.list_all_children_of_type(code_dom.DOMClassStructUnion):
-        if struct.get_fully_qualified_name() in struct_names:
+        structs_by_name.setdefault(struct.get_fully_qualified_name(), []).append(struct)
+
+    for struct_name in dict.fromkeys(struct_names):  # (removing any duplicate names)
+        for struct in structs_by_name.get(struct_name, []):
             if isinstance(struct.parent, code_dom.DOMTemplate):
                 # If the class is templated, remove the template too
                 template = struct.parent
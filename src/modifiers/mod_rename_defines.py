@@ -11,11 +11,13 @@ def apply(dom_root, name_map):
 
     # Rename in any #defines
     for define in dom_root.list_all_children_of_type(code_dom.DOMDefine):
-        for token in define.tokens:
+        for i in range(0, len(define.tokens)):
             did_anything = False
             for old_name in name_map:
-                if old_name in token.value:
-                    token.value = token.value.replace(old_name, name_map[old_name])
+                if old_name in define.tokens[i].value:
+                    # Note that this may replace the tokens with copies, so they need to be re-fetched afterwards
+                    define.prepare_for_modification()
+                    define.tokens[i].value = define.tokens[i].value.replace(old_name, name_map[old_name])
                     did_anything = True
 
             if did_anything:
@@ -27,9 +29,10 @@ def apply(dom_root, name_map):
     # Rename in any conditional expressions
     for conditional in dom_root.list_all_children_of_type(code_dom.DOMPreprocessorIf):
         did_anything = False
-        for token in conditional.expression_tokens:
-            if token.value in name_map:
-                token.value = name_map[token.value]
+        for i in range(0, len(conditional.expression_tokens)):
+            if conditional.expression_tokens[i].value in name_map:
+                conditional.prepare_for_modification()
+                conditional.expression_tokens[i].value = name_map[conditional.expression_tokens[i].value]
                 did_anything = True
 
         if did_anything:
@@ -9,11 +9,8 @@ def apply(dom_root):
     # so if there's a "#pragma once" then only wrap everything after it
 
     # Find any #pragma once
-    pragma_once = None
-    for pragma in dom_root.list_all_children_of_type(code_dom.DOMPragma):
-        if pragma.get_pragma_text() == "#pragma once":
-            pragma_once = pragma
-            break
+    pragma_once = next(dom_root.iter_descendants(code_dom.DOMPragma,
+                                                 lambda pragma: pragma.get_pragma_text() == "#pragma once"), None)
 
     # Generate our new elements
     elements_to_append = []
@@ -0,0 +1,157 @@
+from src import preprocessor_evaluator
+
+# This provides a canonical representation of the conditions preprocessor conditionals impose, so that they can be
+# compared for equivalence or mutual exclusivity
+# Conditions are represented as reduced ordered binary decision diagrams (BDDs). Every node is hash-consed, so two
+# conditions are equivalent exactly when they are the same node, and two are mutually exclusive exactly when their
+# conjunction is the false node.
+# The variables the BDDs are built from are the "atoms" of the expressions - defined(X) tests, comparisons, symbols
+# used as values and so on. Atoms are treated as independent of each other even though some are not (for example
+# "X > 1" implies "X > 0"), which means that the checks here are conservative - they may miss some cases of
+# equivalence or exclusivity, but never report ones that are not true.
+
+# Nodes are identified by integers, 0 and 1 being the constant false and true nodes
+false_node = 0
+true_node = 1
+
+nodes = [None, None]  # (variable index, low node, high node) for each node, indexed by node ID
+unique_nodes = {}  # Maps (variable index, low node, high node) to the ID of that node
+variables = {}  # Maps atoms to their variable index (in order of first use, which gives the BDD variable order)
+operation_cache = {}  # Results of previous operations, indexed by (operation, node, node)
+conditional_conditions = {}  # Maps (is_ifdef, is_negated, expression string) to the condition node for a conditional
+
+
+# Discard all nodes, variables and cached results, so that a new conversion starts from empty tables
+# Without this the tables grow with every header converted in a batch, and the variable order (and thus the node
+# numbering) depends on whatever was converted earlier
+# Any node IDs cached elsewhere (i.e. in DOMPreprocessorIf.condition_cache) are invalidated by this, so it should only
+# be called before parsing, when no DOM elements from a previous conversion are still in use
+def reset():
+    del nodes[2:]
+    unique_nodes.clear()
+    variables.clear()
+    operation_cache.clear()
+    conditional_conditions.clear()
+
+
+# Get the node with the variable and children given, creating it if necessary
+def make_node(variable, low, high):
+    if low == high:
+        return low  # The variable doesn't affect the outcome, so this node is redundant
+    key = (variable, low, high)
+    node = unique_nodes.get(key)
+    if node is None:
+        node = len(nodes)
+        nodes.append(key)
+        unique_nodes[key] = node
+    return node
+
+
+# Get the node that is true when the atom given is true
+def get_atom_node(atom):
+    variable = variables.get(atom)
+    if variable is None:
+        variable = len(variables)
+        variables[atom] = variable
+    return make_node(variable, false_node, true_node)
+
+
+# Get the negation of a condition
+def negate(node):
+    if node <= true_node:
+        return true_node - node
+    key = ('!', node, None)
+    result = operation_cache.get(key)
+    if result is None:
+        variable, low, high = nodes[node]
+        result = make_node(variable, negate(low), negate(high))
+        operation_cache[key] = result
+    return result
+
+
+# Combine two conditions with && or ||
+def combine(operation, node_a, node_b):
+    # Handle the cases where the result is trivially known
+    if operation == '&&':
+        if (node_a == false_node) or (node_b == false_node):
+            return false_node
+        if node_a == true_node:
+            return node_b
+        if (node_b == true_node) or (node_a == node_b):
+            return node_a
+    else:
+        if (node_a == true_node) or (node_b == true_node):
+            return true_node
+        if node_a == false_node:
+            return node_b
+        if (node_b == false_node) or (node_a == node_b):
+            return node_a
+
+    # Both operations are commutative, so order the arguments to improve the cache hit rate
+    if node_a > node_b:
+        node_a, node_b = node_b, node_a
+    key = (operation, node_a, node_b)
+    result = operation_cache.get(key)
+    if result is None:
+        variable_a, low_a, high_a = nodes[node_a]
+        variable_b, low_b, high_b = nodes[node_b]
+        if variable_a == variable_b:
+            result = make_node(variable_a, combine(operation, low_a, low_b), combine(operation, high_a, high_b))
+        elif variable_a < variable_b:
+            result = make_node(variable_a, combine(operation, low_a, node_b), combine(operation, high_a, node_b))
+        else:
+            result = make_node(variable_b, combine(operation, node_a, low_b), combine(operation, node_a, high_b))
+        operation_cache[key] = result
+    return result
+
+
+# Build the condition node for an expression tree (as produced by preprocessor_evaluator)
+def get_expression_node(expression):
+    node_type = expression[0]
+    if node_type == '!':
+        return negate(get_expression_node(expression[1]))
+    if (node_type == '&&') or (node_type == '||'):
+        return combine(node_type, get_expression_node(expression[1]), get_expression_node(expression[2]))
+    if node_type == 'defined':
+        return get_atom_node(expression)
+
+    # Anything else is an atom, unless it happens to be constant (e.g. "#if 0")
+    value = preprocessor_evaluator.evaluate_expression(expression, {})
+    if value is not None:
+        return true_node if value != 0 else false_node
+    return get_atom_node(expression)
+
+
+# Get the condition node for a DOMPreprocessorIf (i.e. the condition under which its primary children are compiled)
+# This is cached by DOMPreprocessorIf.get_condition(), which should generally be used instead
+def get_conditional_node(conditional):
+    key = (conditional.is_ifdef, conditional.is_negated, conditional.get_expression())
+    node = conditional_conditions.get(key)
+    if node is None:
+        expression = preprocessor_evaluator.get_condition_expression(conditional)
+        if expression is not None:
+            node = get_expression_node(expression)
+        else:
+            # If we can't parse the expression then treat the whole thing as an atom, so that at least identical
+            # expressions are recognised as such
+            node = get_atom_node(('expression', conditional.is_ifdef, conditional.get_expression()))
+            if conditional.is_negated:
+                node = negate(node)
+        conditional_conditions[key] = node
+    return node
+
+
+# Get the condition node for a ConditionalContext (i.e. the condition under which elements in it are compiled)
+def get_context_node(context):
+    node = true_node
+    for conditional, is_in_else_block in context.entries:
+        conditional_node = conditional.get_condition()
+        if is_in_else_block:
+            conditional_node = negate(conditional_node)
+        node = combine('&&', node, conditional_node)
+    return node
+
+
+# Returns true if elements in the two ConditionalContexts can never both be compiled
+def are_contexts_mutually_exclusive(context_a, context_b):
+    return combine('&&', get_context_node(context_a), get_context_node(context_b)) == false_node
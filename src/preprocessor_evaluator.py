@@ -0,0 +1,242 @@
+# This implements evaluation of preprocessor conditional expressions (as found in #if/#ifdef/#elif), given knowledge
+# of the state of some (but not necessarily all) of the preprocessor symbols involved
+# Evaluation is three-valued - any part of an expression that depends on a symbol we know nothing about (or uses a
+# construct we don't understand) evaluates to None, which then propagates upwards unless the result is determined
+# regardless (for example "0 && <unknown>" is always 0)
+
+# Expressions are parsed into trees of tuples, the first entry of which is the node type:
+# ('defined', name)              - defined(name)
+# ('symbol', name)               - A symbol used directly as a value
+# ('integer', value)             - An integer literal
+# ('!', operand)                 - Logical not
+# (operator, left, right)        - A binary operator (&&, ||, ==, !=, <, <=, > or >=)
+# ('call', name, arguments)      - A function-like macro invocation (such as __has_include()), which we can't
+#                                  evaluate - arguments is the text of the argument list
+
+# Binary operators we understand, by token type, along with their precedence (higher binds more tightly)
+binary_operators = {
+    'PPOR': ('||', 1),
+    'PPAND': ('&&', 2),
+    'PPEQUAL': ('==', 3),
+    'PPNOTEQUAL': ('!=', 3),
+    'PPLESS': ('<', 4),
+    'PPLESSEQUAL': ('<=', 4),
+    'PPGREATER': ('>', 4),
+    'PPGREATEREQUAL': ('>=', 4),
+}
+
+integer_literal_types = {'DECIMAL_LITERAL', 'HEX_LITERAL', 'OCTAL_LITERAL'}
+
+
+# Parse an integer literal (or #define value) as the preprocessor would, returning None if it isn't one
+def parse_integer(text):
+    text = text.strip().rstrip('uUlL')
+    negative = text.startswith('-')
+    if negative or text.startswith('+'):
+        text = text[1:]
+    try:
+        if text.startswith(('0x', '0X')):
+            value = int(text[2:], 16)
+        elif (len(text) > 1) and text.startswith('0'):
+            value = int(text[1:], 8)
+        else:
+            value = int(text)
+    except ValueError:
+        return None
+    return -value if negative else value
+
+
+# Parse a list of expression tokens into an expression tree, returning None if they do not form a valid expression
+def parse_expression(tokens):
+    parser = ExpressionParser(tokens)
+    expression = parser.parse_binary(0)
+    if (expression is None) or (parser.index != len(tokens)):
+        return None
+    return expression
+
+
+# Get the expression tree for the condition of a DOMPreprocessorIf (taking into account #ifdef/#ifndef), or None if
+# it could not be parsed
+def get_condition_expression(conditional):
+    if conditional.is_ifdef:
+        if len(conditional.expression_tokens) != 1:
+            return None
+        expression = ('defined', conditional.expression_tokens[0].value)
+    else:
+        expression = parse_expression(conditional.expression_tokens)
+        if expression is None:
+            return None
+    if conditional.is_negated:
+        expression = ('!', expression)
+    return expression
+
+
+# A simple recursive-descent parser for preprocessor expressions
+class ExpressionParser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.index = 0  # Index of the next token to consume
+
+    # Get the type of the next token, or None if there are no more
+    def peek_type(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index].type
+        return None
+
+    # Parse a sequence of binary operators with at least the precedence given
+    def parse_binary(self, min_precedence):
+        left = self.parse_unary()
+        while left is not None:
+            operator = binary_operators.get(self.peek_type())
+            if (operator is None) or (operator[1] < min_precedence):
+                break
+            self.index += 1
+            right = self.parse_binary(operator[1] + 1)
+            if right is None:
+                return None
+            left = (operator[0], left, right)
+        return left
+
+    # Parse a unary expression (a term optionally preceded by any number of !s)
+    def parse_unary(self):
+        token_type = self.peek_type()
+        if token_type == 'PPNOT':
+            self.index += 1
+            operand = self.parse_unary()
+            if operand is None:
+                return None
+            return '!', operand
+
+        if token_type == 'PPLPAREN':
+            self.index += 1
+            expression = self.parse_binary(0)
+            if (expression is None) or (self.peek_type() != 'PPRPAREN'):
+                return None
+            self.index += 1
+            return expression
+
+        if token_type == 'PPDEFINED':
+            self.index += 1
+            has_parentheses = self.peek_type() == 'PPLPAREN'
+            if has_parentheses:
+                self.index += 1
+            if self.peek_type() != 'PPTHING':
+                return None
+            name = self.tokens[self.index].value
+            self.index += 1
+            if has_parentheses:
+                if self.peek_type() != 'PPRPAREN':
+                    return None
+                self.index += 1
+            return 'defined', name
+
+        if token_type == 'PPTHING':
+            name = self.tokens[self.index].value
+            self.index += 1
+            if self.peek_type() == 'PPLPAREN':
+                # A function-like macro invocation (e.g. __has_include()) - skip over the arguments
+                first_argument_index = self.index + 1
+                depth = 0
+                while self.index < len(self.tokens):
+                    token_type = self.tokens[self.index].type
+                    self.index += 1
+                    if token_type == 'PPLPAREN':
+                        depth += 1
+                    elif token_type == 'PPRPAREN':
+                        depth -= 1
+                        if depth == 0:
+                            arguments = " ".join(token.value for token in
+                                                 self.tokens[first_argument_index:self.index - 1])
+                            return 'call', name, arguments
+                return None
+            return 'symbol', name
+
+        if token_type in integer_literal_types:
+            value = parse_integer(self.tokens[self.index].value)
+            if value is None:
+                return None
+            self.index += 1
+            return 'integer', value
+
+        return None
+
+
+# Evaluate an expression tree, given a dictionary mapping the names of symbols with a known state to their value (as
+# a string, as it would appear in a #define) or None if the symbol is known to be undefined
+# Returns the (integer) value of the expression, or None if it cannot be determined
+def evaluate_expression(expression, symbols):
+    node_type = expression[0]
+
+    if node_type == 'defined':
+        if expression[1] not in symbols:
+            return None
+        return 0 if symbols[expression[1]] is None else 1
+
+    if node_type == 'symbol':
+        if expression[1] not in symbols:
+            return None
+        value = symbols[expression[1]]
+        if value is None:
+            return 0  # Undefined symbols evaluate to zero
+        return parse_integer(value)
+
+    if node_type == 'integer':
+        return expression[1]
+
+    if node_type == '!':
+        value = evaluate_expression(expression[1], symbols)
+        if value is None:
+            return None
+        return 0 if value else 1
+
+    if node_type == '&&':
+        left = evaluate_expression(expression[1], symbols)
+        if left == 0:
+            return 0
+        right = evaluate_expression(expression[2], symbols)
+        if right == 0:
+            return 0
+        if (left is None) or (right is None):
+            return None
+        return 1
+
+    if node_type == '||':
+        left = evaluate_expression(expression[1], symbols)
+        if (left is not None) and (left != 0):
+            return 1
+        right = evaluate_expression(expression[2], symbols)
+        if (right is not None) and (right != 0):
+            return 1
+        if (left is None) or (right is None):
+            return None
+        return 0
+
+    if node_type in comparison_operators:
+        left = evaluate_expression(expression[1], symbols)
+        right = evaluate_expression(expression[2], symbols)
+        if (left is None) or (right is None):
+            return None
+        return 1 if comparison_operators[node_type](left, right) else 0
+
+    return None
+
+
+comparison_operators = {
+    '==': lambda left, right: left == right,
+    '!=': lambda left, right: left != right,
+    '<': lambda left, right: left < right,
+    '<=': lambda left, right: left <= right,
+    '>': lambda left, right: left > right,
+    '>=': lambda left, right: left >= right,
+}
+
+
+# Evaluate the condition of a DOMPreprocessorIf, returning True or False if the outcome is known, or None if not
+def evaluate_condition(conditional, symbols):
+    expression = get_condition_expression(conditional)
+    if expression is None:
+        return None
+    value = evaluate_expression(expression, symbols)
+    if value is None:
+        return None
+    return value != 0
@@ -1,50 +1,73 @@
 # This encapsulates a stream of lexed tokens in a manner that allows tokens to be returned to the stream if unparsed
+# The entire input is lexed up-front into a list, so the stream position (and thus any checkpoint) is simply an index
+# into that list, and rewinding is just a case of resetting the index
 class TokenStream:
-    def __init__(self, lexer):
-        self.lexer = lexer
-        self.token_history = []
-        self.buffered_tokens = []
-        self.current_token_index = 0
-        self.max_history_length = 1024  # Maximum number of tokens that can be rewound
+    def __init__(self, tokens):
+        self.tokens = tokens  # All tokens in the stream
+        self.current_token_index = 0  # Index of the next token to be returned
+        self.parse_memo = {}  # Memoised parse results as (result, end index), indexed by (start index, parser key)
+        self.parse_memo_hits = 0  # Number of parses satisfied from parse_memo
+        self.parse_memo_misses = 0  # Number of parses that had to be performed
 
-    # Fetch the next token in the stream, returns None if the stream is finished
-    # Optionally skips newline/whitespace tokens
-    def get_token(self, skip_newlines=True, skip_whitespace=True):
-        if len(self.buffered_tokens) > 0:
-            token = self.buffered_tokens.pop()
-        else:
-            token = self.lexer.token()
+        # For each combination of skip flags, an array giving the index of the first token at or after each position
+        # that should not be skipped (or len(self.tokens) if there is none), indexed by (skip_newlines, skip_whitespace)
+        # The (False, False) case needs no table as no tokens are skipped
+        self.next_significant_token_index = {
+            (True, True): self.__build_next_significant_token_index(True, True),
+            (True, False): self.__build_next_significant_token_index(True, False),
+            (False, True): self.__build_next_significant_token_index(False, True),
+        }
 
-        if token is not None:
-            self.token_history.append(token)
-            while len(self.token_history) > self.max_history_length:
-                self.token_history.pop(0)
-            self.current_token_index += 1
+    # Build a table mapping each stream position to the index of the next token that would not be skipped with the
+    # given skip flags
+    def __build_next_significant_token_index(self, skip_newlines, skip_whitespace):
+        num_tokens = len(self.tokens)
+        result = [num_tokens] * (num_tokens + 1)
+        next_index = num_tokens
+        for index in range(num_tokens - 1, -1, -1):
+            token_type = self.tokens[index].type
+            if not ((skip_newlines and (token_type == 'NEWLINE')) or
+                    (skip_whitespace and (token_type == 'WHITESPACE'))):
+                next_index = index
+            result[index] = next_index
+        return result
 
-            if (skip_newlines and (token.type == 'NEWLINE')) or (skip_whitespace and (token.type == 'WHITESPACE')):
-                return self.get_token(skip_newlines, skip_whitespace)
+    # Get the index of the next token that would be returned by get_token() with the given skip flags
+    def __get_next_token_index(self, skip_newlines, skip_whitespace):
+        if skip_newlines or skip_whitespace:
+            return self.next_significant_token_index[(skip_newlines, skip_whitespace)][self.current_token_index]
+        return self.current_token_index
 
-        return token
+    # Fetch the next token in the stream, returns None if the stream is finished
+    # Optionally skips newline/whitespace tokens
+    def get_token(self, skip_newlines=True, skip_whitespace=True):
+        index = self.__get_next_token_index(skip_newlines, skip_whitespace)
+        if index >= len(self.tokens):
+            self.current_token_index = len(self.tokens)
+            return None
+        self.current_token_index = index + 1
+        return self.tokens[index]
 
     # Fetch the next token without removing it from the stream
     # Optionally skips newline/whitespace tokens (in which case it will scan forward to the next suitable token
     # and peek that)
     def peek_token(self, skip_newlines=True, skip_whitespace=True):
-        checkpoint = self.get_checkpoint()
-        token = self.get_token(skip_newlines, skip_whitespace)
-        self.rewind(checkpoint)
-        return token
+        index = self.__get_next_token_index(skip_newlines, skip_whitespace)
+        if index >= len(self.tokens):
+            return None
+        return self.tokens[index]
 
     # Fetch the next token in the stream, failing (returning None) if it is not of one of the types specified
     # Optionally skips newline/whitespace tokens
     def get_token_of_type(self, acceptable_types, skip_newlines=True, skip_whitespace=True):
-        checkpoint = self.get_checkpoint()
-        token = self.get_token(skip_newlines, skip_whitespace)
-        if token is None:
+        index = self.__get_next_token_index(skip_newlines, skip_whitespace)
+        if index >= len(self.tokens):
+            self.current_token_index = len(self.tokens)
             return None
+        token = self.tokens[index]
         if token.type not in acceptable_types:
-            self.rewind(checkpoint)
             return None
+        self.current_token_index = index + 1
         return token
 
     # Fetch the next token in the stream without removing it from the stream, failing (returning None)
@@ -61,14 +84,31 @@ class TokenStream:
     # Rewind the stream by one token
     # If skip_newlines is true, will rewind by one /non-newline/ token (and the same for skip_whitespace)
     def rewind_one_token(self, skip_newlines=True, skip_whitespace=True):
-        if len(self.token_history) < 1:
-            raise Exception("Cannot rewind as no tokens in history! (rewound more than max_history_length?)")
+        index = self.current_token_index
+        while True:
+            if index < 1:
+                raise Exception("Cannot rewind as no tokens in history!")
+            index -= 1
+            token_type = self.tokens[index].type
+            if not ((skip_newlines and (token_type == 'NEWLINE')) or
+                    (skip_whitespace and (token_type == 'WHITESPACE'))):
+                break
+        self.current_token_index = index
 
-        token = self.token_history.pop()
-        self.buffered_tokens.append(token)
-        self.current_token_index -= 1
-        if (skip_newlines and (token.type == 'NEWLINE')) or (skip_whitespace and (token.type == 'WHITESPACE')):
-            self.rewind_one_token(skip_newlines, skip_whitespace)
+    # Run parse_func at the current position, or if the parser identified by parser_key has previously been run at this
+    # position, return the result it gave then and move to the position it finished at
+    # (this relies on failed parses leaving the stream where they started, as all the parsers do)
+    def memoize_parse(self, parser_key, parse_func):
+        memo_key = (self.current_token_index, parser_key)
+        entry = self.parse_memo.get(memo_key)
+        if entry is not None:
+            self.parse_memo_hits += 1
+            self.current_token_index = entry[1]
+            return entry[0]
+        self.parse_memo_misses += 1
+        result = parse_func()
+        self.parse_memo[memo_key] = (result, self.current_token_index)
+        return result
 
     # Get a checkpoint in the stream that can later be returned to
     def get_checkpoint(self):
@@ -78,7 +118,4 @@ class TokenStream:
     def rewind(self, checkpoint):
         if self.current_token_index < checkpoint:
             raise Exception("Cannot rewind to a point further in the stream")
-        while self.current_token_index > checkpoint:
-            self.rewind_one_token(skip_newlines=False, skip_whitespace=False)
-        if self.current_token_index != checkpoint:
-            raise Exception("Rewind to checkpoint failed")
+        self.current_token_index = checkpoint
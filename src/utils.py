@@ -1,18 +1,13 @@
 from src import code_dom
-import ply.lex as lex
 from src import c_lexer
+from src import preprocessor_conditions
 
 
-# Create a new LexToken with the text given
+# Create a new token with the text given
 def create_token(text):
-    token = lex.LexToken()
     # Technically we don't care about token types any more since we're done parsing, so we set a non-existent token type
     # to make it clear where this came from
-    token.type = 'SYNTHETIC'
-    token.value = text
-    token.lineno = 0
-    token.lexpos = 0
-    return token
+    return c_lexer.Token('SYNTHETIC', text)
 
 
 # Create a type from a string
@@ -70,49 +65,37 @@ def create_code_block(text):
     return element
 
 
+# Get the conditional context (see code_dom.ConditionalContext) for the #if/#ifdef/etc blocks an element is contained
+# in - if the element is itself a conditional then it is included as the innermost entry
+def get_preprocessor_conditional_context(element):
+    context = element.get_conditional_context()
+    if isinstance(element, code_dom.DOMPreprocessorIf):
+        context = context.extend(element, False)
+    return context
+
+
 # Get all #if/#ifdef/etc blocks an element is contained in as a list in order from the outermost
+# (if the element is itself a conditional then it is included as the innermost entry)
 def get_preprocessor_conditionals(element):
-    result = []
-    while element is not None:
-        if isinstance(element, code_dom.DOMPreprocessorIf):
-            result.append(element)
-        element = element.parent
-    result.reverse()
-    return result
+    return get_preprocessor_conditional_context(element).get_conditionals()
 
 
 # Returns true if the passed element is part of the else (i.e. negated) block of the conditional given
 def is_in_else_clause(element, conditional_element):
-    while element is not None:
-        if element.parent == conditional_element:
-            return conditional_element.is_element_in_else_block(element)
-        element = element.parent
-    return False
+    return element.get_conditional_context().is_in_else_block_of(conditional_element)
 
 
 # Check if two elements are mutually exclusive, in the sense that #ifdefs mean that they can never both
-# be active at the same time. This check isn't exhaustive, and can be confused by non-trivial #ifdef constructs,
-# but it's good enough for our purposes. It's conservative in that it may miss cases that are actually mutually
-# exclusive and return False, but it should never return True for elements that can in fact both get compiled
-# simultaneously.
+# be active at the same time. This is conservative in that it may miss cases that are actually mutually exclusive
+# (see preprocessor_conditions for details) and return False, but it should never return True for elements that can
+# in fact both get compiled simultaneously.
 def are_elements_mutually_exclusive(element_a, element_b):
-    conditionals_a = get_preprocessor_conditionals(element_a)
-    conditionals_b = get_preprocessor_conditionals(element_b)
-
-    for conditional_a in conditionals_a:
-        conditional_a_negated = is_in_else_clause(element_a, conditional_a)
-        for conditional_b in conditionals_b:
-            conditional_b_negated = is_in_else_clause(element_b, conditional_b)
-            if conditional_a_negated == conditional_b_negated:
-                # If both elements are in the same block (normal/else) then check if the conditions are exclusive
-                if conditional_a.condition_is_mutually_exclusive(conditional_b):
-                    return True
-            else:
-                # If one element is in an else block and the other isn't, check if the conditions match
-                if conditional_a.condition_matches(conditional_b):
-                    return True
+    context_a = get_preprocessor_conditional_context(element_a)
+    context_b = get_preprocessor_conditional_context(element_b)
+    if context_a is context_b:
+        return False  # Both are subject to exactly the same conditions
 
-    return False
+    return preprocessor_conditions.are_contexts_mutually_exclusive(context_a, context_b)
 
 
 # Turn a name into something suitable to use in a C identifier
@@ -134,6 +117,7 @@ def append_comment_text(element, message):
         comment.is_attached_comment = True
         comment.parent = element
         element.attached_comment = comment
+        element.notify_children_changed([comment])
 
 
 # Migrate comments from one element to another - useful when replacing an element with another one
@@ -154,3 +138,5 @@ def migrate_comments(from_element, to_element):
         to_element.attached_comment = from_element.attached_comment
         to_element.attached_comment.parent = to_element
         from_element.attached_comment = None
+        from_element.notify_children_changed([to_element.attached_comment])
+        to_element.notify_children_changed([to_element.attached_comment])